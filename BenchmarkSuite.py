@@ -0,0 +1,272 @@
+"""
+Benchmark suite for the hot paths of both models, the yardstick for any engine work.
+Every case is timed for every lattice size and lattice dtype:
+    GoL:  update_step, compute_com (on a glider away from the edges), count_live,
+          one generation of the parallel strip engine (uint8 only, all cores, and on
+          1, 2, 4 and 8 threads as gol_parallel_step_<n>),
+          one buffered generation of a compiled rule (B36/S23, lookup table; uint8 only)
+    SIRS: update_step (one attempt), sweep (N^2 attempts), the same sweep as N^2 calls of
+          update_step (the original driver loop, so sirs_sweep has its baseline at the
+          same sites per call; slow, ~10 us per attempt, so N <= 512 only), count_states,
+          resampling (jackknife of a 1100 sweep series), random_init_immune_generator
+
+Timing follows timeit: the number of calls per measurement is doubled until a measurement
+takes at least MIN_TIME, then the measurement is repeated (fewer times for slow cases, at
+least once) and the best time per call is kept as the figure of merit. Results go to a
+JSON file with the machine metadata; compare flags the cases that are slower than a
+stored baseline by more than a tolerance.
+
+    % python BenchmarkSuite.py run baseline.json
+    % python BenchmarkSuite.py run current.json 50,256 gol_update_step,sirs_sweep
+    % python BenchmarkSuite.py compare baseline.json current.json 0.1
+
+author: s2229553
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from functools import partial
+import numpy as np
+import RandomStreams as streams
+import GameOfLife_functions as gol
+import GameOfLife_parallel as gol_parallel
+import GameOfLife_rules as gol_rules
+import SIRS_functions as sirs
+
+SIZES = (50, 256, 1024, 4096)
+GOL_DTYPES = ('uint8', 'int8', 'int16', 'int32', 'int64')
+SIRS_DTYPES = ('int8', 'int16', 'int32', 'int64') # states are -1..2, so signed only
+SERIES_DTYPES = ('int64', 'float64') # infected count series
+
+MIN_TIME = 0.2 # seconds per measurement
+REPEATS = 5
+BUDGET = 5. # seconds per case; slow cases are repeated fewer times
+TOLERANCE = 0.1 # slowdown flagged as a regression
+PARALLEL_WORKERS = (1, 2, 4, 8) # thread counts of the gol_parallel_step_<n> cases
+
+############### CASES ################
+
+# each case builds, for a size, dtype and generator, the callable to time and the
+# number of sites (or attempts) one call processes
+
+def case_gol_update_step(N, dtype, generator):
+    lattice = gol.state_random(N, generator).astype(dtype)
+    return lambda: gol.update_step(lattice), N*N
+
+def case_gol_compute_com(N, dtype, generator):
+    lattice = gol.state_glider(N).astype(dtype)
+    return lambda: gol.compute_com(lattice), N*N
+
+def case_gol_count_live(N, dtype, generator):
+    lattice = gol.state_random(N, generator).astype(dtype)
+    return lambda: gol.count_live(lattice), N*N
+
+def case_gol_parallel_step(N, dtype, generator, n_workers=None):
+    system = gol_parallel.ParallelLife(gol.state_random(N, generator).astype(dtype), n_workers)
+    return lambda: system.evolve(1), N*N
+
+def case_gol_rule_step(N, dtype, generator):
+    rule = gol_rules.Rule('B36/S23')
+    padded = [np.zeros((N+2, N+2), dtype=dtype) for _ in range(2)]
+    padded[0][1:-1, 1:-1] = gol.state_random(N, generator)
+    scratch = rule.buffers(N)
+    def step():
+        rule.update_step_buffered(padded[0], padded[1], *scratch)
+        padded.reverse()
+    return step, N*N
+
+def case_sirs_update_step(N, dtype, generator):
+    lattice = sirs.random_lattice(N, generator).astype(dtype)
+    site = generator.integers(N, size=2).tolist()
+    return lambda: sirs.update_step(lattice, site, 0.5, 0.5, 0.5, generator), 1
+
+def case_sirs_sweep(N, dtype, generator):
+    lattice = sirs.random_lattice(N, generator).astype(dtype)
+    # the dynamic equilibrium preset of SIRS_Lattice: the lattice stays active (I ~ 0.4)
+    # however many calls mutate it, so later repeats do not time an absorbed lattice
+    return lambda: sirs.sweep(lattice, 1, 0.8, 0.4, 0.5, generator), N*N
+
+def case_sirs_update_step_sweep(N, dtype, generator):
+    lattice = sirs.random_lattice(N, generator).astype(dtype)
+    # one sweep as the original drivers ran it: N^2 update_step calls at random sites,
+    # accepted flips written back, then the infected count (as sweep returns).
+    # ~10 us per attempt, so one call at N = 4096 takes minutes: capped at N <= 512
+    # (see MAX_SIZES), where a call takes a few seconds
+    def sweep():
+        for site in generator.integers(N, size=(N*N, 2)).tolist():
+            accepted, (i, j), state = sirs.update_step(lattice, site, 0.8, 0.4, 0.5, generator)
+            if accepted:
+                lattice[i, j] = state
+        return np.sum(lattice == -1)
+    return sweep, N*N
+
+def case_sirs_count_states(N, dtype, generator):
+    lattice = sirs.random_lattice(N, generator).astype(dtype)
+    return lambda: sirs.count_states(lattice), N*N
+
+def case_sirs_resampling(N, dtype, generator):
+    # N only sets the scale of the counts, the cost is that of the series length
+    data_I = generator.binomial(N*N, 0.3, size=1100).astype(dtype)
+    return lambda: sirs.resampling(data_I, N), len(data_I)
+
+def case_sirs_immune(N, dtype, generator):
+    lattice = sirs.random_lattice(N, generator).astype(dtype)
+    return lambda: sirs.random_init_immune_generator(lattice, 0.5, generator), N*N
+
+# largest N timed for the slow cases; larger sizes are skipped
+MAX_SIZES = {"sirs_update_step_sweep": 512}
+
+CASES = {
+    "gol_update_step": (case_gol_update_step, GOL_DTYPES),
+    "gol_compute_com": (case_gol_compute_com, GOL_DTYPES),
+    "gol_count_live": (case_gol_count_live, GOL_DTYPES),
+    "gol_parallel_step": (case_gol_parallel_step, ('uint8',)),
+    # thread count against time, whatever the number of cores (the machine metadata has it)
+    **{f"gol_parallel_step_{n}": (partial(case_gol_parallel_step, n_workers=n), ('uint8',)) for n in PARALLEL_WORKERS},
+    "gol_rule_step": (case_gol_rule_step, ('uint8',)),
+    "sirs_update_step": (case_sirs_update_step, SIRS_DTYPES),
+    "sirs_sweep": (case_sirs_sweep, SIRS_DTYPES),
+    "sirs_update_step_sweep": (case_sirs_update_step_sweep, SIRS_DTYPES),
+    "sirs_count_states": (case_sirs_count_states, SIRS_DTYPES),
+    "sirs_resampling": (case_sirs_resampling, SERIES_DTYPES),
+    "sirs_random_init_immune": (case_sirs_immune, SIRS_DTYPES),
+}
+
+############### TIMING ################
+
+def measure(function, number):
+    'Seconds for number calls'
+    start = time.perf_counter()
+    for _ in range(number):
+        function()
+    return time.perf_counter() - start
+
+def time_function(function, min_time=MIN_TIME, repeats=REPEATS, budget=BUDGET):
+    '''
+    Seconds per call: number of calls per measurement doubled until one takes min_time,
+    then repeated within the budget. Returns (times per call, number)
+    '''
+    number = 1
+    elapsed = measure(function, number)
+    while elapsed < min_time:
+        number *= 2
+        elapsed = measure(function, number)
+
+    repeats = max(0, min(repeats - 1, int(budget/elapsed) - 1))
+    times = [elapsed] + [measure(function, number) for _ in range(repeats)]
+    return [t/number for t in times], number
+
+def machine_info():
+    'Metadata of the machine and tree a benchmark ran on'
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.realpath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"platform": platform.platform(), "machine": platform.machine(), "processor": platform.processor(),
+            "node": platform.node(), "cpu_count": os.cpu_count(), "python": platform.python_version(),
+            "implementation": platform.python_implementation(), "numpy": np.__version__,
+            "commit": commit, "time": time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+def run(sizes=SIZES, cases=None, seed=None):
+    'Time every case for every size and dtype; returns the results document'
+    cases = list(CASES) if cases is None else cases
+    for name in cases:
+        if name not in CASES:
+            raise ValueError(f'Unknown case {name}, choose from {tuple(CASES)}')
+    root = streams.root_sequence(seed)
+
+    results = []
+    print(f'{"case":>24} {"N":>6} {"dtype":>8} {"best [s/call]":>14} {"[ns/site]":>10} {"calls":>7}')
+    for name in cases:
+        setup, dtypes = CASES[name]
+        for N in sizes:
+            if N > MAX_SIZES.get(name, N):
+                print(f'{name:>24} {N:>6} skipped (N > {MAX_SIZES[name]})')
+                continue
+            for dtype in dtypes:
+                function, sites = setup(N, dtype, streams.generator(root))
+                times, number = time_function(function)
+                best = min(times)
+                results.append({"case": name, "N": N, "dtype": dtype, "best": best, "median": float(np.median(times)),
+                                "times": times, "number": number, "sites": sites})
+                print(f'{name:>24} {N:>6} {dtype:>8} {best:>14.3e} {best/sites*1e9:>10.2f} {number:>7}')
+
+    return {"format": "benchmark", "version": 1, "machine": machine_info(),
+            "seed": str(root.entropy), "results": results}
+
+############### FILES AND COMPARISON ################
+
+def save(document, path):
+    'Write the results atomically'
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(document, f, indent=1)
+    os.replace(tmp_path, path)
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(baseline, current, tolerance=TOLERANCE):
+    '''
+    Ratio of best times (current/baseline) for every case, size and dtype in both;
+    returns the list of comparisons and the regressions (ratio > 1 + tolerance)
+    '''
+    reference = {(r["case"], r["N"], r["dtype"]): r["best"] for r in baseline["results"]}
+    comparisons = []
+    for r in current["results"]:
+        key = (r["case"], r["N"], r["dtype"])
+        if key in reference:
+            ratio = r["best"]/reference[key]
+            comparisons.append({"case": r["case"], "N": r["N"], "dtype": r["dtype"], "baseline": reference[key],
+                                "current": r["best"], "ratio": ratio, "regression": ratio > 1 + tolerance})
+    regressions = [c for c in comparisons if c["regression"]]
+    return comparisons, regressions
+
+def print_comparison(baseline, current, comparisons, regressions, tolerance):
+    for key in ["node", "processor", "python", "numpy"]:
+        if baseline["machine"].get(key) != current["machine"].get(key):
+            print(f'Warning: {key} differs ({baseline["machine"].get(key)} vs {current["machine"].get(key)}), timings may not be comparable')
+
+    print(f'{"case":>24} {"N":>6} {"dtype":>8} {"baseline":>11} {"current":>11} {"ratio":>6}')
+    for c in comparisons:
+        flag = '  REGRESSION' if c["regression"] else ''
+        print(f'{c["case"]:>24} {c["N"]:>6} {c["dtype"]:>8} {c["baseline"]:>11.3e} {c["current"]:>11.3e} {c["ratio"]:>6.2f}{flag}')
+    print(f'{len(regressions)} of {len(comparisons)} timings slower than the baseline by more than {tolerance:.0%}')
+
+def main():
+    # Read inputs from command lines
+    if len(sys.argv) < 3 or sys.argv[1] not in ('run', 'compare') or (sys.argv[1] == 'compare' and len(sys.argv) < 4):
+        print("You left out the mode or the name of the files when running.")
+        print("In command line, run like this instead:")
+        print(f"% python {sys.argv[0]} run <output json> [<N>,<N>,...] [<case>,<case>,...]")
+        print(f"% python {sys.argv[0]} compare <baseline json> <current json> [<tolerance>]")
+        print("For example:")
+        print("% nohup python BenchmarkSuite.py run baseline.json > benchmark.txt &")
+        print("% python BenchmarkSuite.py compare baseline.json current.json 0.1")
+        print(f"Cases: {', '.join(CASES)}")
+        sys.exit(1)
+
+    if sys.argv[1] == 'run':
+        outfile = str(sys.argv[2])
+        sizes = [int(N) for N in sys.argv[3].split(',')] if len(sys.argv) >= 4 else SIZES
+        cases = sys.argv[4].split(',') if len(sys.argv) >= 5 else None
+
+        document = run(sizes, cases)
+        save(document, outfile)
+        print(f'Check {outfile} for the timings.')
+    else:
+        baseline, current = load(sys.argv[2]), load(sys.argv[3])
+        tolerance = float(sys.argv[4]) if len(sys.argv) >= 5 else TOLERANCE
+
+        comparisons, regressions = compare(baseline, current, tolerance)
+        print_comparison(baseline, current, comparisons, regressions, tolerance)
+        sys.exit(1 if regressions else 0) # non zero exit for scripts and CI
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Chunked on-disk output for the simulation drivers.
+A run is a directory holding one or more memory-mapped .npy files per column and a small
+JSON manifest. Rows are written straight into the memory maps as they are produced, so a
+driver never holds more than the rows it is currently producing, and the manifest is
+rewritten after every flush so a crashed run can still be read up to its last flush.
+A directory that already holds a run is refused (mode='x'), or explicitly emptied first
+(mode='w', for drivers that rebuild every row, e.g. from their checkpoints); old chunk
+files are never reopened.
+
+Reading memory-maps only the columns asked for:
+
+    import ChunkedOutput
+    data = ChunkedOutput.load_results('measurements')   # dict of memory-mapped columns
+    eq_steps = data['Equilibrium_Steps']
+
+load_results also reads the old end-of-run pickled dict .npy files, so the included
+datafiles keep working.
+
+author: s2229553
+"""
+
+import os
+import json
+import numpy as np
+
+MANIFEST = 'manifest.json'
+
+class ChunkedOutput():
+    '''
+    Writer for a chunked output directory
+    '''
+
+    def __init__(self, path, attrs=None, mode='x'):
+        if mode not in ('x', 'w'):
+            raise ValueError(f"Unknown mode {mode}, choose 'x' (new directory) or 'w' (overwrite)")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, MANIFEST)):
+            if mode == 'x':
+                raise FileExistsError(f"{path} already holds a run, choose another output directory (or mode='w' to overwrite it)")
+            remove_run(path)
+        self.columns = {}
+        self.open_chunks = {}
+        self.created = set() # chunk files of this run, the only ones reopened
+        self.attrs = {} if attrs is None else dict(attrs)
+        self.write_manifest()
+
+    def add_column(self, name, row_shape=(), dtype=float, chunk_rows=1024):
+        'Declare a column whose rows have shape row_shape; files hold chunk_rows rows each'
+        self.columns[name] = {"dtype": np.dtype(dtype).str,
+                              "row_shape": list(row_shape),
+                              "chunk_rows": int(chunk_rows),
+                              "chunks": [],
+                              "rows": 0}
+        self.write_manifest()
+
+    def chunk(self, name, index):
+        'Memory map of chunk number index of a column, created when first needed'
+        column = self.columns[name]
+        while len(column["chunks"]) <= index:
+            file_name = f'{name}.{len(column["chunks"]):04d}.npy'
+            column["chunks"].append({"file": file_name, "rows": 0})
+
+        key = (name, index)
+        if key not in self.open_chunks:
+            file_path = os.path.join(self.path, column["chunks"][index]["file"])
+            shape = (column["chunk_rows"],) + tuple(column["row_shape"])
+            mode = 'r+' if file_path in self.created else 'w+'
+            self.created.add(file_path)
+            self.open_chunks[key] = np.lib.format.open_memmap(file_path, mode=mode,
+                                                              dtype=np.dtype(column["dtype"]), shape=shape)
+        return self.open_chunks[key]
+
+    def write_rows(self, name, start, rows):
+        'Write rows at row index start (rows may be written in any order)'
+        column = self.columns[name]
+        rows = np.asarray(rows).reshape((-1,) + tuple(column["row_shape"]))
+        chunk_rows = column["chunk_rows"]
+
+        done = 0
+        while done < len(rows):
+            index, offset = divmod(start + done, chunk_rows)
+            n = min(len(rows) - done, chunk_rows - offset)
+            self.chunk(name, index)[offset:offset+n] = rows[done:done+n]
+
+            chunk_info = column["chunks"][index]
+            chunk_info["rows"] = max(chunk_info["rows"], offset + n)
+            done += n
+
+        column["rows"] = max(column["rows"], start + len(rows))
+
+    def append(self, name, rows):
+        'Append rows at the end of a column'
+        self.write_rows(name, self.columns[name]["rows"], rows)
+
+    def flush(self):
+        'Flush the memory maps and record the rows written so far in the manifest'
+        for chunk in self.open_chunks.values():
+            chunk.flush()
+        self.write_manifest()
+
+    def close(self):
+        self.flush()
+        self.open_chunks = {}
+
+    def write_manifest(self):
+        manifest = {"format": "chunked-npy", "version": 1, "attrs": self.attrs, "columns": self.columns}
+        tmp_path = os.path.join(self.path, MANIFEST + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST))
+
+def remove_run(path):
+    'Delete the chunk files and the manifest of the run in a directory'
+    for column in read_manifest(path)["columns"].values():
+        for chunk_info in column["chunks"]:
+            file_path = os.path.join(path, chunk_info["file"])
+            if os.path.exists(file_path):
+                os.remove(file_path)
+    os.remove(os.path.join(path, MANIFEST))
+
+############### READING ################
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+def iter_chunks(path, name):
+    'Memory-mapped chunks of a column, trimmed to the rows written'
+    column = read_manifest(path)["columns"][name]
+    for chunk_info in column["chunks"]:
+        chunk = np.load(os.path.join(path, chunk_info["file"]), mmap_mode='r')
+        yield chunk[:chunk_info["rows"]]
+
+def load_column(path, name):
+    'A column as a memory map (single chunk) or an array (several chunks concatenated)'
+    chunks = list(iter_chunks(path, name))
+    if len(chunks) == 1:
+        return chunks[0]
+    column = read_manifest(path)["columns"][name]
+    if len(chunks) == 0:
+        return np.zeros((0,) + tuple(column["row_shape"]), dtype=np.dtype(column["dtype"]))
+    return np.concatenate(chunks)
+
+def load_results(path, columns=None):
+    '''
+    Dict of columns of a run: a chunked output directory (only the requested columns are
+    mapped) or an old pickled dict .npy file.
+    '''
+    if os.path.isdir(path):
+        manifest = read_manifest(path)
+        names = manifest["columns"] if columns is None else columns
+        return {name: load_column(path, name) for name in names}
+
+    data = np.load(path, allow_pickle=True).item()
+    if columns is None:
+        return data
+    return {name: data[name] for name in columns}
+
+if __name__ == '__main__':
+    print(__name__)
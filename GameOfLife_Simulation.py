@@ -1,78 +1,98 @@
 """
 Running multiple random simulations to measure time taken to reach equilibrium without visualisation.
+The random lattices are stepped together in batches by the ensemble engine, and each
+finished batch is written straight to a chunked output directory (see ChunkedOutput), so
+memory is bounded by the batch size (BATCH_SIZE by default) rather than the number of
+simulations. An existing output directory is refused rather than overwritten.
+Progress (simulations/s, ETA, time split between stepping, measuring and I/O) is appended
+to progress.jsonl in the output directory every 30 s (see Instrumentation).
+With the cycles criterion, a trailing 'translation' flag detects cycles up to a
+translation of the torus, so replicas that end as gliders and spaceships stop early too.
 
 author: s2229553
 """
 
+import os
 import sys
 import numpy as np
-from numpy import random
-from GameOfLife_class import GoL_Lattice
+import GameOfLife_functions as func
+import GameOfLife_ensemble as ensemble
+import RandomStreams as streams
+from Instrumentation import Instrument
+from ChunkedOutput import ChunkedOutput
+
+BATCH_SIZE = 256 # default simulations per batch, bounds the memory of a run
 
 def main():
+    # trailing flag: translation (cycles criterion up to translations, so glider soups stop too)
+    translation_invariant = len(sys.argv) > 1 and sys.argv[-1] == 'translation'
+    if translation_invariant:
+        sys.argv.pop()
+
     # Read inputs from command lines
-    if len(sys.argv) != 4 :
+    if len(sys.argv) not in (4, 5, 6, 7) :
         print("You left out the name of the files when running.")
         print("In command line, run like this instead:")
-        print(f"% nohup python {sys.argv[0]} <inner iterations> <outer iterations> <output .npy file name> > output.txt &")
+        print(f"% nohup python {sys.argv[0]} <inner iterations> <outer iterations> <output directory> [<batch size>] [counts|cycles] [<seed>] [translation] > output.txt &")
         print("For example:")
         print("% nohup python GameOfLife_Simulation.py 500 500 measurements > output.txt &")
+        print("% nohup python GameOfLife_Simulation.py 5000 500 measurements 256 cycles 1 translation > output.txt &")
         sys.exit(1)
     else:
         inner_iterations = int(sys.argv[1]) 
         outer_iterations = int(sys.argv[2])
         outfile = str(sys.argv[3])
-
-    # random initialisation
+        batch_size = int(sys.argv[4]) if len(sys.argv) >= 5 else min(outer_iterations, BATCH_SIZE)
+        criterion = str(sys.argv[5]) if len(sys.argv) >= 6 else 'counts'
+        seed = int(sys.argv[6]) if len(sys.argv) == 7 else None
+    if criterion not in ('counts', 'cycles'):
+        raise ValueError(f"Unknown criterion {criterion}, choose 'counts' or 'cycles'")
+    if translation_invariant and criterion != 'cycles':
+        raise ValueError('The translation flag needs the cycles criterion')
+
+    # random initialisation, one stream per simulation (independent of the batch size)
     N = 50
-    #lattice = random.randint(low=0,high=2,size=(N,N))
-
-    # set system
-    #system = GoL_Lattice(lattice)
+    root = streams.root_sequence(seed)
+
+    output = ChunkedOutput(outfile, attrs={"N": N, "inner_iterations": inner_iterations,
+                                           "outer_iterations": outer_iterations, "criterion": criterion,
+                                           "translation_invariant": translation_invariant,
+                                           "entropy": str(root.entropy)})
+    output.add_column("Equilibrium_Steps", dtype=np.float64, chunk_rows=outer_iterations)
+    output.add_column("Simulation_data", row_shape=(inner_iterations,), dtype=np.int32, chunk_rows=batch_size)
+    if criterion == 'cycles':
+        output.add_column("Cycle_Periods", dtype=np.int64, chunk_rows=outer_iterations)
+    instrument = Instrument('GameOfLife_Simulation', total=outer_iterations, unit='simulations',
+                            path=os.path.join(outfile, 'progress.jsonl'))
 
-    outer_count_array = np.zeros((outer_iterations, inner_iterations))
-    equilibrium_array = np.zeros(outer_iterations)
     print('Begininning simulation... \n')
-    for i in range(outer_iterations):
-        lattice = random.randint(low=0,high=2,size=(N,N))
-        system = GoL_Lattice(lattice) # setting random initialised lattice
-
-        print(f'Simulation number {i}')
-        live_eq_counter = 0
-        for j in range(inner_iterations):
-
-            lattice_new = system.update_step()
-            system = GoL_Lattice(lattice_new)
-
-            live_sites = system.count_live()
-            outer_count_array[i][j] = live_sites
-
-            if j == 0:
-                pass
-
-            if j != 0:
-                if outer_count_array[i][j] - outer_count_array[i][j-1] == 0: # checking for eq
-                    live_eq_counter += 1
-                else:
-                    live_eq_counter = 0 # counter reset if not consecutive
-
-                if live_eq_counter == 5: # criteria for eq
-                    print(f'Simulation {i} reaches equilibrium!')
-                    print(f'Equilibrium after {j-5} steps. \n')
-                    equilibrium_array[i] = (j-5) 
-                    break
-
-                if j == (inner_iterations-1):
-                    print(f'No equilibrium found in simulation {i}. \n')
-
-    data = {"Equilibrium_Steps": equilibrium_array,
-            "Simulation_data": outer_count_array
-            }
-
-    np.save(outfile, data)
+    for start in range(0, outer_iterations, batch_size):
+        stop = min(start + batch_size, outer_iterations)
+        print(f'Simulation numbers {start} to {stop-1}')
+
+        # stack of randomly initialised lattices, stepped together
+        with instrument.phase('init'):
+            lattices = np.array([func.state_random(N, generator) for generator in streams.spawn_generators(root, stop-start)])
+        if criterion == 'cycles':
+            # stop each replica as soon as its state repeats
+            count_array, eq_array, periods = ensemble.run_cycles(lattices, inner_iterations, translation_invariant=translation_invariant,
+                                                                  offset=start, instrument=instrument)
+        else:
+            count_array, eq_array = ensemble.run_equilibrium(lattices, inner_iterations, offset=start, instrument=instrument)
+
+        with instrument.phase('io'):
+            if criterion == 'cycles':
+                output.write_rows("Cycle_Periods", start, periods)
+            output.write_rows("Simulation_data", start, count_array)
+            output.write_rows("Equilibrium_Steps", start, eq_array)
+            output.flush()
+        instrument.count('simulations', stop-start)
+
+    output.close()
+    instrument.report()
 
     print('Job Done! :)')
-    print(f'Check directory for {outfile}.npy file. Data analysis can be done by using np.load. \n')
+    print(f'Check directory for {outfile}/ (manifest.json and .npy columns). Data analysis can be done by using ChunkedOutput.load_results. \n')
 
 if __name__ == '__main__':
     main()  
@@ -0,0 +1,58 @@
+"""
+Benchmark of the dense (np.roll) and bit-packed Game of Life engines.
+Both engines are stepped from the same random lattice and checked to give identical
+generations before the timings are reported.
+
+author: s2229553
+"""
+
+import sys
+import time
+import numpy as np
+import GameOfLife_functions as func
+import GameOfLife_bitpacked as bitpacked
+
+def time_dense(lattice, generations):
+    'Time per generation of the dense engine'
+    start = time.perf_counter()
+    for _ in range(generations):
+        lattice = func.update_step(lattice)
+    return (time.perf_counter() - start)/generations, lattice
+
+def time_bitpacked(lattice, generations):
+    'Time per generation of the bit-packed engine (packing excluded)'
+    N = len(lattice)
+    packed = bitpacked.pack_lattice(lattice)
+
+    start = time.perf_counter()
+    for _ in range(generations):
+        packed = bitpacked.update_step(packed, N)
+    return (time.perf_counter() - start)/generations, bitpacked.unpack_lattice(packed, N)
+
+def main():
+    # Read inputs from command lines
+    if len(sys.argv) < 2 :
+        print("You left out the number of generations when running.")
+        print("In command line, run like this instead:")
+        print(f"% python {sys.argv[0]} <generations> [<N> <N> ...]")
+        print("For example:")
+        print("% python GameOfLife_benchmark.py 20 50 1024 8192")
+        sys.exit(1)
+    else:
+        generations = int(sys.argv[1])
+        N_values = [int(N) for N in sys.argv[2:]] or [50, 1024, 8192]
+
+    print(f'{"N":>6} {"dense [s/gen]":>15} {"bitpacked [s/gen]":>18} {"speedup":>8}')
+    for N in N_values:
+        lattice = func.state_random(N)
+
+        t_dense, lattice_dense = time_dense(lattice, generations)
+        t_packed, lattice_packed = time_bitpacked(lattice, generations)
+
+        if not np.array_equal(lattice_dense, lattice_packed):
+            raise RuntimeError(f'Engines disagree at N = {N}')
+
+        print(f'{N:>6} {t_dense:>15.3e} {t_packed:>18.3e} {t_dense/t_packed:>8.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -5,28 +5,219 @@ author: S2229553
 """
 
 import numpy as np
+import Instrumentation as instrumentation
 import GameOfLife_functions as func
+import GameOfLife_bitpacked as bitpacked
+import GameOfLife_cycles as cycles
+import GameOfLife_hashlife as hashlife
+import GameOfLife_sparse as sparse
+import GameOfLife_parallel as parallel
+import GameOfLife_rules as rules
+
+ENGINES = ('dense', 'bitpacked', 'hashlife', 'sparse', 'parallel')
 
 class GoL_Lattice():
     '''
     Lattice system
+
+    engine='dense' steps the lattice with np.roll (original engine),
+    engine='bitpacked' keeps one bit per site in uint64 words,
+    engine='hashlife' keeps a memoised quadtree for very long evolutions,
+    engine='sparse' only recomputes active tiles (mostly empty lattices; lattice may also be
+                    a GameOfLife_sparse.SparseLife, so huge tori are never held densely),
+    engine='parallel' steps row strips on n_workers threads (huge lattices, all cores if None).
+
+    rule is a Life-like or Generations rule string (or GameOfLife_rules.Rule), compiled to a
+    lookup table; the dense engine runs any rule (B3/S23 keeps its specialised kernel), the
+    other engines are B3/S23 only. Generations lattices (dying states 2..C-1) are rejected
+    by Renderer, TrajectoryStore and GameOfLife_tracking, which take 0/1 lattices.
+
+    instrument (an Instrumentation.Instrument, optional) gets the time spent stepping and
+    the number of generations.
     '''
 
-    def __init__(self, lattice):
-        self.lattice = np.array(lattice)
-        self.N = int(len(lattice))
+    def __init__(self, lattice, engine='dense', instrument=None, n_workers=None, rule='B3/S23'):
+        if engine not in ENGINES:
+            raise ValueError(f'Unknown engine {engine}, choose from {ENGINES}')
+        self.rule = rule if isinstance(rule, rules.Rule) else rules.Rule(rule)
+        if engine != 'dense' and not self.rule.is_life():
+            raise ValueError(f'Engine {engine} only runs B3/S23, use the dense engine for {self.rule.name}')
+
+        self.engine = engine
+        if isinstance(lattice, sparse.SparseLife):
+            if engine != 'sparse':
+                raise ValueError(f'A SparseLife system needs the sparse engine, not {engine}')
+            self.sparse = lattice
+            self.N = lattice.N
+            self.lattice = None # built from the tiles when asked for
+        else:
+            self.lattice = np.array(lattice, dtype=np.uint8)
+            self.N = int(len(lattice))
+        self.buffers = None # padded double buffers for step(), allocated on first use
+        self.instrument = instrument
+
+        if self.engine == 'bitpacked':
+            self.packed = bitpacked.pack_lattice(self.lattice)
+        if self.engine == 'hashlife':
+            self.hashlife = hashlife.HashLife(self.lattice)
+        if self.engine == 'sparse' and not isinstance(lattice, sparse.SparseLife):
+            self.sparse = sparse.SparseLife(self.N)
+            self.sparse.set_lattice(self.lattice)
+        if self.engine == 'parallel':
+            self.parallel = parallel.ParallelLife(self.lattice, n_workers)
+
+    @property
+    def lattice(self):
+        'Dense (N, N) lattice; for the sparse engine built from the tiles on first access after a step'
+        if self._lattice is None and self.engine == 'sparse':
+            self._lattice = self.sparse.get_lattice()
+        return self._lattice
+
+    @lattice.setter
+    def lattice(self, lattice):
+        self._lattice = lattice
 
     def update_step(self):
+        if self.engine == 'hashlife':
+            return self.hashlife.peek(1)
+        if self.engine == 'sparse':
+            system = self.sparse.copy()
+            system.update_step()
+            return system.get_lattice()
+        if self.engine == 'bitpacked':
+            return bitpacked.unpack_lattice(bitpacked.update_step(self.packed, self.N), self.N)
+        if self.engine == 'parallel':
+            return self.parallel.peek()
+        if not self.rule.is_life():
+            return self.rule.update_step(self.lattice)
         return func.update_step(self.lattice)
     
+    def step(self):
+        '''
+        Advance one generation in place and return a view of the lattice.
+        The dense engine steps between two preallocated padded buffers without allocating;
+        the returned view is overwritten two steps later, copy it to keep a generation.
+        '''
+        if self.engine != 'dense':
+            return self.evolve(1)
+
+        if self.buffers is None or self.lattice.base is not self.buffers[0]:
+            N = self.N
+            self.buffers = [np.zeros((N+2, N+2), dtype=np.uint8), np.zeros((N+2, N+2), dtype=np.uint8)]
+            self.buffers[0][1:-1, 1:-1] = self.lattice
+            self.nn_contribution = np.zeros((N, N), dtype=np.uint8)
+            self.bool_masks = [np.zeros((N, N), dtype=bool), np.zeros((N, N), dtype=bool)]
+            self.rule_buffers = None if self.rule.is_life() else self.rule.buffers(N)[1:]
+
+        with instrumentation.phase(self.instrument, 'step'):
+            if self.rule_buffers is None:
+                func.update_step_buffered(self.buffers[0], self.buffers[1], self.nn_contribution, *self.bool_masks)
+            else:
+                self.rule.update_step_buffered(self.buffers[0], self.buffers[1], self.nn_contribution, *self.rule_buffers)
+        self.buffers.reverse() # swap current and next
+        self.lattice = self.buffers[0][1:-1, 1:-1]
+        instrumentation.count(self.instrument, 'generations')
+        return self.lattice
+
+    def run(self, n_steps, callback=None):
+        'Advance n_steps generations in place, calling callback(step, system) after each one'
+        for i in range(n_steps):
+            self.step()
+            if callback is not None:
+                callback(i, self)
+        return self.current()
+
+    def evolve(self, generations):
+        'Evolve the system in place for a number of generations and return the lattice (see current)'
+        if self.engine == 'dense':
+            return self.run(generations) # counted by step
+
+        with instrumentation.phase(self.instrument, 'step'):
+            if self.engine == 'hashlife':
+                self.hashlife.jump(generations)
+                self.lattice = self.hashlife.get_lattice()
+            elif self.engine == 'sparse':
+                self.sparse.evolve(generations)
+                self.lattice = None # dense copy only on demand
+            elif self.engine == 'parallel':
+                self.parallel.evolve(generations)
+                self.lattice = self.parallel.get_lattice()
+            else:
+                for _ in range(generations):
+                    self.packed = bitpacked.update_step(self.packed, self.N)
+                self.lattice = bitpacked.unpack_lattice(self.packed, self.N)
+        instrumentation.count(self.instrument, 'generations', generations)
+        return self.current()
+
+    def current(self):
+        'The lattice, or the SparseLife system for the sparse engine (system.lattice builds its dense copy)'
+        return self.sparse if self.engine == 'sparse' else self.lattice
+    
+    def find_cycle(self, max_generations, buffer_size=64, translation_invariant=False):
+        '''
+        Evolve the system in place until it enters a cycle (at most max_generations).
+        Returns (transient, period, shift) or None if no cycle was found; the lattice is
+        left at the generation where the cycle closed (and the generation counters of the
+        hashlife and sparse engines advanced to it). Needs a two state rule.
+        '''
+        if self.rule.n_states > 2:
+            raise ValueError(f'Cycle detection needs a two state rule, not {self.rule.name}')
+        detector = cycles.CycleDetector(self.N, buffer_size, translation_invariant)
+        packed = self.packed if self.engine == 'bitpacked' else bitpacked.pack_lattice(self.lattice)
+
+        found = detector.update(packed)
+        lattice = self.lattice
+        generations = 0
+        for _ in range(max_generations):
+            if found:
+                break
+            generations += 1
+            if self.rule.is_life():
+                packed = bitpacked.update_step(packed, self.N)
+            else: # other rules through their table, packed for the detector
+                lattice = self.rule.update_step(lattice)
+                packed = bitpacked.pack_lattice(lattice)
+            found = detector.update(packed)
+
+        if self.engine == 'bitpacked':
+            self.packed = packed
+        self.lattice = bitpacked.unpack_lattice(packed, self.N)
+        if self.engine == 'hashlife':
+            self.hashlife.set_lattice(self.lattice)
+            self.hashlife.generation += generations
+        if self.engine == 'sparse':
+            self.sparse.set_lattice(self.lattice)
+            self.sparse.generation += generations
+        if self.engine == 'parallel':
+            self.parallel.set_lattice(self.lattice)
+
+        if not found:
+            return None
+        return detector.transient, detector.period, detector.shift
+
     def count_live(self):
+        if self.engine == 'hashlife':
+            return self.hashlife.count_live()
+        if self.engine == 'sparse':
+            return self.sparse.count_live()
+        if self.engine == 'bitpacked':
+            return bitpacked.count_live(self.packed)
+        if self.engine == 'parallel':
+            return self.parallel.count_live()
+        if self.rule.n_states > 2: # dying sites are not live
+            return int(np.count_nonzero(self.lattice == 1))
         return func.count_live(self.lattice)
     
     def return_com(self):
+        if self.engine == 'sparse':
+            return self.sparse.compute_com()
         return func.compute_com(self.lattice)
     
     ############# INITIALISATIONS ############
     
+    def set_random(self, generator=None):
+        return func.state_random(self.N, generator)
+    
     def set_glider(self):
         return func.state_glider(self.N)
     
@@ -0,0 +1,132 @@
+"""
+Cycle detection for the Game of Life by hashing lattice states.
+Lattices are hashed on their bit-packed words (see GameOfLife_bitpacked) as a weighted sum
+of the words with random odd keys mod 2^64 (one multiply-add per word, cheaper than the
+step that produced them). Recent hashes are kept in a bounded ring buffer; a hash match is
+confirmed by comparing the stored lattice, so reported transients and periods are exact.
+With translation_invariant=True states are compared up to a translation on the torus,
+so gliders and spaceships are also caught.
+
+author: s2229553
+"""
+
+import numpy as np
+from numpy import random
+import GameOfLife_bitpacked as bitpacked
+
+def make_keys(shape, seed=None):
+    'Random odd uint64 keys, one per packed word (or per row for translation hashes)'
+    rng = random.default_rng(seed)
+    keys = rng.integers(0, 2**63, size=shape, dtype=np.uint64)
+    return (keys << np.uint64(1)) | np.uint64(1)
+
+def hash_packed(packed, keys):
+    'Hash of a packed lattice (one hash per replica for a stack)'
+    return np.sum(packed * keys, axis=(-2, -1), dtype=np.uint64)
+
+def hash_translation_invariant(packed, N, keys):
+    '''
+    Translation invariant hash: sorted row and column live counts are unchanged by any
+    cyclic shift of the lattice. keys has shape (2, N).
+    '''
+    lattice = bitpacked.unpack_lattice(packed, N)
+    rows = np.sort(np.sum(lattice, axis=-1), axis=-1).astype(np.uint64)
+    cols = np.sort(np.sum(lattice, axis=-2), axis=-1).astype(np.uint64)
+    return np.sum(rows * keys[0] + cols * keys[1], axis=-1, dtype=np.uint64)
+
+def find_translation(lattice_a, lattice_b):
+    '''
+    Shift (dy, dx) such that np.roll(lattice_b, (dy, dx), axis=(0, 1)) == lattice_a,
+    or None if the lattices are not translates of each other.
+    '''
+    a = np.asarray(lattice_a, dtype=float)
+    b = np.asarray(lattice_b, dtype=float)
+    live = np.sum(a)
+    if live != np.sum(b):
+        return None
+    if live == 0:
+        return (0, 0)
+
+    # cyclic cross-correlation; a full overlap gives a peak equal to the live count
+    corr = np.fft.ifft2(np.fft.fft2(a) * np.conj(np.fft.fft2(b))).real
+    for dy, dx in zip(*np.where(np.rint(corr) == live)):
+        if np.array_equal(np.roll(lattice_b, (dy, dx), axis=(0, 1)), lattice_a):
+            return (int(dy), int(dx))
+    return None
+
+class CycleDetector():
+    '''
+    Cycle detector for a single lattice. Call update() with every generation (starting
+    from the initial lattice, generation 0); it returns True once the lattice enters a
+    cycle, after which transient, period and shift hold the result. Cycles longer than
+    buffer_size generations are not detected.
+    '''
+
+    def __init__(self, N, buffer_size=64, translation_invariant=False, seed=None):
+        self.N = N
+        self.buffer_size = buffer_size
+        self.translation_invariant = translation_invariant
+
+        if translation_invariant:
+            self.keys = make_keys((2, N), seed)
+        else:
+            self.keys = make_keys((N, bitpacked.n_words(N)), seed)
+
+        self.hashes = np.zeros(buffer_size, dtype=np.uint64)
+        self.frames = np.zeros((buffer_size, N, bitpacked.n_words(N)), dtype=np.uint64)
+        self.generation = 0
+        self.hash = None
+
+        self.transient = None
+        self.period = None
+        self.shift = None
+
+    def hash_lattice(self, packed):
+        'Hash of the new generation'
+        if self.translation_invariant:
+            return hash_translation_invariant(packed, self.N, self.keys)
+        return hash_packed(packed, self.keys)
+
+    def confirm(self, packed, slot):
+        'Compare against the stored frame; returns the shift or None'
+        if not self.translation_invariant:
+            return (0, 0) if np.array_equal(packed, self.frames[slot]) else None
+        return find_translation(bitpacked.unpack_lattice(packed, self.N),
+                                bitpacked.unpack_lattice(self.frames[slot], self.N))
+
+    def update(self, packed):
+        'Add the next generation (packed); returns True once a cycle is found'
+        if self.period is not None:
+            return True
+
+        self.hash = self.hash_lattice(packed)
+
+        n_stored = min(self.generation, self.buffer_size)
+        slots = np.flatnonzero(self.hashes[:n_stored] == self.hash)
+        lags = (self.generation - 1 - slots) % self.buffer_size + 1
+
+        # most recent candidates first, so the shortest period is reported
+        for lag, slot in sorted(zip(lags, slots)):
+            shift = self.confirm(packed, slot)
+            if shift is not None:
+                self.period = int(lag)
+                self.transient = self.generation - self.period
+                self.shift = shift
+                return True
+
+        slot = self.generation % self.buffer_size
+        self.hashes[slot] = self.hash
+        self.frames[slot] = packed
+        self.generation += 1
+        return False
+
+if __name__ == '__main__':
+    import GameOfLife_functions as func
+
+    for state, translation_invariant in [(func.state_blinker, False), (func.state_glider, True)]:
+        N = 20
+        packed = bitpacked.pack_lattice(state(N))
+        detector = CycleDetector(N, translation_invariant=translation_invariant)
+        while not detector.update(packed):
+            packed = bitpacked.update_step(packed, N)
+        print(f'{state.__name__}: transient {detector.transient}, period {detector.period}, shift {detector.shift}')
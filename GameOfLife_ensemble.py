@@ -0,0 +1,175 @@
+"""
+Ensemble engine for the Game of Life: a (B, N, N) stack of replicas is stepped together
+and the equilibrium criterion (5 consecutive equal live counts) is checked per replica.
+Replicas that reach equilibrium are compacted out of the stack, so the work shrinks as
+the batch converges. run_cycles instead stops each replica as soon as it enters a cycle,
+found by state hashing (see GameOfLife_cycles).
+
+author: s2229553
+"""
+
+import numpy as np
+import Instrumentation as instrumentation
+import GameOfLife_functions as func
+import GameOfLife_bitpacked as bitpacked
+import GameOfLife_cycles as cycles
+
+ENGINES = ('dense', 'bitpacked')
+
+def count_live(lattices):
+    'Count number of live sites per replica of a dense stack'
+    return np.sum(lattices, axis=(-2, -1))
+
+def run_equilibrium(lattices, inner_iterations, engine='bitpacked', eq_window=5, offset=0, instrument=None):
+    '''
+    Step a (B, N, N) stack until each replica reaches equilibrium or inner_iterations.
+    Returns the live count array (B, inner_iterations) and the equilibrium steps (B),
+    with the same conventions as the serial loop in GameOfLife_Simulation: counts after
+    equilibrium are left at 0 and replicas without equilibrium get 0 steps.
+    offset only shifts the simulation numbers used in the printed messages.
+    instrument (optional) gets the stepping and measuring times and the generations
+    stepped, summed over the replicas.
+    '''
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown engine {engine}, choose from {ENGINES}')
+
+    lattices = np.asarray(lattices)
+    B, N = lattices.shape[0], lattices.shape[-1]
+
+    count_array = np.zeros((B, inner_iterations))
+    equilibrium_array = np.zeros(B)
+
+    if engine == 'bitpacked':
+        state = bitpacked.pack_lattice(lattices)
+    else:
+        state = lattices
+
+    active = np.arange(B) # replicas still being stepped
+    live_eq_counter = np.zeros(B, dtype=int)
+
+    for j in range(inner_iterations):
+        with instrumentation.phase(instrument, 'step'):
+            if engine == 'bitpacked':
+                state = bitpacked.update_step(state, N)
+            else:
+                state = func.update_step(state)
+        instrumentation.count(instrument, 'generations', len(active))
+
+        with instrumentation.phase(instrument, 'measure'):
+            live_sites = bitpacked.count_live(state) if engine == 'bitpacked' else count_live(state)
+
+        count_array[active, j] = live_sites
+
+        if j != 0:
+            unchanged = (count_array[active, j] - count_array[active, j-1] == 0) # checking for eq
+            live_eq_counter = np.where(unchanged, live_eq_counter + 1, 0) # counter reset if not consecutive
+
+            done = (live_eq_counter == eq_window) # criteria for eq
+            if np.any(done):
+                for i in active[done]:
+                    print(f'Simulation {offset + i} reaches equilibrium!')
+                    print(f'Equilibrium after {j-eq_window} steps. \n')
+                equilibrium_array[active[done]] = (j-eq_window)
+
+                # compact finished replicas out of the stack
+                keep = ~done
+                active = active[keep]
+                state = state[keep]
+                live_eq_counter = live_eq_counter[keep]
+
+        if len(active) == 0:
+            break
+
+    for i in active:
+        print(f'No equilibrium found in simulation {offset + i}. \n')
+
+    return count_array, equilibrium_array
+
+def run_cycles(lattices, inner_iterations, buffer_size=64, translation_invariant=False, offset=0, instrument=None):
+    '''
+    Step a (B, N, N) stack (bit-packed) until each replica enters a cycle or inner_iterations.
+    Returns the live count array (B, inner_iterations), the equilibrium steps (B) and the
+    cycle periods (B). Equilibrium steps use the index convention of the count array
+    (index j holds generation j+1), so a cycle entered at generation t is stored as t-1;
+    replicas without a cycle get 0 steps and period 0.
+    instrument (optional) as in run_equilibrium, with counting and hashing as the measure phase.
+    '''
+    lattices = np.asarray(lattices)
+    B, N = lattices.shape[0], lattices.shape[-1]
+
+    count_array = np.zeros((B, inner_iterations))
+    equilibrium_array = np.zeros(B)
+    period_array = np.zeros(B, dtype=int)
+
+    if translation_invariant:
+        keys = cycles.make_keys((2, N))
+        hash_state = lambda packed: cycles.hash_translation_invariant(packed, N, keys)
+    else:
+        keys = cycles.make_keys((N, bitpacked.n_words(N)))
+        hash_state = lambda packed: cycles.hash_packed(packed, keys)
+
+    state = bitpacked.pack_lattice(lattices)
+    active = np.arange(B) # replicas still being stepped
+
+    # ring buffer of recent hashes and frames per replica, generation 0 is the initial lattice
+    hashes = np.zeros((B, buffer_size), dtype=np.uint64)
+    frames = np.zeros((B, buffer_size) + state.shape[1:], dtype=np.uint64)
+    hashes[:, 0] = hash_state(state)
+    frames[:, 0] = state
+
+    for j in range(inner_iterations):
+        generation = j + 1
+        with instrumentation.phase(instrument, 'step'):
+            state = bitpacked.update_step(state, N)
+        instrumentation.count(instrument, 'generations', len(active))
+
+        with instrumentation.phase(instrument, 'measure'):
+            count_array[active, j] = bitpacked.count_live(state)
+            state_hash = hash_state(state)
+
+        n_stored = min(generation, buffer_size)
+        matches = (hashes[:, :n_stored] == state_hash[:, None])
+        lags = (generation - 1 - np.arange(n_stored)) % buffer_size + 1
+
+        done = np.zeros(len(active), dtype=bool)
+        for b in np.flatnonzero(np.any(matches, axis=1)):
+            # most recent candidates first, so the shortest period is reported
+            for slot in sorted(np.flatnonzero(matches[b]), key=lambda slot: lags[slot]):
+                if translation_invariant:
+                    shift = cycles.find_translation(bitpacked.unpack_lattice(state[b], N),
+                                                    bitpacked.unpack_lattice(frames[b, slot], N))
+                    found = shift is not None
+                else:
+                    found = np.array_equal(state[b], frames[b, slot])
+
+                if found:
+                    transient = generation - lags[slot]
+                    print(f'Simulation {offset + active[b]} enters a cycle of period {lags[slot]}!')
+                    print(f'Cycle entered after {transient} generations. \n')
+                    equilibrium_array[active[b]] = max(transient - 1, 0)
+                    period_array[active[b]] = lags[slot]
+                    done[b] = True
+                    break
+
+        slot = generation % buffer_size
+        hashes[:, slot] = state_hash
+        frames[:, slot] = state
+
+        if np.any(done):
+            # compact finished replicas out of the stack
+            keep = ~done
+            active = active[keep]
+            state = state[keep]
+            hashes = hashes[keep]
+            frames = frames[keep]
+
+        if len(active) == 0:
+            break
+
+    for i in active:
+        print(f'No cycle found in simulation {offset + i}. \n')
+
+    return count_array, equilibrium_array, period_array
+
+if __name__ == '__main__':
+    print(__name__)
@@ -12,24 +12,55 @@ from numpy import random
 rng = random.default_rng()
 
 def update_step(lattice):
-    'Update step for game of life'
+    'Update step for game of life (acts on the last two axes, so a stack of lattices works too)'
 
     # calculating number of live nn
-    nn_contribution = (np.roll(lattice, shift=1, axis=0) + 
-        np.roll(lattice, shift=1, axis=1) +
-        np.roll(lattice, shift=-1, axis=0) +
-        np.roll(lattice, shift=-1, axis=1) +
-        np.roll(lattice, shift=(1,1), axis=(0,1)) +
-        np.roll(lattice, shift=(1,-1), axis=(0,1)) +
-        np.roll(lattice, shift=(-1,1), axis=(0,1)) +
-        np.roll(lattice, shift=(-1,-1), axis=(0,1)))
+    nn_contribution = (np.roll(lattice, shift=1, axis=-2) + 
+        np.roll(lattice, shift=1, axis=-1) +
+        np.roll(lattice, shift=-1, axis=-2) +
+        np.roll(lattice, shift=-1, axis=-1) +
+        np.roll(lattice, shift=(1,1), axis=(-2,-1)) +
+        np.roll(lattice, shift=(1,-1), axis=(-2,-1)) +
+        np.roll(lattice, shift=(-1,1), axis=(-2,-1)) +
+        np.roll(lattice, shift=(-1,-1), axis=(-2,-1)))
 
     bool_mask_live = ((lattice == 1) & ((nn_contribution == 2) | (nn_contribution == 3))) # condition for live to stay live
     bool_mask_dead = ((lattice == 0) & (nn_contribution == 3)) # condition for dead to be live
 
-    return (bool_mask_live | bool_mask_dead).astype(int) # OR to overlap the live states,
+    return (bool_mask_live | bool_mask_dead).astype(np.uint8) # OR to overlap the live states,
                                                          # FALSE in both live and dead masks are dead
 
+def fill_halo(padded):
+    'Copy the periodic images of the edges into the one site halo of a padded (N+2, N+2) lattice'
+    padded[0, 1:-1] = padded[-2, 1:-1]
+    padded[-1, 1:-1] = padded[1, 1:-1]
+    padded[:, 0] = padded[:, -2] # full columns, so the corners wrap too
+    padded[:, -1] = padded[:, 1]
+
+def update_step_buffered(padded, padded_new, nn_contribution, bool_mask_dead, bool_mask_live):
+    '''
+    Allocation free update step for game of life. The lattice is the interior of padded
+    (N+2, N+2, uint8) and the new generation is written to the interior of padded_new;
+    nn_contribution (N, N, uint8) and the two bool masks (N, N) are scratch buffers.
+    '''
+    fill_halo(padded)
+
+    # calculating number of live nn from the shifted views of the padded lattice
+    np.add(padded[:-2, :-2], padded[:-2, 1:-1], out=nn_contribution)
+    np.add(nn_contribution, padded[:-2, 2:], out=nn_contribution)
+    np.add(nn_contribution, padded[1:-1, :-2], out=nn_contribution)
+    np.add(nn_contribution, padded[1:-1, 2:], out=nn_contribution)
+    np.add(nn_contribution, padded[2:, :-2], out=nn_contribution)
+    np.add(nn_contribution, padded[2:, 1:-1], out=nn_contribution)
+    np.add(nn_contribution, padded[2:, 2:], out=nn_contribution)
+
+    np.equal(nn_contribution, 3, out=bool_mask_dead) # 3 nn: live whatever the state
+    np.equal(nn_contribution, 2, out=bool_mask_live) # 2 nn: live stays live
+    np.logical_and(bool_mask_live, padded[1:-1, 1:-1], out=bool_mask_live)
+    np.logical_or(bool_mask_dead, bool_mask_live, out=bool_mask_dead)
+
+    np.copyto(padded_new[1:-1, 1:-1], bool_mask_dead)
+
 def count_live(lattice):
     'Count number of live sites'
     return np.sum(lattice)
@@ -61,11 +92,19 @@ def compute_com(lattice):
     
     return np.array([com_x, com_y])
 
+############## RANDOM STATE #################
+
+def state_random(N, generator=None, replicas=None):
+    'Random lattice, each site live with probability 1/2 (a (replicas, N, N) stack if given)'
+    generator = rng if generator is None else generator
+    shape = (N,N) if replicas is None else (replicas,N,N)
+    return generator.integers(low=0, high=2, size=shape, dtype=np.uint8)
+
 ############## EQUILIBRIUM STATES #################
 
 def state_glider(N):
     glider_square = np.array([[0,1,0],[0,0,1],[1,1,1]])
-    lattice_square = np.zeros((N,N))
+    lattice_square = np.zeros((N,N), dtype=np.uint8)
 
     # find the center indices of the large array
     center_x, center_y = N // 2, N // 2  
@@ -80,7 +119,7 @@ def state_glider(N):
 
 def state_blinker(N):
     blinker_square = np.array([[0,0,0],[1,1,1],[0,0,0]])
-    lattice_square = np.zeros((N,N))
+    lattice_square = np.zeros((N,N), dtype=np.uint8)
 
     # find the center indices of the large array
     center_x, center_y = N // 2, N // 2  
@@ -95,7 +134,7 @@ def state_blinker(N):
 
 def state_beehive(N):
     beehive_quad = np.array([[0,1,1,0],[1,0,0,1],[0,1,1,0]])
-    lattice_square = np.zeros((N,N))
+    lattice_square = np.zeros((N,N), dtype=np.uint8)
 
     # find the center indices of the large array
     center_x, center_y = N // 2, N // 2  
@@ -110,7 +149,7 @@ def state_beehive(N):
 
 def state_flower(N):
     flower_square = np.array([[0,1,0],[1,0,1],[0,1,0]])
-    lattice_square = np.zeros((N,N))
+    lattice_square = np.zeros((N,N), dtype=np.uint8)
 
     # find the center indices of the large array
     center_x, center_y = N // 2, N // 2  
@@ -125,7 +164,7 @@ def state_flower(N):
 
 def state_crab(N):
     crab_square = np.array([[0,1,0,0],[1,0,1,0],[1,0,0,1],[0,1,1,0]])
-    lattice_square = np.zeros((N,N))
+    lattice_square = np.zeros((N,N), dtype=np.uint8)
 
     # find the center indices of the large array
     center_x, center_y = N // 2, N // 2  
@@ -140,7 +179,7 @@ def state_crab(N):
 
 def state_test(N):
     test_square = np.array([[0,1,1,1,1,1,1,1,1,0],[1,0,0,0,0,0,0,0,0,1],[0,1,1,1,1,1,1,1,1,0]])
-    lattice_square = np.zeros((N,N))
+    lattice_square = np.zeros((N,N), dtype=np.uint8)
 
     # find the center indices of the large array
     center_x, center_y = N // 2, N // 2  
@@ -174,7 +213,7 @@ def update_step_test(lattice):
     return nn_contribution, lattice_new, bool_mask, bool_mask_live, bool_mask_dead
 
 if __name__ == '__main__':
-    lattice = random.randint(low=0,high=2,size=(5,5))
+    lattice = state_random(5, random.default_rng()) # explicit generator, not the legacy global state
     print(f'initial : {lattice}')
     lattice_nn, lattice_update, bool_mask, bool_live, bool_dead  = update_step_test(lattice)
     print(f'number of nn alive : {lattice_nn}')
@@ -0,0 +1,285 @@
+"""
+Hashlife engine for the Game of Life with periodic BC, for very long evolutions.
+The lattice is held as a quadtree of canonicalised (hash-consed) nodes and the
+successor of every node is memoised, so repeated structure in space and time is only
+computed once. Both caches are bounded LRU tables: evicting an entry only costs a
+recomputation later, never correctness.
+
+The torus is evolved as the infinite plane tiled with copies of the lattice. For N a
+power of two the tiling is itself a quadtree (every tile is the same node), so a jump
+never leaves quadtree form; for other N the state is kept dense and the tiled plane is
+built from the distinct block offsets modulo N.
+
+Use a power of two N for long jumps. For other N the blocks of the tiled plane at
+different offsets are different nodes, so every power of two in a jump rebuilds the
+plane and computes successors for up to N^2 nodes per level (O(N^2 level), level ~ s
+for a jump of 2**s): a 1023 generation jump takes ~13 s on a 50^2 soup and ~4 s on a
+300^2 torus with three gliders, against ~0.03 s for the gliders at N = 256 or 512. Chaining
+the powers on one larger plane is slower still (its extra levels cost more than the
+rebuilds), so general N is kept for correctness, not speed.
+
+author: s2229553
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+class Node():
+    '''
+    Quadtree node of size 2**level; leaves (level 0) are single sites
+    '''
+    __slots__ = ('level', 'nw', 'ne', 'sw', 'se', 'pop')
+
+    def __init__(self, level, nw, ne, sw, se, pop):
+        self.level = level
+        self.nw, self.ne, self.sw, self.se = nw, ne, sw, se
+        self.pop = pop
+
+OFF = Node(0, None, None, None, None, 0)
+ON = Node(0, None, None, None, None, 1)
+
+def is_power_of_two(N):
+    return N > 0 and (N & (N - 1)) == 0
+
+class HashLife():
+    '''
+    Hashlife system on an N x N torus
+    '''
+
+    def __init__(self, lattice, cache_size=2**20):
+        self.cache_size = cache_size
+        self.join_cache = OrderedDict()
+        self.step_cache = OrderedDict()
+        self.empty_nodes = [OFF]
+        self.generation = 0
+        self.set_lattice(lattice)
+
+    ############# NODE CACHE ############
+
+    def cache_get(self, cache, key):
+        node = cache.get(key)
+        if node is not None:
+            cache.move_to_end(key)
+        return node
+
+    def cache_put(self, cache, key, node):
+        cache[key] = node
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False) # evict least recently used
+
+    def join(self, nw, ne, sw, se):
+        'Canonical node with the given quadrants'
+        key = (nw, ne, sw, se)
+        node = self.cache_get(self.join_cache, key)
+        if node is None:
+            node = Node(nw.level + 1, nw, ne, sw, se, nw.pop + ne.pop + sw.pop + se.pop)
+            self.cache_put(self.join_cache, key, node)
+        return node
+
+    def empty(self, level):
+        'Empty node of a given level'
+        while len(self.empty_nodes) <= level:
+            e = self.empty_nodes[-1]
+            self.empty_nodes.append(self.join(e, e, e, e))
+        return self.empty_nodes[level]
+
+    def cache_info(self):
+        return {'join': len(self.join_cache), 'step': len(self.step_cache)}
+
+    ############# EVOLUTION ############
+
+    def life_4x4(self, node):
+        'Centre 2x2 of a level 2 node after one generation'
+        cells = np.array([[node.nw.nw.pop, node.nw.ne.pop, node.ne.nw.pop, node.ne.ne.pop],
+                          [node.nw.sw.pop, node.nw.se.pop, node.ne.sw.pop, node.ne.se.pop],
+                          [node.sw.nw.pop, node.sw.ne.pop, node.se.nw.pop, node.se.ne.pop],
+                          [node.sw.sw.pop, node.sw.se.pop, node.se.sw.pop, node.se.se.pop]])
+
+        new = []
+        for i in (1, 2):
+            for j in (1, 2):
+                nn = np.sum(cells[i-1:i+2, j-1:j+2]) - cells[i, j]
+                live = (nn == 3) or (cells[i, j] == 1 and nn == 2)
+                new.append(ON if live else OFF)
+        return self.join(*new)
+
+    def successor(self, node, j):
+        '''
+        Centre of a node (level L) after 2**j generations, 0 <= j <= L-2; the result has level L-1
+        '''
+        if node.pop == 0:
+            return self.empty(node.level - 1)
+
+        key = (node, j)
+        result = self.cache_get(self.step_cache, key)
+        if result is not None:
+            return result
+
+        if node.level == 2:
+            result = self.life_4x4(node)
+        else:
+            j = min(j, node.level - 2)
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            join = self.join
+
+            # nine overlapping sub-squares, each advanced by 2**j (or 2**(L-3)) generations
+            c1 = self.successor(join(nw.nw, nw.ne, nw.sw, nw.se), j)
+            c2 = self.successor(join(nw.ne, ne.nw, nw.se, ne.sw), j)
+            c3 = self.successor(join(ne.nw, ne.ne, ne.sw, ne.se), j)
+            c4 = self.successor(join(nw.sw, nw.se, sw.nw, sw.ne), j)
+            c5 = self.successor(join(nw.se, ne.sw, sw.ne, se.nw), j)
+            c6 = self.successor(join(ne.sw, ne.se, se.nw, se.ne), j)
+            c7 = self.successor(join(sw.nw, sw.ne, sw.sw, sw.se), j)
+            c8 = self.successor(join(sw.ne, se.nw, sw.se, se.sw), j)
+            c9 = self.successor(join(se.nw, se.ne, se.sw, se.se), j)
+
+            if j < node.level - 2:
+                # already advanced far enough, just take the centres
+                result = join(join(c1.se, c2.sw, c4.ne, c5.nw),
+                              join(c2.se, c3.sw, c5.ne, c6.nw),
+                              join(c4.se, c5.sw, c7.ne, c8.nw),
+                              join(c5.se, c6.sw, c8.ne, c9.nw))
+            else:
+                # second half of the 2**(L-2) generations
+                result = join(self.successor(join(c1, c2, c4, c5), j),
+                              self.successor(join(c2, c3, c5, c6), j),
+                              self.successor(join(c4, c5, c7, c8), j),
+                              self.successor(join(c5, c6, c8, c9), j))
+
+        self.cache_put(self.step_cache, key, result)
+        return result
+
+    def jump(self, generations):
+        'Evolve the torus by a number of generations (any non-negative integer)'
+        s = 0
+        while generations >> s:
+            if (generations >> s) & 1:
+                if self.root is not None:
+                    self.jump_tiled(s)
+                else:
+                    self.jump_dense(s)
+            s += 1
+        self.generation += generations
+
+    def peek(self, generations):
+        'Dense lattice after a number of generations, leaving the state unchanged'
+        saved = (self.root, self.lattice, self.generation)
+        self.jump(generations)
+        lattice = self.get_lattice()
+        self.root, self.lattice, self.generation = saved
+        return lattice
+
+    def jump_tiled(self, s):
+        'Advance 2**s generations for N a power of two'
+        level = max(self.level + 2, s + 2)
+        plane = self.root
+        for _ in range(level - self.level):
+            plane = self.join(plane, plane, plane, plane)
+
+        # result covers the plane from 2**(level-2), a multiple of N, so any aligned tile is the torus
+        result = self.successor(plane, s)
+        while result.level > self.level:
+            result = result.nw
+        self.root = result
+
+    def jump_dense(self, s):
+        'Advance 2**s generations for general N: O(N^2 level) node work, see the module docstring'
+        N = self.N
+        level = max(s + 2, int(np.ceil(np.log2(2*N))) + 1)
+
+        # tiled plane, one node per distinct (level, offset mod N)
+        plane_nodes = {}
+        def plane_node(k, oy, ox):
+            key = (k, oy, ox)
+            if key not in plane_nodes:
+                if k == 0:
+                    plane_nodes[key] = ON if self.lattice[oy, ox] == 1 else OFF
+                else:
+                    h = 2**(k-1)
+                    plane_nodes[key] = self.join(plane_node(k-1, oy, ox), plane_node(k-1, oy, (ox+h) % N),
+                                                 plane_node(k-1, (oy+h) % N, ox), plane_node(k-1, (oy+h) % N, (ox+h) % N))
+            return plane_nodes[key]
+
+        result = self.successor(plane_node(level, 0, 0), s)
+
+        # result covers the plane from 2**(level-2); first full tile starts d sites in
+        d = (-2**(level-2)) % N
+        self.lattice = self.to_dense(result, d, d, N)
+
+    ############# CONVERSIONS ############
+
+    def from_dense(self, lattice):
+        'Canonical node for a square 0/1 lattice of power of two size'
+        lattice = (np.asarray(lattice) == 1)
+        level = int(np.log2(len(lattice)))
+
+        # build bottom-up, canonicalising each level with np.unique
+        ids = lattice.astype(np.int64)
+        nodes = [OFF, ON]
+        for _ in range(level):
+            quads = np.stack([ids[0::2, 0::2], ids[0::2, 1::2], ids[1::2, 0::2], ids[1::2, 1::2]], axis=-1)
+            unique, inverse = np.unique(quads.reshape(-1, 4), axis=0, return_inverse=True)
+            nodes = [self.join(nodes[a], nodes[b], nodes[c], nodes[d]) for a, b, c, d in unique]
+            ids = inverse.reshape(quads.shape[:2])
+        return nodes[int(ids[0, 0])]
+
+    def to_dense(self, node, y0=0, x0=0, size=None):
+        'Dense 0/1 uint8 array of the square region of a node starting at (y0, x0)'
+        if size is None:
+            size = 2**node.level
+        out = np.zeros((size, size), dtype=np.uint8)
+
+        def fill(node, y, x):
+            # node covers [y, y + 2**level) x [x, x + 2**level) in node coordinates
+            width = 2**node.level
+            if (node.pop == 0 or y >= y0 + size or x >= x0 + size or
+                    y + width <= y0 or x + width <= x0):
+                return
+            if node.level == 0:
+                out[y - y0, x - x0] = 1
+                return
+            h = width // 2
+            fill(node.nw, y, x)
+            fill(node.ne, y, x + h)
+            fill(node.sw, y + h, x)
+            fill(node.se, y + h, x + h)
+
+        fill(node, 0, 0)
+        return out
+
+    def set_lattice(self, lattice):
+        'Set the state of the torus from a dense lattice'
+        lattice = np.asarray(lattice)
+        self.N = int(len(lattice))
+
+        if is_power_of_two(self.N):
+            self.level = int(np.log2(self.N))
+            self.root = self.from_dense(lattice)
+            self.lattice = None
+        else:
+            self.root = None
+            self.lattice = (lattice == 1).astype(np.uint8)
+
+    def get_lattice(self):
+        'Dense lattice of the current state'
+        if self.root is not None:
+            return self.to_dense(self.root)
+        return self.lattice.copy()
+
+    def count_live(self):
+        if self.root is not None:
+            return self.root.pop
+        return int(np.sum(self.lattice))
+
+if __name__ == '__main__':
+    import GameOfLife_functions as func
+
+    for N in [4, 8, 32, 50, 20, 7]:
+        lattice = func.state_random(N)
+        system = HashLife(lattice)
+        for generations in [1, 2, 3, 5, 8, 13, 100]:
+            for _ in range(generations):
+                lattice = func.update_step(lattice)
+            system.jump(generations)
+            assert np.array_equal(system.get_lattice(), lattice), (N, generations)
+    print('hashlife jumps identical to dense engine')
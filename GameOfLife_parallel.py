@@ -0,0 +1,173 @@
+"""
+Domain-decomposed parallel engine for the Game of Life on very large tori.
+The lattice lives in two shared padded (N+2, N+2) uint8 buffers (current and next), split
+into horizontal row strips, one per worker thread. A worker reads its strip plus the halo
+rows above and below it from the current buffer (the neighbouring strips' edge rows, or
+the periodic images at the top and bottom of the torus), writes its rows of the next
+buffer with preallocated scratch arrays, then fills the halo cells it owns in the next
+buffer: the wrapped columns of its rows, and the wrapped top/bottom row if its strip
+holds row 0 or row N-1. Workers only read current and only write their own part of next,
+so one barrier per generation is the whole synchronisation.
+
+numpy releases the GIL inside the array operations, so threads share the buffers without
+copies and the strips are stepped concurrently; nothing is allocated per generation
+(update_step allocates eight rolled full-size temporaries). The rules are those of
+update_step, and the generations are bit-identical to it. More workers than cores only add
+thread switches and barrier waits (see the gol_parallel_step_<n> cases of BenchmarkSuite).
+
+author: s2229553
+"""
+
+import os
+import threading
+import numpy as np
+
+def strip_bounds(N, n_strips):
+    'Row ranges [(start, stop), ...] of n_strips nearly equal strips'
+    edges = np.linspace(0, N, n_strips + 1).round().astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+def step_strip(padded, padded_new, start, stop, nn_contribution, bool_mask_dead, bool_mask_live):
+    '''
+    New generation of rows start..stop-1 (lattice coordinates) from padded (halo filled),
+    written to padded_new together with the halo cells of these rows. Scratch buffers
+    are (stop-start, N): nn_contribution uint8, the two masks bool.
+    '''
+    N = padded.shape[0] - 2
+    above, rows, below = padded[start:stop], padded[start+1:stop+1], padded[start+2:stop+2]
+
+    # live nn from the shifted views of the three row bands
+    np.add(above[:, :-2], above[:, 1:-1], out=nn_contribution)
+    np.add(nn_contribution, above[:, 2:], out=nn_contribution)
+    np.add(nn_contribution, rows[:, :-2], out=nn_contribution)
+    np.add(nn_contribution, rows[:, 2:], out=nn_contribution)
+    np.add(nn_contribution, below[:, :-2], out=nn_contribution)
+    np.add(nn_contribution, below[:, 1:-1], out=nn_contribution)
+    np.add(nn_contribution, below[:, 2:], out=nn_contribution)
+
+    np.equal(nn_contribution, 3, out=bool_mask_dead) # 3 nn: live whatever the state
+    np.equal(nn_contribution, 2, out=bool_mask_live) # 2 nn: live stays live
+    np.logical_and(bool_mask_live, rows[:, 1:-1], out=bool_mask_live)
+    np.logical_or(bool_mask_dead, bool_mask_live, out=bool_mask_dead)
+
+    new_rows = padded_new[start+1:stop+1]
+    np.copyto(new_rows[:, 1:-1], bool_mask_dead)
+
+    # halo cells owned by this strip: wrapped columns, then the wrapped rows (with corners)
+    new_rows[:, 0] = new_rows[:, -2]
+    new_rows[:, -1] = new_rows[:, 1]
+    if stop == N:
+        padded_new[0] = padded_new[N]
+    if start == 0:
+        padded_new[N+1] = padded_new[1]
+
+class ParallelLife():
+    '''
+    Parallel lattice system on an N x N torus, n_workers row strips (all cores if None)
+    '''
+
+    def __init__(self, lattice, n_workers=None):
+        self.N = int(len(lattice))
+        n_workers = os.cpu_count() if n_workers is None else int(n_workers)
+        self.strips = strip_bounds(self.N, max(1, min(n_workers, self.N)))
+
+        self.buffers = [np.zeros((self.N+2, self.N+2), dtype=np.uint8) for _ in range(2)]
+        self.scratch = [(np.zeros((stop-start, self.N), dtype=np.uint8),
+                         np.zeros((stop-start, self.N), dtype=bool),
+                         np.zeros((stop-start, self.N), dtype=bool)) for start, stop in self.strips]
+        self.set_lattice(lattice)
+
+    def set_lattice(self, lattice):
+        padded = self.buffers[0]
+        padded[1:-1, 1:-1] = (np.asarray(lattice) == 1)
+        padded[0, 1:-1] = padded[-2, 1:-1]
+        padded[-1, 1:-1] = padded[1, 1:-1]
+        padded[:, 0] = padded[:, -2] # full columns, so the corners wrap too
+        padded[:, -1] = padded[:, 1]
+
+    def get_lattice(self):
+        'Copy of the current generation (N, N) uint8'
+        return self.buffers[0][1:-1, 1:-1].copy()
+
+    def evolve(self, generations):
+        'Advance a number of generations in place'
+        if generations <= 0:
+            return
+        if len(self.strips) == 1:
+            for _ in range(generations):
+                step_strip(self.buffers[0], self.buffers[1], 0, self.N, *self.scratch[0])
+                self.buffers.reverse()
+            return
+
+        barrier = threading.Barrier(len(self.strips))
+        errors = []
+
+        def work(k):
+            start, stop = self.strips[k]
+            current, new = self.buffers
+            try:
+                for _ in range(generations):
+                    step_strip(current, new, start, stop, *self.scratch[k])
+                    barrier.wait() # every strip of the generation is written before anyone reads it
+                    current, new = new, current
+            except threading.BrokenBarrierError:
+                pass
+            except Exception as error:
+                errors.append(error)
+                barrier.abort()
+
+        threads = [threading.Thread(target=work, args=(k,)) for k in range(1, len(self.strips))]
+        for thread in threads:
+            thread.start()
+        work(0) # this thread takes the first strip
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        if generations % 2 == 1:
+            self.buffers.reverse()
+
+    def update_step(self):
+        self.evolve(1)
+        return self.buffers[0][1:-1, 1:-1]
+
+    def peek(self):
+        'Copy of the next generation, leaving the state unchanged'
+        self.evolve(1)
+        lattice = self.get_lattice()
+        self.buffers.reverse() # the strips only wrote the other buffer, the current one is intact
+        return lattice
+
+    def count_live(self):
+        return int(np.count_nonzero(self.buffers[0][1:-1, 1:-1]))
+
+if __name__ == '__main__':
+    import time
+    import GameOfLife_functions as func
+
+    # identical generations for odd sizes and more strips than cores
+    for N, n_workers in [(50, 4), (37, 3), (64, 7), (5, 2), (2048, None)]:
+        lattice = func.state_random(N)
+        system = ParallelLife(lattice, n_workers)
+        for generations in [1, 2, 5]:
+            for _ in range(generations):
+                lattice = func.update_step(lattice)
+            system.evolve(generations)
+            assert np.array_equal(system.get_lattice(), lattice)
+        assert np.array_equal(system.peek(), func.update_step(lattice))
+        assert np.array_equal(system.get_lattice(), lattice)
+    print('parallel generations (and peek) identical to dense engine')
+
+    N, generations = 4096, 10
+    lattice = func.state_random(N)
+    start = time.perf_counter()
+    for _ in range(generations):
+        lattice = func.update_step(lattice)
+    t_dense = (time.perf_counter() - start)/generations
+    for n_workers in sorted({1, 2, os.cpu_count()}):
+        system = ParallelLife(func.state_random(N), n_workers)
+        start = time.perf_counter()
+        system.evolve(generations)
+        t_parallel = (time.perf_counter() - start)/generations
+        print(f'N = {N}, {n_workers} workers on {os.cpu_count()} cores: {t_parallel:.3e} s/gen (update_step {t_dense:.3e} s/gen)')
@@ -0,0 +1,215 @@
+"""
+Rule engine for Life-like (outer totalistic) cellular automata on the torus.
+A rule string is compiled once into a lookup table new_state = table[state, live nn],
+so a step is the live neighbour count (eight adds) plus one vectorised gather, whatever
+the rule. Accepted rule strings:
+    Life-like      'B3/S23', 'B36/S23', 'S23/B3', '23/3' (survival/birth)
+    Generations    'B2/S345/C4' (or /G4, or '345/2/4'): states 0 dead, 1 alive,
+                   2..C-1 dying; an alive site that does not survive starts dying, dying
+                   sites age by one each step and die at C, only alive sites count as
+                   neighbours.
+A stack of tables (compile_rules) steps a (R, N, N) stack with a different rule per
+replica in the same gather, for rule-space surveys.
+
+author: s2229553
+"""
+
+import re
+import numpy as np
+import GameOfLife_functions as func
+
+def parse_rule(rule):
+    'Birth counts, survival counts and number of states of a rule string'
+    text = rule.strip().upper().replace(' ', '')
+    bs = re.fullmatch(r'B([0-8]*)/S([0-8]*)(?:/[CG]?(\d+))?', text)
+    sb = re.fullmatch(r'S([0-8]*)/B([0-8]*)(?:/[CG]?(\d+))?', text)
+    numeric = re.fullmatch(r'([0-8]*)/([0-8]*)(?:/(\d+))?', text)
+    if bs:
+        birth, survival, states = bs.groups()
+    elif sb:
+        survival, birth, states = sb.groups()
+    elif numeric:
+        survival, birth, states = numeric.groups()
+    else:
+        raise ValueError(f'Cannot parse rule {rule}, use e.g. B3/S23 or B2/S345/C4')
+
+    n_states = 2 if states is None else int(states)
+    if not 2 <= n_states <= 256:
+        raise ValueError(f'Rule {rule} has {n_states} states, choose 2 to 256')
+    return {int(c) for c in birth}, {int(c) for c in survival}, n_states
+
+class Rule():
+    '''
+    Compiled rule: table (n_states, 9) of new states indexed by state and live nn
+    '''
+
+    def __init__(self, rule='B3/S23'):
+        self.birth, self.survival, self.n_states = parse_rule(rule)
+        self.name = 'B' + ''.join(map(str, sorted(self.birth))) + '/S' + ''.join(map(str, sorted(self.survival)))
+        if self.n_states > 2:
+            self.name += f'/C{self.n_states}'
+
+        self.table = np.zeros((self.n_states, 9), dtype=np.uint8)
+        for count in range(9):
+            self.table[0, count] = 1 if count in self.birth else 0
+            self.table[1, count] = 1 if count in self.survival else (2 % self.n_states)
+        for state in range(2, self.n_states):
+            self.table[state, :] = (state + 1) % self.n_states # dying sites age, then die
+        self.flat_table = self.table.ravel()
+        self.index_dtype = np.uint8 if self.flat_table.size <= 256 else np.uint16
+
+        # two states: the 18 table entries as the bits of one word, gathered by a shift
+        self.bits = None
+        if self.n_states == 2:
+            self.bits = np.uint32(sum(int(new) << index for index, new in enumerate(self.flat_table)))
+
+    def __repr__(self):
+        return f"Rule('{self.name}')"
+
+    def is_life(self):
+        return self.name == 'B3/S23'
+
+    def lookup(self, index, out, scratch=None):
+        '''
+        Gather new states table.ravel()[index] into out (any uint8 array, strided views
+        too); scratch is a uint32 buffer of the shape of index for two state rules
+        '''
+        if self.bits is None:
+            np.take(self.flat_table, index, out=out, mode='clip')
+            return out
+        scratch = np.right_shift(self.bits, index, out=scratch)
+        return np.bitwise_and(scratch, 1, out=out, casting='unsafe')
+
+    def update_step(self, lattice):
+        'Update step (acts on the last two axes, so a stack of lattices works too)'
+        lattice = np.asarray(lattice, dtype=np.uint8)
+        alive = lattice if self.n_states == 2 else (lattice == 1).astype(np.uint8)
+        index = np.multiply(lattice, 9, dtype=self.index_dtype)
+        index += live_neighbours(alive)
+        return self.lookup(index, np.empty(lattice.shape, dtype=np.uint8))
+
+    def update_step_buffered(self, padded, padded_new, nn_contribution, index, scratch=None, alive=None):
+        '''
+        Allocation free update step with the padded (N+2, N+2, uint8) double buffers of
+        GoL_Lattice.step. Scratch buffers: nn_contribution (N, N, uint8), index (N, N,
+        index_dtype), scratch (N, N, uint32) for two state rules, alive (N+2, N+2, bool)
+        for Generations rules (see buffers)
+        '''
+        func.fill_halo(padded)
+        if self.n_states > 2:
+            np.equal(padded, 1, out=alive)
+            source = alive.view(np.uint8)
+        else:
+            source = padded
+
+        np.add(source[:-2, :-2], source[:-2, 1:-1], out=nn_contribution)
+        np.add(nn_contribution, source[:-2, 2:], out=nn_contribution)
+        np.add(nn_contribution, source[1:-1, :-2], out=nn_contribution)
+        np.add(nn_contribution, source[1:-1, 2:], out=nn_contribution)
+        np.add(nn_contribution, source[2:, :-2], out=nn_contribution)
+        np.add(nn_contribution, source[2:, 1:-1], out=nn_contribution)
+        np.add(nn_contribution, source[2:, 2:], out=nn_contribution)
+
+        # one gather: flat table index state*9 + nn (in index_dtype, state*9 overflows uint8 for C > 28)
+        np.multiply(padded[1:-1, 1:-1], 9, out=index, dtype=self.index_dtype)
+        np.add(index, nn_contribution, out=index)
+        self.lookup(index, padded_new[1:-1, 1:-1], scratch)
+
+    def buffers(self, N):
+        'Scratch buffers (nn_contribution, index, scratch, alive) of update_step_buffered'
+        return (np.zeros((N, N), dtype=np.uint8), np.zeros((N, N), dtype=self.index_dtype),
+                np.zeros((N, N), dtype=np.uint32) if self.bits is not None else None,
+                np.zeros((N+2, N+2), dtype=bool) if self.n_states > 2 else None)
+
+def live_neighbours(alive):
+    'Live nn count of every site of a 0/1 lattice (or stack), uint8'
+    alive = alive.astype(np.uint8, copy=False)
+    return (np.roll(alive, 1, axis=-2) + np.roll(alive, -1, axis=-2) +
+            np.roll(alive, 1, axis=-1) + np.roll(alive, -1, axis=-1) +
+            np.roll(alive, (1, 1), axis=(-2, -1)) + np.roll(alive, (1, -1), axis=(-2, -1)) +
+            np.roll(alive, (-1, 1), axis=(-2, -1)) + np.roll(alive, (-1, -1), axis=(-2, -1)))
+
+############### RULE STACKS ################
+
+def compile_rules(rules):
+    'Stacked tables (R, n_states, 9) for a list of rules (strings or Rule), padded to the largest n_states'
+    rules = [rule if isinstance(rule, Rule) else Rule(rule) for rule in rules]
+    n_states = max(rule.n_states for rule in rules)
+    tables = np.zeros((len(rules), n_states, 9), dtype=np.uint8)
+    for r, rule in enumerate(rules):
+        tables[r, :rule.n_states] = rule.table
+    return tables
+
+def update_stack(lattices, tables):
+    'One step of a (R, N, N) stack, replica r under the rule of tables[r] (one gather for all)'
+    n_states = tables.shape[1]
+    index = np.multiply(lattices, 9, dtype=np.int64)
+    index += live_neighbours(lattices == 1)
+    index += (np.arange(len(lattices))*(9*n_states))[:, None, None]
+    return np.take(tables.ravel(), index)
+
+def all_life_like_rules():
+    'All 2^18 Life-like rule strings, in order of the (birth, survival) bit masks'
+    digits = lambda mask: ''.join(str(c) for c in range(9) if mask >> c & 1)
+    return [f'B{digits(b)}/S{digits(s)}' for b in range(512) for s in range(512)]
+
+if __name__ == '__main__':
+    import time
+
+    # B3/S23 through the table against the specialised kernel, single and buffered
+    N = 64
+    lattice = func.state_random(N)
+    rule = Rule('b3/s23')
+    padded = [np.zeros((N+2, N+2), dtype=np.uint8) for _ in range(2)]
+    padded[0][1:-1, 1:-1] = lattice
+    scratch = rule.buffers(N)
+    table_lattice = lattice
+    for _ in range(100):
+        lattice = func.update_step(lattice)
+        table_lattice = rule.update_step(table_lattice)
+        rule.update_step_buffered(padded[0], padded[1], *scratch)
+        padded.reverse()
+        assert np.array_equal(table_lattice, lattice) and np.array_equal(padded[0][1:-1, 1:-1], lattice)
+    print(f'{rule} table engine identical to update_step')
+
+    # Generations: buffered and rolled agree, and the dying states age out (C40: uint16 index)
+    for rule in [Rule('345/2/4'), Rule('B2/S345/C40')]:
+        lattice = func.state_random(N)
+        padded = [np.zeros((N+2, N+2), dtype=np.uint8) for _ in range(2)]
+        padded[0][1:-1, 1:-1] = lattice
+        scratch = rule.buffers(N)
+        for _ in range(100):
+            lattice = rule.update_step(lattice)
+            rule.update_step_buffered(padded[0], padded[1], *scratch)
+            padded.reverse()
+            assert np.array_equal(padded[0][1:-1, 1:-1], lattice)
+        ages = np.full((8, 8), 29, dtype=np.uint8)
+        assert rule.n_states < 30 or np.all(rule.update_step(ages) == 30) # dying state 29 ages to 30
+        print(f'{rule}: {np.count_nonzero(lattice == 1)} live, {np.count_nonzero(lattice > 1)} dying sites after 100 steps')
+
+    # a stack of different rules against one rule at a time
+    rules = ['B3/S23', 'B36/S23', 'B2/S', 'B3678/S34678', 'B2/S345/C4']
+    lattices = func.state_random(N, replicas=len(rules))
+    stepped = update_stack(lattices, compile_rules(rules))
+    for r, name in enumerate(rules):
+        assert np.array_equal(stepped[r], Rule(name).update_step(lattices[r]))
+    print('rule stack identical to single rules')
+
+    # timing of the buffered steps: specialised B3/S23 kernel against compiled rules
+    N, generations = 1024, 20
+    padded = [np.zeros((N+2, N+2), dtype=np.uint8) for _ in range(2)]
+    padded[0][1:-1, 1:-1] = func.state_random(N)
+    masks = np.zeros((N, N), dtype=np.uint8), np.zeros((N, N), dtype=bool), np.zeros((N, N), dtype=bool)
+    start = time.perf_counter()
+    for _ in range(generations):
+        func.update_step_buffered(padded[0], padded[1], *masks)
+        padded.reverse()
+    print(f'update_step_buffered: {(time.perf_counter() - start)/generations:.3e} s/gen at N = {N}')
+    for name in ['B3/S23', 'B36/S23', 'B2/S345/C4']:
+        rule = Rule(name)
+        scratch = rule.buffers(N)
+        start = time.perf_counter()
+        for _ in range(generations):
+            rule.update_step_buffered(padded[0], padded[1], *scratch)
+            padded.reverse()
+        print(f'{rule}: {(time.perf_counter() - start)/generations:.3e} s/gen at N = {N}')
@@ -0,0 +1,321 @@
+"""
+Tracking of many objects (gliders, spaceships, debris) on the torus, for velocity
+measurements on soups without the boundary restriction of compute_com.
+
+    - label_sites / label_components: connected components (8 nn by default) of the live
+      sites, across the periodic boundary. Works on the live sites and the edges between
+      live nn only: the roots of the two ends of every edge are hooked (larger onto
+      smaller) and flattened by pointer jumping, a few rounds even for large soups.
+      The site -> index map is a padded buffer kept per N, of which only the entries
+      set by a call are reset, so nothing of size N^2 is allocated per frame. Measured
+      on a 1024^2 soup (~60k live sites, ~10k objects): find_objects ~33 ms (it was
+      ~57 ms with a fresh index array, np.nonzero and per-site trig), about 10-30 steps
+      of the dense engine (1-3 ms each), so label every few generations (Tracker's
+      every) in long soups.
+    - centres_of_mass: per component, the circular mean of the positions (angle 2 pi x / N)
+      gives a reference inside the object; the sites are unwrapped around it (minimum
+      image) and averaged, which is exact for objects smaller than N/2 wherever they sit.
+    - link: mutual nearest neighbours between two frames (minimum image distance, at most
+      max_distance), vectorised over all objects; candidate pairs come from a grid of
+      cells of side max_distance, so thousands of objects are linked in O(n).
+    - Tracker: labels every k-th generation (callback for GoL_Lattice.run), links the
+      objects to the open tracks and keeps unwrapped positions, so trajectories cross the
+      boundary continuously; velocities are least squares slopes of position against step.
+
+    import GameOfLife_tracking as tracking
+    tracker = tracking.Tracker(N, every=4)
+    system.run(400, callback=tracker.callback)
+    tracks, n_frames, velocity = tracker.velocities(min_frames=10)
+
+author: s2229553
+"""
+
+import numpy as np
+import GameOfLife_functions as func
+
+MOORE = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+VON_NEUMANN = ((-1, 0), (0, -1), (0, 1), (1, 0))
+
+############### LABELLING ################
+
+# site number of every live site (-1 elsewhere) in a padded (N+2, N+2) array, one per
+# lattice size; the halo holds the periodic images, so nn are at fixed flat offsets
+index_buffers = {}
+
+def label_sites(ys, xs, N, connectivity=8):
+    '''
+    Component of every live site (ys, xs) on the N x N torus: returns the component index
+    of each site (0..n-1, in order of the first site of each component) and n
+    '''
+    offsets = MOORE if connectivity == 8 else VON_NEUMANN
+    n_sites = len(ys)
+    if n_sites == 0:
+        return np.zeros(0, dtype=np.intp), 0
+
+    if N not in index_buffers:
+        index_buffers[N] = np.full((N+2, N+2), -1, dtype=np.int32)
+    index = index_buffers[N]
+    flat_index = index.ravel()
+    positions = (np.asarray(ys) + 1)*(N+2) + np.asarray(xs) + 1
+    flat_index[positions] = np.arange(n_sites)
+    func.fill_halo(index)
+
+    # edges between live nn, each pair once (forward half of the offsets)
+    a, b = [], []
+    for dy, dx in offsets[len(offsets)//2:]:
+        nn = flat_index[positions + (dy*(N+2) + dx)]
+        a.append(np.flatnonzero(nn >= 0))
+        b.append(nn[nn >= 0])
+    a, b = np.concatenate(a), np.concatenate(b)
+
+    # back to all -1 for the next call: the sites set here and the halo
+    flat_index[positions] = -1
+    index[0, :], index[-1, :], index[:, 0], index[:, -1] = -1, -1, -1, -1
+
+    # every label is the root of a tree of sites of one component (labels[root] == root);
+    # the larger root of every edge joining two trees is hooked onto the smaller one, then
+    # the trees are flattened by pointer jumping, until no edge joins two trees
+    labels = np.arange(n_sites)
+    while len(a):
+        root_a, root_b = labels[a], labels[b]
+        joining = root_a != root_b
+        a, b, root_a, root_b = a[joining], b[joining], root_a[joining], root_b[joining]
+        np.minimum.at(labels, np.maximum(root_a, root_b), np.minimum(root_a, root_b))
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+
+    # every root is the smallest site of its tree, so numbering the roots in order numbers
+    # the components in order of their first site
+    roots = labels == np.arange(n_sites)
+    component = (np.cumsum(roots) - 1)[labels]
+    return component, int(np.count_nonzero(roots))
+
+def live_sites(lattice):
+    'Coordinates (ys, xs) of the live sites of a 0/1 lattice'
+    lattice = np.asarray(lattice)
+    values = lattice.ravel()
+    live = np.flatnonzero(values)
+    if len(live) and values[live].max() > 1:
+        raise ValueError('Tracking needs a two state (0/1) lattice, not a Generations rule with dying states')
+    return np.divmod(live, lattice.shape[1])
+
+def label_components(lattice, connectivity=8):
+    'Labelled lattice (0 dead, 1..n for the components of live sites) and n'
+    lattice = np.asarray(lattice)
+    ys, xs = live_sites(lattice)
+    component, n = label_sites(ys, xs, len(lattice), connectivity)
+    labels = np.zeros(lattice.shape, dtype=np.int32)
+    labels[ys, xs] = component + 1
+    return labels, n
+
+############### CENTRES OF MASS ################
+
+def minimum_image(displacement, N):
+    'Displacement on the torus wrapped to [-N/2, N/2)'
+    return (displacement + N/2) % N - N/2
+
+def centres_of_mass(ys, xs, component, n, N):
+    '''
+    Centre of mass (x, y) in [0, N) and mass of every component of the live sites (ys, xs)
+    (integers), correct across the periodic boundary; returns (n, 2) float and (n,) int arrays
+    '''
+    mass = np.bincount(component, minlength=n)
+    com = np.zeros((n, 2))
+    angle = 2*np.pi*np.arange(N)/N # sites are integers: sin and cos looked up, not computed per site
+    sin, cos = np.sin(angle), np.cos(angle)
+    for axis, positions in enumerate((xs, ys)):
+        # circular mean as reference, then the unwrapped mean around it
+        reference = N*np.arctan2(np.bincount(component, sin[positions], n),
+                                 np.bincount(component, cos[positions], n))/(2*np.pi)
+        offset = minimum_image(positions - reference[component], N)
+        com[:, axis] = (reference + np.bincount(component, offset, n)/np.maximum(mass, 1)) % N
+    return com, mass
+
+def find_objects(lattice, connectivity=8):
+    'Centres of mass (n, 2) as (x, y) and masses (n,) of the connected objects of a lattice'
+    lattice = np.asarray(lattice)
+    ys, xs = live_sites(lattice)
+    component, n = label_sites(ys, xs, len(lattice), connectivity)
+    return centres_of_mass(ys, xs, component, n, len(lattice))
+
+############### LINKING ################
+
+def candidate_pairs(com_previous, com_current, N, max_distance):
+    '''
+    All pairs (i, j) of previous and current objects in the same or adjacent cells of a
+    grid with cells of at least max_distance, i.e. every pair that can be that close
+    '''
+    n_cells = max(1, int(N // max(max_distance, 1.)))
+    size = N/n_cells
+    cells_previous = (com_previous // size).astype(np.intp) % n_cells
+    cells_current = (com_current // size).astype(np.intp) % n_cells
+    keys = cells_current[:, 1]*n_cells + cells_current[:, 0]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    previous, current = [], []
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            cell = ((cells_previous[:, 1] + dy) % n_cells)*n_cells + (cells_previous[:, 0] + dx) % n_cells
+            lo = np.searchsorted(sorted_keys, cell, side='left')
+            counts = np.searchsorted(sorted_keys, cell, side='right') - lo
+            first = np.repeat(np.cumsum(counts) - counts, counts)
+            previous.append(np.repeat(np.arange(len(com_previous)), counts))
+            current.append(order[np.repeat(lo, counts) + np.arange(counts.sum()) - first])
+
+    # with fewer than 3 cells per axis the same cell is reached from several offsets
+    pairs = np.unique(np.concatenate(previous)*len(com_current) + np.concatenate(current))
+    return pairs // len(com_current), pairs % len(com_current)
+
+def link(com_previous, com_current, N, max_distance):
+    '''
+    Pairs (i, j) of objects of the previous and current frames that are each other's
+    nearest neighbour within max_distance (minimum image); returns two index arrays
+    '''
+    if len(com_previous) == 0 or len(com_current) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+
+    previous, current = candidate_pairs(com_previous, com_current, N, max_distance)
+    displacement = minimum_image(com_current[current] - com_previous[previous], N)
+    distance = np.hypot(displacement[:, 0], displacement[:, 1])
+    close = distance <= max_distance
+    previous, current, distance = previous[close], current[close], distance[close]
+
+    # nearest pair of every previous and of every current object, kept when it is the same pair
+    nearest = nearest_pair(previous, distance) & nearest_pair(current, distance)
+    return previous[nearest], current[nearest]
+
+def nearest_pair(objects, distance):
+    'Mask of the pairs that are the closest pair of their object'
+    order = np.lexsort((distance, objects))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = objects[order][1:] != objects[order][:-1]
+    mask = np.zeros(len(distance), dtype=bool)
+    mask[order[first]] = True
+    return mask
+
+class Tracker():
+    '''
+    Trajectories of the objects of a GoL run on an N x N torus, recorded every `every`
+    generations; an object further than max_distance from every open track starts a new
+    track, a track without a match is closed
+    '''
+
+    def __init__(self, N, every=1, max_distance=None, connectivity=8):
+        self.N = int(N)
+        self.every = int(every)
+        # spaceships move at most c/2 per generation; leave some room for the phase changes
+        self.max_distance = 0.5*self.every + 2. if max_distance is None else float(max_distance)
+        self.connectivity = connectivity
+
+        self.n_tracks = 0
+        self.open_tracks = np.zeros(0, dtype=np.intp)
+        self.open_com = np.zeros((0, 2))       # last wrapped centres of the open tracks
+        self.open_unwrapped = np.zeros((0, 2)) # and their unwrapped positions
+        self.observations = [] # per frame: (track, step, x, y, mass) columns
+
+    def update(self, step, lattice):
+        'Label the lattice of generation step and extend the tracks; returns the number of objects'
+        com, mass = find_objects(lattice, self.connectivity)
+        previous, current = link(self.open_com, com, self.N, self.max_distance)
+
+        tracks = np.empty(len(com), dtype=np.intp)
+        unwrapped = com.copy()
+        tracks[current] = self.open_tracks[previous]
+        unwrapped[current] = self.open_unwrapped[previous] + minimum_image(com[current] - self.open_com[previous], self.N)
+
+        new = np.ones(len(com), dtype=bool)
+        new[current] = False
+        tracks[new] = self.n_tracks + np.arange(np.count_nonzero(new))
+        self.n_tracks += int(np.count_nonzero(new))
+
+        self.open_tracks, self.open_com, self.open_unwrapped = tracks, com, unwrapped
+        self.observations.append(np.column_stack([tracks, np.full(len(com), step), unwrapped, mass]))
+        return len(com)
+
+    def callback(self, step, system):
+        'callback(step, system) for GoL_Lattice.run'
+        if step % self.every == 0:
+            self.update(step, system.lattice)
+
+    def table(self):
+        'All observations (n, 5): track, step, unwrapped x, unwrapped y, mass; sorted by track then step'
+        if not self.observations:
+            return np.zeros((0, 5))
+        table = np.concatenate(self.observations)
+        return table[np.lexsort((table[:, 1], table[:, 0]))]
+
+    def trajectories(self, min_frames=2):
+        'Dictionary track -> (n, 4) array of step, unwrapped x, unwrapped y, mass'
+        table = self.table()
+        tracks, starts, counts = np.unique(table[:, 0].astype(np.intp), return_index=True, return_counts=True)
+        return {int(track): table[start:start + count, 1:]
+                for track, start, count in zip(tracks, starts, counts) if count >= min_frames}
+
+    def velocities(self, min_frames=2):
+        '''
+        Least squares velocity (vx, vy) in sites per generation of every track seen in at
+        least min_frames frames; returns track ids, frame counts and the (n, 2) velocities
+        '''
+        table = self.table()
+        tracks, track_index, counts = np.unique(table[:, 0].astype(np.intp), return_inverse=True, return_counts=True)
+        n = len(tracks)
+        steps = table[:, 1]
+
+        # slope = cov(step, position)/var(step), all tracks at once
+        mean_step = np.bincount(track_index, steps, n)/counts
+        centred = steps - mean_step[track_index]
+        var_step = np.bincount(track_index, centred**2, n)
+        velocity = np.column_stack([np.bincount(track_index, centred*table[:, axis], n) for axis in (2, 3)])
+        velocity /= np.where(var_step > 0, var_step, np.nan)[:, None]
+
+        keep = counts >= max(min_frames, 2)
+        return tracks[keep], counts[keep], velocity[keep]
+
+if __name__ == '__main__':
+    import time
+    import GameOfLife_functions as func
+    from GameOfLife_class import GoL_Lattice
+
+    # components across the boundary: a glider split over the four corners is one object
+    N = 20
+    glider = np.roll(func.state_glider(N), (-9, -9), axis=(0, 1))
+    labels, n = label_components(glider)
+    com, mass = find_objects(glider)
+    print(f'glider over the corners: {n} component, mass {mass[0]}, centre {com[0]}')
+    assert n == 1 and mass[0] == 5
+
+    # centres against compute_com for a glider away from the edges, at every shift
+    lattice = func.state_glider(N)
+    reference = func.compute_com(lattice)
+    for shift in range(N):
+        com, _ = find_objects(np.roll(lattice, (shift, shift), axis=(0, 1)))
+        assert np.allclose(com[0], (reference + shift) % N)
+    print('centre of mass identical to compute_com at every periodic shift')
+
+    # several gliders crossing the boundary many times: velocity c/4 on both axes
+    N = 64
+    lattice = np.zeros((N, N), dtype=np.uint8)
+    for y, x in [(5, 5), (5, 35), (35, 5), (35, 35), (20, 50)]:
+        lattice += np.roll(func.state_glider(N), (y - 8, x - 8), axis=(0, 1))
+    system = GoL_Lattice(lattice)
+    tracker = Tracker(N, every=4)
+    system.run(1024, callback=tracker.callback)
+    tracks, n_frames, velocity = tracker.velocities(min_frames=10)
+    print(f'{len(tracks)} tracks over {n_frames.max()} frames, velocities {np.unique(velocity.round(6), axis=0)}')
+    assert len(tracks) == 5 and np.allclose(np.abs(velocity), 0.25)
+
+    # a soup: labelling cost against stepping cost
+    N = 1024
+    system = GoL_Lattice(func.state_random(N))
+    system.evolve(500)
+    start = time.perf_counter()
+    com, mass = find_objects(system.lattice)
+    t_track = time.perf_counter() - start
+    start = time.perf_counter()
+    system.step()
+    t_step = time.perf_counter() - start
+    print(f'N = {N}: {len(com)} objects labelled in {t_track:.3e} s (one generation {t_step:.3e} s)')
@@ -0,0 +1,154 @@
+"""
+Instrumentation for long simulation runs: per-phase timers, counters and periodic progress
+records, plus opt-in profiling of single parameter points.
+
+An Instrument is handed to the lattice classes, engines and drivers, which time their
+phases (stepping, measurement, I/O) and count what they did (sweeps, attempts, accepted
+flips, generations). Whenever its progress counter (unit) advances and at least interval
+seconds have passed since the last record, a JSON line is appended to the progress file
+(stdout if no path) with throughput, ETA and the time split over the phases:
+
+    {"name": "p1=0.5", "time": "...", "elapsed": 31.2, "unit": "sweeps", "done": 812,
+     "total": 1100, "rate": 26.0, "eta": 11.1, "throughput": {"attempts": 65000.0, ...},
+     "phases": {"sweep": 29.9, "measure": 0.4}, "counters": {...}, "final": false}
+
+Workers of the SIRS runner write to the same progress file (each record is a single
+append); their summaries come back with their results and are merged into the driver's.
+    % tail -f measurements/progress.jsonl
+
+author: s2229553
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+class Instrument():
+    '''
+    Timers and counters of one run (or one parameter point); unit is the counter whose
+    progress towards total is reported, e.g. 'sweeps', 'generations' or 'points'
+    '''
+
+    def __init__(self, name, total=None, unit=None, path=None, interval=30.):
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.path = path
+        self.interval = interval
+        self.timers = {} # seconds per phase
+        self.counters = {}
+        self.start = time.perf_counter()
+        self.last_record = self.start
+
+    @contextmanager
+    def phase(self, name):
+        'Time the enclosed block as part of a phase'
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] = self.timers.get(name, 0.) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        'Increase a counter; a progress record is due if it is the unit and interval has passed'
+        self.counters[name] = self.counters.get(name, 0) + n
+        if name == self.unit and time.perf_counter() - self.last_record >= self.interval:
+            self.record()
+
+    def merge(self, summary):
+        'Add the timers and counters of another instrument (e.g. from a worker)'
+        for key, value in summary["phases"].items():
+            self.timers[key] = self.timers.get(key, 0.) + value
+        for key, value in summary["counters"].items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def summary(self):
+        'Plain dict of the timers and counters (picklable, JSON serialisable)'
+        return {"name": self.name, "elapsed": time.perf_counter() - self.start,
+                "phases": dict(self.timers), "counters": dict(self.counters)}
+
+    ############### PROGRESS ################
+
+    def record(self, final=False):
+        'Write a progress record now'
+        now = time.perf_counter()
+        self.last_record = now
+        elapsed = now - self.start
+        done = self.counters.get(self.unit, 0)
+        rate = done/elapsed if elapsed > 0 else 0.
+        eta = (self.total - done)/rate if (self.total is not None and rate > 0) else None
+
+        record = {"name": self.name, "time": time.strftime('%Y-%m-%dT%H:%M:%S'), "elapsed": elapsed,
+                  "unit": self.unit, "done": done, "total": self.total, "rate": rate, "eta": eta,
+                  "throughput": {key: value/elapsed for key, value in self.counters.items()} if elapsed > 0 else {},
+                  "phases": dict(self.timers), "counters": dict(self.counters), "final": final}
+        line = json.dumps(record) + '\n'
+        if self.path is None:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+        else:
+            with open(self.path, 'a') as f: # one write per record, so concurrent workers do not interleave
+                f.write(line)
+        return record
+
+    def report(self):
+        'Final record plus a human readable summary of where the time went'
+        record = self.record(final=True)
+        print(f'{self.name}: {record["elapsed"]:.1f} s')
+        for key, value in sorted(self.timers.items(), key=lambda item: -item[1]):
+            print(f'    {key:<12} {value:>10.2f} s')
+        for key, value in self.counters.items():
+            print(f'    {key:<12} {value:>10} ({value/record["elapsed"]:.4g} /s)' if record["elapsed"] > 0 else f'    {key:<12} {value:>10}')
+        return record
+
+# helpers for code where the instrument is optional (None)
+
+def phase(instrument, name):
+    'instrument.phase(name), or a no-op context without an instrument'
+    return nullcontext() if instrument is None else instrument.phase(name)
+
+def count(instrument, name, n=1):
+    'instrument.count(name, n), nothing without an instrument'
+    if instrument is not None:
+        instrument.count(name, n)
+
+############### PROFILING ################
+
+def profile_call(function, profile_dir, label, *args, memory=True, top=25):
+    '''
+    Run function(*args) under cProfile (and tracemalloc if memory); writes
+    <label>.prof (for pstats or snakeviz) and <label>.memory.txt (peak and the top
+    allocation sites) to profile_dir. Module level, so the runner can send it to workers.
+    '''
+    os.makedirs(profile_dir, exist_ok=True)
+    profiler = cProfile.Profile()
+    if memory:
+        tracemalloc.start()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        profiler.dump_stats(os.path.join(profile_dir, f'{label}.prof'))
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(os.path.join(profile_dir, f'{label}.memory.txt'), 'w') as f:
+                f.write(f'current {current/2**20:.2f} MiB, peak {peak/2**20:.2f} MiB\n')
+                for stat in snapshot.statistics('lineno')[:top]:
+                    f.write(f'{stat}\n')
+
+if __name__ == '__main__':
+    # fake run of 50 sweeps with two phases, a record every 0.1 s
+    instrument = Instrument('demo', total=50, unit='sweeps', interval=0.1)
+    for _ in range(50):
+        with instrument.phase('sweep'):
+            time.sleep(0.005)
+        with instrument.phase('measure'):
+            time.sleep(0.001)
+        instrument.count('attempts', 2500)
+        instrument.count('sweeps')
+    instrument.report()
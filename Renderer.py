@@ -0,0 +1,247 @@
+"""
+Fast rendering of GoL_Lattice and SIRS_Lattice runs, live or headless.
+
+Lattices are turned into RGB through a small lookup table (the SIRS colours of the
+notebooks: infected black, susceptible red, recovered blue, immune grey), written into
+a preallocated buffer and scaled up by an integer factor without interpolation.
+
+    - LiveView creates the image and the population line once and then only calls
+      set_data, blitting the two axes when the backend supports it (TkAgg does). The
+      simulation runs at full speed and a frame is only drawn when it is due for the
+      target fps; the steps in between are skipped on screen (still counted in the plot).
+    - export / write_video run headless: RGB frames are piped straight to ffmpeg, which
+      writes MP4 (libx264) or GIF (palette from the frames), without matplotlib.
+
+    import Renderer
+    Renderer.LiveView(system, args=(p1, p2, p3), fps=30).run(1000)       # SIRS, TkAgg
+    Renderer.export(system, 'glider.mp4', 500, scale=8)                 # GoL, headless
+    Renderer.write_video((lattice for _, lattice in trajectory.iter_frames()), 'sirs', 'run.gif')
+
+author: s2229553
+"""
+
+import time
+import subprocess
+import numpy as np
+from GameOfLife_class import GoL_Lattice
+from SIRS_class import SIRS_Lattice
+
+# RGB per state, indexed by state + OFFSET[model]
+COLOURS = {
+    "gol": np.array([[33, 145, 140],    # dead: viridis middle, as imshow with vmin=-1, vmax=1
+                     [253, 231, 37]],   # live: viridis top
+                    dtype=np.uint8),
+    "sirs": np.array([[0, 0, 0],        # infected (-1): black
+                      [255, 0, 0],      # susceptible (0): red
+                      [0, 0, 255],      # recovered (1): blue
+                      [128, 128, 128]], # immune (2): grey
+                     dtype=np.uint8),
+}
+OFFSET = {"gol": 0, "sirs": 1}
+
+def model_of(system):
+    'gol for a GoL_Lattice, sirs for a SIRS_Lattice'
+    if isinstance(system, GoL_Lattice):
+        return 'gol'
+    if isinstance(system, SIRS_Lattice):
+        return 'sirs'
+    raise TypeError(f'Cannot render a {type(system).__name__}, pass a GoL_Lattice or SIRS_Lattice')
+
+class RGBBuffer():
+    '''
+    Preallocated (N*scale, N*scale, 3) uint8 image of a lattice
+    '''
+
+    def __init__(self, N, model, scale=1):
+        self.N = N
+        self.scale = int(scale)
+        self.table = COLOURS[model]
+        self.offset = OFFSET[model]
+        self.index = np.zeros((N, N), dtype=np.intp)
+        self.rgb = np.zeros((N, N, 3), dtype=np.uint8)
+        self.image = np.zeros((N*self.scale, N*self.scale, 3), dtype=np.uint8)
+
+    def render(self, lattice):
+        'RGB image of the lattice (the buffer itself, overwritten by the next call)'
+        np.add(lattice, self.offset, out=self.index, casting='unsafe')
+        if self.index.max() >= len(self.table) or self.index.min() < 0:
+            raise ValueError('States outside the colour table of the model (Generations rules with dying states are not supported)')
+        np.take(self.table, self.index, axis=0, out=self.rgb)
+        if self.scale == 1:
+            return self.rgb
+
+        # nearest neighbour upscaling through a broadcast view of the image
+        s = self.scale
+        self.image.reshape(self.N, s, self.N, s, 3)[...] = self.rgb[:, None, :, None, :]
+        return self.image
+
+############### HEADLESS ################
+
+class VideoWriter():
+    '''
+    Pipe of raw RGB frames into ffmpeg; the format follows the extension (.mp4 or .gif)
+    '''
+
+    def __init__(self, path, width, height, fps=25, ffmpeg='ffmpeg'):
+        self.shape = (height, width, 3)
+        command = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                   '-s', f'{width}x{height}', '-r', str(fps), '-i', '-']
+        if path.endswith('.gif'):
+            command += ['-vf', 'split[a][b];[a]palettegen[p];[b][p]paletteuse', path]
+        elif path.endswith('.mp4'):
+            # yuv420p for players, which needs even sizes
+            command += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-c:v', 'libx264', '-pix_fmt', 'yuv420p', path]
+        else:
+            raise ValueError(f'Unknown video format {path}, use .mp4 or .gif')
+
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        except FileNotFoundError:
+            raise FileNotFoundError(f'{ffmpeg} not found; install ffmpeg for headless export') from None
+
+    def write(self, rgb):
+        if rgb.shape != self.shape:
+            raise ValueError(f'Frame of shape {rgb.shape}, expected {self.shape}')
+        self.process.stdin.write(np.ascontiguousarray(rgb).data)
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f'ffmpeg exited with status {self.process.returncode}')
+
+    def abort(self):
+        'Stop ffmpeg after an error, without waiting for it to finish the file'
+        try:
+            self.process.stdin.close()
+        except OSError: # ffmpeg already gone (broken pipe)
+            pass
+        self.process.kill()
+        self.process.wait()
+
+def write_video(frames, model, path, fps=25, scale=4, ffmpeg='ffmpeg'):
+    '''
+    Write an iterable of lattices (e.g. from TrajectoryReader.iter_frames) to a video;
+    returns the frame count. ffmpeg is killed if producing or rendering a frame fails.
+    '''
+    writer = None
+    n_frames = 0
+    try:
+        for lattice in frames:
+            if writer is None:
+                buffer = RGBBuffer(len(lattice), model, scale)
+                writer = VideoWriter(path, buffer.image.shape[1], buffer.image.shape[0], fps, ffmpeg)
+            writer.write(buffer.render(lattice))
+            n_frames += 1
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is not None:
+        writer.close()
+    return n_frames
+
+def export(system, path, n_frames, args=(), every=1, fps=25, scale=4, ffmpeg='ffmpeg'):
+    '''
+    Headless video of a GoL_Lattice or SIRS_Lattice: the initial lattice, then one frame
+    every `every` steps; args are passed to system.step (p1, p2, p3 for SIRS)
+    '''
+    def frames():
+        yield system.lattice
+        for _ in range(n_frames - 1):
+            for _ in range(every):
+                system.step(*args)
+            yield system.lattice
+    return write_video(frames(), model_of(system), path, fps, scale, ffmpeg)
+
+############### LIVE ################
+
+class LiveView():
+    '''
+    Live animation of a GoL_Lattice or SIRS_Lattice with its population next to it
+    (live sites, or S, I and R), at most fps frames per second
+    '''
+
+    def __init__(self, system, args=(), fps=25, title=None):
+        import matplotlib.pyplot as plt # only needed for live display
+
+        self.system = system
+        self.args = args
+        self.model = model_of(system)
+        self.interval = 1/fps
+        self.buffer = RGBBuffer(system.N, self.model)
+
+        self.fig, (self.ax1, self.ax2) = plt.subplots(1, 2, figsize=(10, 4))
+        self.im = self.ax1.imshow(self.buffer.render(system.lattice), interpolation='nearest', animated=True)
+        self.ax1.set_title(title or ('Game of Life Animation' if self.model == 'gol' else 'SIRS Animation'))
+
+        labels = [('live', 'k-')] if self.model == 'gol' else [('S', 'r-'), ('I', 'k-'), ('R', 'b-')]
+        self.lines = [self.ax2.plot([], [], style, label=label, animated=True)[0] for label, style in labels]
+        self.ax2.legend(loc='upper right')
+        self.ax2.set_xlabel('Iterations')
+        self.ax2.set_ylabel('Number of sites')
+        self.ax2.set_ylim(0, system.N**2)
+
+        self.history = [[] for _ in self.lines]
+        self.steps = []
+        self.background = None
+        self.fig.canvas.mpl_connect('draw_event', self.on_draw)
+        plt.show(block=False)
+
+    def on_draw(self, event):
+        'Full redraw (resize, new limits): keep the static background for blitting'
+        if self.fig.canvas.supports_blit:
+            self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        self.fig.draw_artist(self.im)
+        for line in self.lines:
+            self.fig.draw_artist(line)
+
+    def populations(self):
+        if self.model == 'gol':
+            return [self.system.count_live()]
+        return list(self.system.count_states())
+
+    def draw(self):
+        self.im.set_data(self.buffer.render(self.system.lattice))
+        for line, history in zip(self.lines, self.history):
+            line.set_data(self.steps, history)
+
+        if self.steps[-1] > self.ax2.get_xlim()[1]: # rescale rarely, by doubling
+            self.ax2.set_xlim(0, 2*self.steps[-1])
+            self.fig.canvas.draw()
+        elif self.background is not None:
+            self.fig.canvas.restore_region(self.background)
+            self.draw_artists()
+            self.fig.canvas.blit(self.fig.bbox)
+        else:
+            self.fig.canvas.draw_idle()
+        self.fig.canvas.flush_events()
+
+    def run(self, n_steps):
+        'Step the system n_steps times, drawing a frame whenever one is due'
+        self.ax2.set_xlim(0, max(n_steps, 1))
+        self.fig.canvas.draw()
+        next_frame = time.perf_counter()
+        for i in range(n_steps):
+            self.system.step(*self.args)
+            self.steps.append(len(self.steps))
+            for history, value in zip(self.history, self.populations()):
+                history.append(value)
+
+            now = time.perf_counter()
+            if now >= next_frame or i == n_steps - 1:
+                self.draw()
+                next_frame = max(next_frame + self.interval, now) # frames skipped when behind never bunch up
+        return self.system
+
+if __name__ == '__main__':
+    # lookup table rendering against a direct colour assignment
+    import SIRS_functions as sirs
+    lattice = sirs.random_init_immune_generator(sirs.random_lattice(20), 0.2)
+    image = RGBBuffer(20, 'sirs', scale=3).render(lattice)
+    for state, colour in zip([-1, 0, 1, 2], COLOURS["sirs"]):
+        assert np.all(image[::3, ::3][lattice == state] == colour)
+        assert np.all(image[2::3, 1::3][lattice == state] == colour)
+    print('RGB rendering matches the SIRS colour table')
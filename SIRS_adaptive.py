@@ -0,0 +1,173 @@
+"""
+Adaptive run length for SIRS measurements. Instead of a fixed number of sweeps with a
+fixed 100 sweep burn-in, a run is extended, and assessed at lengths chunk, 2 chunk,
+4 chunk, ... (so the O(n) assessments cost O(n) in total), until
+    - the infected count is 0 (absorbing state, the run ends on that sweep),
+    - or the equilibration point found by MSER-5 is in the first half of the run and the
+      error of the observable, from the integrated autocorrelation time, is below the target,
+    - or max_sweeps is reached (result flagged as not converged).
+
+Observables are on the scale used by the drivers: <I> as a fraction of N^2, var(I)/N^2.
+The infected counts are kept in an int64 array of max_sweeps preallocated per run.
+
+author: s2229553
+"""
+
+import math
+import numpy as np
+import SIRS_ensemble as ensemble
+import SIRS_resampling as resampling
+import Instrumentation as instrumentation
+
+def mser_burn_in(series, batch_size=5):
+    '''
+    MSER truncation point (in sweeps): the d minimising the squared standard error of the
+    batch means kept, sum_{j>=d} (z_j - mean)^2 / (n_b - d)^2, from suffix sums in O(n)
+    '''
+    n_batches = len(series)//batch_size
+    if n_batches < 2:
+        return 0
+    z = np.asarray(series[:n_batches*batch_size], dtype=np.float64).reshape(n_batches, batch_size).mean(axis=1)
+
+    kept = np.arange(n_batches, 0, -1) # batches kept when truncating the first d
+    suffix = np.cumsum(z[::-1])[::-1]
+    suffix_squared = np.cumsum((z**2)[::-1])[::-1]
+    mser = (suffix_squared - suffix**2/kept)/kept**2
+
+    return int(np.argmin(mser[:-1]))*batch_size
+
+def integrated_autocorrelation_time(series, c=5):
+    '''
+    tau_int = 1/2 + sum_t rho(t) with Sokal's window (smallest M with M >= c tau_int(M));
+    the variance of the mean is 2 tau_int var/n
+    '''
+    x = np.asarray(series, dtype=np.float64)
+    n = len(x)
+    x = x - np.mean(x)
+    if n < 2 or not np.any(x):
+        return 0.5
+
+    # autocorrelation through the FFT, zero padded against wrap around
+    f = np.fft.rfft(x, n=2*n)
+    acf = np.fft.irfft(f*np.conj(f))[:n]
+    rho = acf/acf[0]
+
+    taus = 0.5 + np.cumsum(rho[1:])
+    window = np.arange(1, n) >= c*taus
+    if not np.any(window):
+        return float(taus[-1])
+    return float(taus[np.argmax(window)])
+
+def assess(I_counts, N, target_error, observable='mean', min_sweeps=200):
+    '''
+    Estimates from the infected counts of one run; returns (done, result) where result
+    holds I_average, I_squared_average, I_variance, sigma (error of observable),
+    block_length (of the jackknife of the variance), burn_in, tau, n_sweeps and absorbed
+    '''
+    n = len(I_counts)
+    if n and I_counts[-1] == 0:
+        n = int(np.argmax(np.asarray(I_counts) == 0)) + 1 # sweeps after the first I = 0 were wasted
+        return True, {"I_average": 0., "I_squared_average": 0., "I_variance": 0., "sigma": 0., "block_length": 1,
+                      "burn_in": n, "tau": 0.5, "n_sweeps": n, "absorbed": True}
+
+    x = np.asarray(I_counts, dtype=np.float64)/(N**2)
+    burn_in = mser_burn_in(x)
+    y = x[burn_in:]
+    tau = integrated_autocorrelation_time(y)
+
+    block_length = max(1, math.ceil(2*tau))
+    result = {"I_average": np.mean(y), "I_squared_average": np.mean(y**2),
+              "I_variance": np.var(y)*(N**2), "sigma": np.inf, "block_length": block_length,
+              "burn_in": burn_in, "tau": tau, "n_sweeps": n, "absorbed": False}
+
+    if observable == 'mean':
+        result["sigma"] = np.sqrt(2*tau*np.var(y)/len(y))
+    elif observable == 'variance':
+        if len(y) >= 2*block_length: # blocked jackknife with blocks of about 2 tau
+            result["sigma"] = resampling.jackknife(y, 'variance', block_length)*(N**2)
+    else:
+        raise ValueError(f"Unknown observable {observable}, choose 'mean' or 'variance'")
+
+    equilibrated = burn_in <= n//2
+    done = bool(n >= min_sweeps and equilibrated and result["sigma"] <= target_error)
+    return done, result
+
+def next_assessment(n, chunk, max_sweeps):
+    'Run length of the assessment after n sweeps: chunk, then doubling, capped at max_sweeps'
+    return min(max(chunk, 2*n), max_sweeps)
+
+def run_adaptive(system, p1, p2, p3, max_sweeps, target_error, observable='mean', chunk=100, min_sweeps=200):
+    '''
+    Sweep an SIRS_Lattice, assessing at run lengths chunk, 2 chunk, 4 chunk, ... until
+    assess is satisfied, I = 0 or max_sweeps is reached (assess is timed as the measure
+    phase of the lattice's instrument, if any)
+    '''
+    I_counts = np.zeros(max_sweeps, dtype=np.int64)
+    n = 0
+    done, result = False, None
+    while n < max_sweeps:
+        counts = system.sweep(next_assessment(n, chunk, max_sweeps) - n, p1, p2, p3, stop_absorbed=True)
+        I_counts[n:n+len(counts)] = counts
+        n += len(counts)
+        with instrumentation.phase(system.instrument, 'measure'):
+            done, result = assess(I_counts[:n], system.N, target_error, observable, min_sweeps)
+        if done:
+            break
+
+    result["converged"] = done
+    return result
+
+def run_adaptive_batch(lattices, p1, p2, p3, max_sweeps, target_error, observable='mean', chunk=100, min_sweeps=200,
+                       generator=None, common=False, instrument=None):
+    '''
+    Adaptive runs for a (P, N, N) stack advanced in lockstep (SIRS_ensemble.sweep_batch,
+    with its generator and common arguments), assessed at the run lengths of run_adaptive;
+    a replica reaching I = 0 stops the stack on that sweep, and finished replicas are
+    dropped from the stack. Returns one result dict per replica. instrument (optional)
+    gets the sweep and measure times, the sweeps of the stack and the attempts summed
+    over the replicas.
+    '''
+    P, N = lattices.shape[0], lattices.shape[-1]
+    p1, p2, p3 = [np.broadcast_to(np.asarray(p, dtype=float), (P,)) for p in (p1, p2, p3)]
+
+    I_counts = np.zeros((P, max_sweeps), dtype=np.int64)
+    results = [None]*P
+    active = np.arange(P)
+    stack = lattices.copy()
+    n_done = 0
+    while len(active) and n_done < max_sweeps:
+        assessment = next_assessment(n_done, chunk, max_sweeps)
+        with instrumentation.phase(instrument, 'sweep'):
+            counts = ensemble.sweep_batch(stack, assessment - n_done, p1[active], p2[active], p3[active],
+                                          generator=generator, common=common, stop_absorbed=True)
+        n = counts.shape[1]
+        I_counts[active, n_done:n_done+n] = counts
+        n_done += n
+        instrumentation.count(instrument, 'attempts', n*len(active)*N**2)
+        instrumentation.count(instrument, 'sweeps', n)
+
+        keep = []
+        with instrumentation.phase(instrument, 'measure'):
+            for row, i in enumerate(active):
+                if n_done < assessment and counts[row, -1] != 0: # stopped early by another replica
+                    keep.append(row)
+                    continue
+                done, results[i] = assess(I_counts[i, :n_done], N, target_error, observable, min_sweeps)
+                results[i]["converged"] = done
+                if not done:
+                    keep.append(row)
+
+        lattices[active] = stack
+        active, stack = active[keep], stack[keep]
+    return results
+
+if __name__ == '__main__':
+    # AR(1) series with a known tau_int = (1 + phi)/(2 (1 - phi)) after a drifting start
+    rng = np.random.default_rng()
+    phi = 0.9
+    x = np.zeros(20000)
+    x[0] = 50.
+    for t in range(1, len(x)):
+        x[t] = phi*x[t-1] + rng.normal()
+    burn_in = mser_burn_in(x)
+    print(f'MSER burn-in: {burn_in}, tau_int: {integrated_autocorrelation_time(x[burn_in:]):.2f} (exact {(1 + phi)/(2*(1 - phi)):.2f})')
@@ -0,0 +1,71 @@
+"""
+Comparison of the checkerboard (sublattice parallel) SIRS update against the exact random
+sequential dynamics, for the absorbing, wave and dynamic equilibrium parameter sets.
+
+The two dynamics are not the same process: a sequential sweep makes N^2 random attempts
+(some sites are tried several times, about 1/e of them not at all) while a checkerboard
+sweep updates every site exactly once. Stationary averages are close away from the
+transitions, but the time scales differ, and so do quantities that depend on them
+(wave periods, variance near the absorbing boundary). Use the checkerboard mode for
+coarse phase diagram scans only.
+
+Results at N = 50, 1100 sweeps (100 burn-in), one run each (var(I) is computed on the
+infected counts as in SIRS_simulation):
+
+    parameters    mode           <I>/N^2   var(I)/N^2   time [s]
+    absorbing     sequential       0.000        0.000       1.14
+                  checkerboard     0.000        0.000       0.45
+    wave          sequential       0.067        1.308       1.48
+                  checkerboard     0.071        3.052       0.48
+    dynamiceq     sequential       0.411        0.323       1.43
+                  checkerboard     0.414        0.412       0.59
+
+Both modes reach the absorbing state and agree on <I> to a few percent; the variance
+differs (by a factor ~2 run to run in the wave regime, which is noisy in either mode).
+Timings are against the fast sequential kernel; against the original per-attempt loop
+the checkerboard sweep is ~300x faster at N = 50 and the gap grows with N.
+
+author: s2229553
+"""
+
+import sys
+import time
+import numpy as np
+import SIRS_functions as func
+from SIRS_class import SIRS_Lattice
+
+def main():
+    # Read inputs from command lines
+    if len(sys.argv) != 3 :
+        print("You left out the number of sweeps when running.")
+        print("In command line, run like this instead:")
+        print(f"% python {sys.argv[0]} <iterations> <N>")
+        print("For example:")
+        print("% python SIRS_checkerboard_comparison.py 1100 50")
+        sys.exit(1)
+    else:
+        iterations = int(sys.argv[1])
+        N = int(sys.argv[2])
+
+    parameter_sets = {'absorbing': SIRS_Lattice.set_initialisation_absorbing(),
+                      'wave': SIRS_Lattice.set_initialisation_wave(),
+                      'dynamiceq': SIRS_Lattice.set_initialisation_dynamiceq()}
+
+    print(f'{"parameters":<12} {"mode":<13} {"<I>/N^2":>9} {"var(I)/N^2":>11} {"time [s]":>9}')
+    for name, (p1, p2, p3) in parameter_sets.items():
+        lattice = func.random_lattice(N)
+
+        for mode in ['sequential', 'checkerboard']:
+            system = SIRS_Lattice(lattice) # same initial lattice for both modes
+
+            start = time.perf_counter()
+            I_count_array = system.sweep(iterations, p1, p2, p3, mode=mode)
+            elapsed = time.perf_counter() - start
+
+            I_average = system.get_I_average(I_count_array/(N**2))
+            I_var = system.get_I_variance(I_count_array)
+
+            print(f'{name:<12} {mode:<13} {I_average:>9.3f} {I_var:>11.3f} {elapsed:>9.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -6,20 +6,134 @@ author: S2229553
 
 import numpy as np
 import SIRS_functions as func
+import SIRS_resampling as resampling
+from SIRS_statistics import RunningStats
+from SIRS_kmc import KineticSIRS
+
+ENGINES = ('lattice', 'kmc')
 
 class SIRS_Lattice():
     '''
     Lattice system
+
+    engine='lattice' runs the sweeps on the lattice array (original engine),
+    engine='kmc' runs the sequential dynamics with the rejection-free kinetic Monte Carlo
+    engine (SIRS_kmc), count_states is then O(1). self.lattice is brought up to date after
+    every step/sweep; edit it through the class methods (or call self.kmc.set_lattice) so
+    the engine stays in sync.
+
+    The sequential sweeps of the lattice engine keep the states in a flat list
+    (self.sites_flat) from one call to the next, and the lattice array is only rebuilt
+    from it when self.lattice is read; run(), sweep() and count_states() do not read it,
+    step() does (it returns the lattice).
+
+    generator is the numpy Generator for every random draw of this lattice (see
+    RandomStreams); the SIRS_functions module rng if None.
+
+    instrument (an Instrumentation.Instrument, optional) gets the time spent sweeping and
+    measuring and the sweeps, attempts and accepted flips (not counted by the checkerboard).
     '''
 
-    def __init__(self, lattice):
-        self.lattice = np.array(lattice)
+    def __init__(self, lattice, engine='lattice', generator=None, instrument=None):
+        if engine not in ENGINES:
+            raise ValueError(f'Unknown engine {engine}, choose from {ENGINES}')
+
+        self.sites_flat = None # flat list of the states while sweeping, see the lattice property
+        self.lattice = np.array(lattice, dtype=np.int8)
         self.N = int(len(lattice))
+        self.engine = engine
+        self.generator = func.rng if generator is None else generator
+        self.kmc = KineticSIRS(self.lattice, self.generator) if engine == 'kmc' else None
+        self.stats = None # online statistics of the infected count, see reset_statistics
+        self.instrument = instrument
+
+    @property
+    def lattice(self):
+        '''
+        The lattice array, rebuilt from the flat list of the sequential sweeps if they ran
+        since the last read. The caller may then write to it, so the list is dropped and
+        rebuilt from the array by the next sweep.
+        '''
+        if self.sites_flat is not None:
+            self._lattice[...] = np.array(self.sites_flat, dtype=np.int8).reshape(self.N, self.N)
+            self.sites_flat = None
+        return self._lattice
+
+    @lattice.setter
+    def lattice(self, lattice):
+        self._lattice = lattice
+        self.sites_flat = None
 
     def update_step(self, site, p1, p2, p3):
-        return func.update_step(self.lattice, site, p1, p2, p3)
+        return func.update_step(self.lattice, site, p1, p2, p3, self.generator)
+    
+    def step(self, p1, p2, p3):
+        '''
+        One sweep (N^2 random sequential attempts) applied in place to the lattice;
+        returns the lattice itself, not a copy. Random sequential updates act on the current
+        state, so a single buffer is enough. Returning the lattice rebuilds it from the flat
+        list of the sweeps (an O(N^2) copy); loops that do not need it should call sweep(1).
+        '''
+        self.sweep(1, p1, p2, p3)
+        return self.lattice
+    
+    def sweep(self, n_sweeps, p1, p2, p3, mode='sequential', stop_absorbed=False):
+        '''
+        Run n_sweeps sweeps in place; returns the infected count after each sweep.
+        mode='sequential' is the exact random sequential dynamics (fast kernel),
+        mode='checkerboard' updates the two sublattices with whole-array operations
+        (approximate dynamics, see SIRS_checkerboard_comparison.py).
+        stop_absorbed stops after the first sweep with I = 0 (fewer counts are returned).
+        '''
+        if self.instrument is None:
+            I_count_array = self.sweep_engine(n_sweeps, p1, p2, p3, mode, stop_absorbed=stop_absorbed)
+            if self.stats is not None:
+                self.stats.update_series(I_count_array)
+            return I_count_array
+
+        counters = self.instrument.counters
+        with self.instrument.phase('sweep'):
+            I_count_array = self.sweep_engine(n_sweeps, p1, p2, p3, mode, counters, stop_absorbed)
+        if self.stats is not None:
+            with self.instrument.phase('measure'):
+                self.stats.update_series(I_count_array)
+        self.instrument.count('attempts', len(I_count_array)*self.N**2)
+        self.instrument.count('sweeps', len(I_count_array))
+        return I_count_array
+
+    def sweep_engine(self, n_sweeps, p1, p2, p3, mode='sequential', counters=None, stop_absorbed=False):
+        'Sweeps on the selected engine; the accepted flips are added to counters if given'
+        if self.engine == 'kmc':
+            if mode != 'sequential':
+                raise ValueError(f"The kmc engine runs the sequential dynamics only, got mode {mode}")
+            n_events = self.kmc.n_events
+            I_count_array = self.kmc.sweep(n_sweeps, p1, p2, p3, stop_absorbed=stop_absorbed)
+            self.lattice[...] = self.kmc.get_lattice()
+            if counters is not None:
+                counters['accepted'] = counters.get('accepted', 0) + self.kmc.n_events - n_events
+        elif mode == 'checkerboard':
+            I_count_array = func.sweep_checkerboard(self.lattice, n_sweeps, p1, p2, p3, self.generator, stop_absorbed)
+        elif mode == 'sequential':
+            if self.sites_flat is None:
+                self.sites_flat = self._lattice.ravel().tolist()
+            I_count_array = func.sweep_flat(self.sites_flat, self.N, n_sweeps, p1, p2, p3, self.generator, counters, stop_absorbed)
+        else:
+            raise ValueError(f"Unknown mode {mode}, choose 'sequential' or 'checkerboard'")
+        return I_count_array
+    
+    def run(self, n_steps, p1, p2, p3, callback=None):
+        'Run n_steps sweeps in place, calling callback(sweep, system) after each one'
+        for i in range(n_steps):
+            self.sweep(1, p1, p2, p3)
+            if callback is not None:
+                callback(i, self)
+        return self.lattice
     
     def count_states(self):
+        if self.engine == 'kmc':
+            return self.kmc.count_states()
+        if self.sites_flat is not None: # counted on the list of the sweeps, no rebuild
+            return self.sites_flat.count(0), self.sites_flat.count(-1), self.sites_flat.count(1)
         return func.count_states(self.lattice)
     
     def get_I_fraction(self):
@@ -38,11 +152,31 @@ class SIRS_Lattice():
     def get_I_variance(self, I_data):
         return (self.get_I_squared_average(I_data) - (self.get_I_average(I_data))**2)/(self.N**2)
     
-    def get_errorbar(self, I_data):
-        return func.resampling(self.get_I_variance(I_data), I_data, self.N)
+    def get_errorbar(self, I_data, observable='variance', method='jackknife', block_length=1, n_resamples=1000):
+        '''
+        Error bar of the variance (per site, as get_I_variance) or of the mean (as
+        get_I_average) of I_data after the burn-in; method is 'jackknife' or 'bootstrap',
+        with blocks of block_length sweeps to account for autocorrelation
+        '''
+        kwargs = {'n_resamples': n_resamples, 'generator': self.generator} if method == 'bootstrap' else {}
+        sigma = resampling.errorbar(I_data[100:], observable, method, block_length, **kwargs)
+        if observable == 'variance':
+            return sigma/(self.N**2)
+        return sigma
+    
+    def reset_statistics(self, burn_in=100, block_length=1, max_blocks=1024):
+        '''
+        Start online statistics of the infected count: every following step/sweep/run
+        updates self.stats (a RunningStats), so the time series need not be stored
+        '''
+        self.stats = RunningStats(burn_in, block_length, max_blocks)
+        return self.stats
     
     def get_lattice_immune(self, frac_imm):
-        return func.random_init_immune_generator(self.lattice, frac_imm)
+        func.random_init_immune_generator(self.lattice, frac_imm, self.generator)
+        if self.engine == 'kmc':
+            self.kmc.set_lattice(self.lattice)
+        return self.lattice
     
     ########## INITIALISATIONS ########
 
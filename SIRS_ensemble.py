@@ -0,0 +1,117 @@
+"""
+Batched SIRS engine: a (P, N, N) stack of replicas, each with its own (p1, p2, p3), is
+advanced in lockstep. Every random sequential attempt is applied to all replicas at once
+(one site and one uniform per replica, through a transition lookup table), so a whole
+parameter grid costs about as many numpy calls as a single lattice. Immune sites (2)
+map to themselves in the table. Lattices must be a signed integer type (int8 is used
+by SIRS_Lattice).
+
+With common=True all replicas share the same random numbers (same site and uniform for
+every attempt), i.e. common random numbers across the parameter points of the stack.
+
+author: s2229553
+"""
+
+import numpy as np
+import SIRS_functions as func
+
+def sweep_batch(lattices, n_sweeps, p1, p2, p3, mode='sequential', generator=None, common=False, stop_absorbed=False):
+    '''
+    Run n_sweeps sweeps in place on a (P, N, N) stack; p1, p2, p3 are scalars or arrays
+    of length P. Returns the infected counts after each sweep, shape (P, n_sweeps).
+    mode='checkerboard' uses the sublattice parallel update instead (see SIRS_functions).
+    generator is a numpy Generator (the SIRS_functions rng if None).
+    stop_absorbed stops the whole stack after the first sweep where a replica has I = 0
+    (fewer columns are returned), so the caller can drop it.
+    '''
+    generator = func.rng if generator is None else generator
+    P, N = lattices.shape[0], lattices.shape[-1]
+    p1, p2, p3 = [np.broadcast_to(np.asarray(p, dtype=float), (P,)) for p in (p1, p2, p3)]
+    n_streams = 1 if common else P # columns of random numbers, broadcast over the replicas
+
+    if mode == 'checkerboard':
+        return sweep_batch_checkerboard(lattices, n_sweeps, p1, p2, p3, generator, common, stop_absorbed)
+    if mode != 'sequential':
+        raise ValueError(f"Unknown mode {mode}, choose 'sequential' or 'checkerboard'")
+
+    n_sites = N*N
+    nn = np.array(func.neighbour_table(N)).T.copy() # (4, N^2)
+    offsets = np.arange(P) * n_sites # start of each replica in the flat stack
+    sites_flat = lattices.reshape(-1) # view, updates go straight to the lattices
+    table = transition_table(lattices.dtype)
+
+    I_counts = np.zeros((P, n_sweeps), dtype=np.int64)
+    for sweep_i in range(n_sweeps):
+        # draw the whole sweep in bulk: one site and one uniform per replica per attempt
+        sites = generator.integers(n_sites, size=(n_sites, n_streams))
+        uniforms = generator.random((n_sites, n_streams))
+
+        index = sites + offsets
+        nn_index = np.empty((n_sites, 4, P), dtype=np.int64)
+        for q in range(4):
+            np.add(nn[q][sites], offsets, out=nn_index[:, q])
+        accept = ((uniforms < p1)*4 + (uniforms < p2)*8 + (uniforms < p3)*16 + 1).astype(lattices.dtype)
+
+        for k in range(n_sites):
+            key = sites_flat[index[k]] + accept[k]
+            # infected (-1) is the only negative state, so OR of the neighbours is negative iff one is infected
+            key += (np.bitwise_or.reduce(sites_flat[nn_index[k]]) < 0) * key.dtype.type(32)
+            sites_flat[index[k]] = table[key]
+
+        I_counts[:, sweep_i] = np.sum(lattices == -1, axis=(1, 2))
+        if stop_absorbed and not np.all(I_counts[:, sweep_i]):
+            return I_counts[:, :sweep_i+1]
+    return I_counts
+
+def transition_table(dtype):
+    '''
+    New state for every key = (state + 1) + 4*(u < p1) + 8*(u < p2) + 16*(u < p3)
+    + 32*(infected neighbour), with the rules of SIRS_functions.update_step
+    '''
+    table = np.zeros(64, dtype=dtype)
+    for key in range(64):
+        state = key % 4 - 1
+        accept_1, accept_2, accept_3 = (key >> 2) & 1, (key >> 3) & 1, (key >> 4) & 1
+        infected_nn = key >> 5
+
+        table[key] = state
+        if state == 0 and accept_1 and infected_nn: # susceptible site
+            table[key] = -1
+        if state == -1 and accept_2: # infected site
+            table[key] = 1
+        if state == 1 and accept_3: # recovered site
+            table[key] = 0
+    return table
+
+def sweep_batch_checkerboard(lattices, n_sweeps, p1, p2, p3, generator=None, common=False, stop_absorbed=False):
+    'Checkerboard sweeps on a (P, N, N) stack; returns infected counts (P, n_sweeps)'
+    generator = func.rng if generator is None else generator
+    P, N = lattices.shape[0], lattices.shape[-1]
+    masks = func.checkerboard_masks(N)
+    p1, p2, p3 = [p[:, None, None] for p in (p1, p2, p3)]
+
+    I_counts = np.zeros((P, n_sweeps), dtype=np.int64)
+    for sweep_i in range(n_sweeps):
+        for colour in generator.permutation(2):
+            mask = masks[colour]
+            p = generator.random((1,) + lattices.shape[1:] if common else lattices.shape)
+
+            infected = (lattices == -1)
+            infected_nn = (np.roll(infected, 1, axis=1) | np.roll(infected, -1, axis=1) |
+                           np.roll(infected, 1, axis=2) | np.roll(infected, -1, axis=2))
+
+            s_to_i = mask & (lattices == 0) & infected_nn & (p < p1)
+            i_to_r = mask & infected & (p < p2)
+            r_to_s = mask & (lattices == 1) & (p < p3)
+
+            lattices[s_to_i] = -1
+            lattices[i_to_r] = 1
+            lattices[r_to_s] = 0
+
+        I_counts[:, sweep_i] = np.sum(lattices == -1, axis=(1, 2))
+        if stop_absorbed and not np.all(I_counts[:, sweep_i]):
+            return I_counts[:, :sweep_i+1]
+    return I_counts
+
+if __name__ == '__main__':
+    print(__name__)
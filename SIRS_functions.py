@@ -6,15 +6,17 @@ author: s2229553
 
 import numpy as np
 from numpy import random
+import SIRS_resampling as resampling_module
 
 # random number generator; don't remove!
 rng = random.default_rng()
 
-def update_step(lattice, site, p1, p2, p3):
-    'Update step for SIRS'
+def update_step(lattice, site, p1, p2, p3, generator=None):
+    'Update step for SIRS (generator: numpy Generator, the module rng if None)'
+    generator = rng if generator is None else generator
     n = len(lattice)
 
-    p = rng.random()
+    p = generator.random()
     bool_test = False
     site_i, site_j = site
     state_of_site = lattice[site_i][site_j]
@@ -42,6 +44,130 @@ def update_step(lattice, site, p1, p2, p3):
 
     return bool_test, [site_i,site_j], state_of_site
 
+# flat indices of the four neighbours of every site, one table per lattice size
+neighbour_tables = {}
+
+def neighbour_table(N):
+    'List of (down, up, right, left) flat neighbour indices for every site of an N x N torus'
+    if N not in neighbour_tables:
+        index = np.arange(N*N).reshape(N, N)
+        table = np.stack([np.roll(index, -1, axis=0).ravel(), np.roll(index, 1, axis=0).ravel(),
+                          np.roll(index, -1, axis=1).ravel(), np.roll(index, 1, axis=1).ravel()], axis=1)
+        neighbour_tables[N] = [tuple(row) for row in table.tolist()]
+    return neighbour_tables[N]
+
+def sweep(lattice, n_sweeps, p1, p2, p3, generator=None, counters=None, stop_absorbed=False):
+    '''
+    Random sequential SIRS sweeps (N^2 attempts each) applied in place to the lattice;
+    returns the infected count after each sweep. The lattice is copied to a flat list for
+    sweep_flat and back, two O(N^2) copies per call: to run many short calls on the same
+    lattice, keep the list between them (as SIRS_Lattice does) and call sweep_flat.
+    '''
+    N = len(lattice)
+    sites_flat = lattice.ravel().tolist()
+    I_counts = sweep_flat(sites_flat, N, n_sweeps, p1, p2, p3, generator, counters, stop_absorbed)
+    lattice[...] = np.array(sites_flat, dtype=lattice.dtype).reshape(N, N)
+    return I_counts
+
+def sweep_flat(sites_flat, N, n_sweeps, p1, p2, p3, generator=None, counters=None, stop_absorbed=False):
+    '''
+    Random sequential SIRS sweeps of an N x N lattice held as a flat list of states,
+    modified in place. Sites and uniforms are drawn in bulk once per sweep and the attempts
+    run in a tight loop over the list, with the same transition rules as update_step.
+    Immune sites (value 2) are sampled but never change. Returns the infected count after
+    each sweep. If given, counters['accepted'] is increased by the number of accepted flips.
+    stop_absorbed ends the run after the first sweep with no infected site (I = 0 is
+    absorbing), the counts are then shorter than n_sweeps.
+    '''
+    generator = rng if generator is None else generator
+    n_sites = N*N
+    nn = neighbour_table(N)
+    infected = sites_flat.count(-1)
+    accepted = 0
+
+    I_counts = np.zeros(n_sweeps, dtype=np.int64)
+    for sweep_i in range(n_sweeps):
+        sites = generator.integers(n_sites, size=n_sites).tolist()
+        uniforms = generator.random(n_sites).tolist()
+
+        for k, p in zip(sites, uniforms):
+            state = sites_flat[k]
+            if state == 0: # susceptible site
+                if p < p1:
+                    a, b, c, d = nn[k]
+                    if sites_flat[a] == -1 or sites_flat[b] == -1 or sites_flat[c] == -1 or sites_flat[d] == -1:
+                        sites_flat[k] = -1
+                        infected += 1
+                        accepted += 1
+            elif state == -1: # infected site
+                if p < p2:
+                    sites_flat[k] = 1
+                    infected -= 1
+                    accepted += 1
+            elif state == 1: # recovered site
+                if p < p3:
+                    sites_flat[k] = 0
+                    accepted += 1
+
+        I_counts[sweep_i] = infected
+        if stop_absorbed and infected == 0:
+            I_counts = I_counts[:sweep_i+1]
+            break
+
+    if counters is not None:
+        counters['accepted'] = counters.get('accepted', 0) + accepted
+    return I_counts
+
+def checkerboard_masks(N):
+    'Boolean masks of the two checkerboard sublattices'
+    parity = np.add.outer(np.arange(N), np.arange(N)) % 2
+    return np.array([parity == 0, parity == 1])
+
+def update_checkerboard(lattice, p1, p2, p3, masks=None, generator=None):
+    '''
+    One checkerboard sweep applied in place: the two sublattices are updated in random
+    order, each with whole-array boolean masks. Neighbours of a site are all on the other
+    sublattice (for even N), so every site sees the state left by the previous sub-sweep.
+    Immune sites (value 2) never match any transition.
+    '''
+    generator = rng if generator is None else generator
+    N = len(lattice)
+    if masks is None:
+        masks = checkerboard_masks(N)
+
+    for colour in generator.permutation(2):
+        mask = masks[colour]
+        p = generator.random((N, N))
+
+        infected = (lattice == -1)
+        infected_nn = (np.roll(infected, 1, axis=0) | np.roll(infected, -1, axis=0) |
+                       np.roll(infected, 1, axis=1) | np.roll(infected, -1, axis=1)) # check neighbours for infection
+
+        s_to_i = mask & (lattice == 0) & infected_nn & (p < p1)
+        i_to_r = mask & infected & (p < p2)
+        r_to_s = mask & (lattice == 1) & (p < p3)
+
+        lattice[s_to_i] = -1
+        lattice[i_to_r] = 1
+        lattice[r_to_s] = 0
+
+def sweep_checkerboard(lattice, n_sweeps, p1, p2, p3, generator=None, stop_absorbed=False):
+    'Checkerboard sweeps applied in place; returns the infected count after each sweep (stop_absorbed as sweep)'
+    masks = checkerboard_masks(len(lattice))
+    I_counts = np.zeros(n_sweeps, dtype=np.int64)
+    for sweep_i in range(n_sweeps):
+        update_checkerboard(lattice, p1, p2, p3, masks, generator)
+        I_counts[sweep_i] = np.sum(lattice == -1)
+        if stop_absorbed and I_counts[sweep_i] == 0:
+            return I_counts[:sweep_i+1]
+    return I_counts
+
+def random_lattice(N, generator=None, replicas=None):
+    'Random initialisation: S, I and R with equal probability (a (replicas, N, N) stack if given)'
+    generator = rng if generator is None else generator
+    shape = (N,N) if replicas is None else (replicas,N,N)
+    return generator.integers(low=-1, high=2, size=shape).astype(np.int8)
+
 def count_states(lattice):
     'Count number of sites for different states'
     susceptible = np.sum(lattice == 0)
@@ -49,12 +175,13 @@ def count_states(lattice):
     recovered = np.sum(lattice == 1)
     return susceptible, infected, recovered
 
-def random_init_immune_generator(lattice, frac_imm):
+def random_init_immune_generator(lattice, frac_imm, generator=None):
     'Randomly generate sites with immunisation'
+    generator = rng if generator is None else generator
     N = len(lattice)
 
     immune_count = int((N**2) * frac_imm)
-    sites_immune = random.choice(N**2, immune_count, replace=False) # randomly choose sites with immunisation
+    sites_immune = generator.choice(N**2, immune_count, replace=False) # randomly choose sites with immunisation
     lattice.ravel()[sites_immune] = 2 # setting immune sites to take value 2
 
     return lattice
@@ -69,28 +196,10 @@ def average_infection_squared(data_I):
     'Calculate average infected sites squared'
     return np.mean(data_I[100:]**2)
 
-# to do (jacknife resampling)
-def resampling(I_var, data_I, N):
-    'Returns the error bars for the variance plot (jacknife)'
+def resampling(data_I, N):
+    'Returns the error bars for the variance plot (jacknife, O(n) via SIRS_resampling)'
     # remove initial 100 data
-    data_I = data_I[100:]
-
-    n_resampling = len(data_I) - 1
-
-    var_list = []
-    for i in range(n_resampling):
-        I_resampled = np.delete(data_I, i)
-
-        mean_I = np.mean(I_resampled)
-        mean_squared_I = np.mean(I_resampled**2)
-
-        var_i = (mean_squared_I - mean_I**2)/(N**2)
-        var_list.append(var_i)
-
-    var_array  = np.array(var_list)
-
-    sigma_var = np.sqrt(np.sum((var_array - I_var)**2))
-    return sigma_var
+    return resampling_module.jackknife(data_I[100:], 'variance')/(N**2)
 
 if __name__ == "__main__":
     print(__name__)
\ No newline at end of file
@@ -2,27 +2,192 @@
 Running a set of simulations to calculate the average infection wrt
 immune fraction.
 
+With 'threshold' in place of the resolution, the herd immunity threshold (the immune
+fraction where <I> drops below a tolerance) is found instead by noisy bisection, for
+several (p1, p2, p3) triples: at the midpoint of the bracket, replicas are added until
+the mean <I> is on one side of the tolerance by z standard errors, or max_replicas is
+reached (the midpoint is within the noise of the threshold, and the sign of the mean is
+followed). The confidence interval is bounded by the confidently decided midpoints.
+The triples are the grid of 'threshold:<p1,...>:<p2,...>:<p3,...>' (plain 'threshold':
+p1 in 0.5, 0.7, 0.9, p2 = 0.5, p3 in 0.3, 0.5, 0.8), and a target error makes every
+evaluation an adaptive run, as for the resolution scan.
+
 author: s2229553
 """
 
+import os
 import sys
+from functools import partial
 import numpy as np
-from numpy import random
+import RandomStreams as streams
+import Instrumentation as instrumentation
 from SIRS_class import SIRS_Lattice
+import SIRS_functions as func
+import SIRS_runner as runner
+import SIRS_adaptive as adaptive
+from ChunkedOutput import ChunkedOutput
+
+THRESHOLD_GRID = ([0.5, 0.7, 0.9], [0.5], [0.3, 0.5, 0.8]) # p1, p2, p3 values of plain 'threshold'
+
+def threshold_triples(spec):
+    'The (p1, p2, p3) grid of a threshold argument: threshold or threshold:<p1,...>:<p2,...>:<p3,...>'
+    fields = spec.split(':')
+    if fields[0] != 'threshold' or len(fields) not in (1, 4):
+        raise ValueError(f'Cannot parse {spec}, use threshold or threshold:<p1,...>:<p2,...>:<p3,...>')
+    values = THRESHOLD_GRID if len(fields) == 1 else [[float(p) for p in field.split(',')] for field in fields[1:]]
+    return np.array([[p1, p2, p3] for p1 in values[0] for p2 in values[1] for p3 in values[2]])
+
+def simulate_point(frac_im, seed, N, n_step, p1, p2, p3, target_error=None, progress_path=None):
+    '''
+    Simulate one immune fraction; returns its observables. With a target error on <I>,
+    n_step is the maximum and the run stops on its own (see SIRS_adaptive).
+    Progress records go to progress_path (stdout if None).
+    '''
+    generator = streams.generator(seed) # own stream for this point
+    instrument = instrumentation.Instrument(f'im_frac={frac_im}', total=n_step, unit='sweeps', path=progress_path)
+
+    print(f'Simulating with immune fraction: {frac_im}')
+    # initialisation step
+    lattice = func.random_lattice(N, generator) # randomly initialise lattice
+    # few effective attempts at high immune fractions: the rejection-free engine skips the rest
+    system = SIRS_Lattice(lattice, engine='kmc' if frac_im >= 0.25 else 'lattice', generator=generator,
+                          instrument=instrument)
+
+    # promote some sites to be immune
+    system.get_lattice_immune(frac_im)
+
+    if target_error is not None:
+        result = adaptive.run_adaptive(system, p1, p2, p3, n_step, target_error, 'mean')
+        I_average = result["I_average"]
+        n_sweeps = result["n_sweeps"]
+        print(f'Stopped after {n_sweeps} sweeps (burn-in {result["burn_in"]}, tau {result["tau"]:.1f})')
+    else:
+        # infected count accumulated online after every sweep
+        system.reset_statistics()
+        system.run(n_step, p1, p2, p3)
+
+        I_average = system.stats.get_mean()/(N**2)
+        n_sweeps = n_step
+
+    print(f'Average Infection (Fraction): {I_average} \n')
+
+    return {"I_average": I_average, "n_sweeps": n_sweeps, "instrumentation": instrument.summary()}
+
+def find_threshold(triple, seed, N, n_step, tolerance=1e-3, target_width=0.01,
+                   min_replicas=2, max_replicas=8, z=2., target_error=None, progress_path=None):
+    '''
+    Noisy bisection on the immune fraction for one (p1, p2, p3); returns the threshold,
+    its confidence interval and every evaluation (adaptive runs with a target error)
+    '''
+    p1, p2, p3 = triple
+    instrument = instrumentation.Instrument(f'p1, p2, p3 = {p1}, {p2}, {p3}', unit='evaluations', path=progress_path)
+    low, high = 0., 1. # bisection bracket
+    ci_low, ci_high = 0., 1. # fractions decided with confidence on either side
+    fractions, I_values = [], []
+    seeds = iter(streams.spawn_seeds(seed, int(np.ceil(np.log2(1/target_width)))*max_replicas))
+
+    while high - low > target_width:
+        frac_im = (low + high)/2
+        I_mid = []
+        while True:
+            result = simulate_point(frac_im, next(seeds), N, n_step, p1, p2, p3, target_error, progress_path)
+            instrument.merge(result["instrumentation"])
+            instrument.count('evaluations')
+            I_mid.append(result["I_average"])
+            mean = np.mean(I_mid)
+            sigma = np.std(I_mid, ddof=1)/np.sqrt(len(I_mid)) if len(I_mid) > 1 else np.inf
+            decided = len(I_mid) >= min_replicas and abs(mean - tolerance) > z*sigma
+            if decided or len(I_mid) == max_replicas:
+                break
+
+        fractions.extend([frac_im]*len(I_mid))
+        I_values.extend(I_mid)
+
+        # undecided points (within the noise of the threshold) still steer the bisection,
+        # but only confident decisions narrow the interval
+        if mean > tolerance:
+            low = frac_im
+            if decided:
+                ci_low = frac_im
+        else:
+            high = frac_im
+            if decided:
+                ci_high = frac_im
+
+    threshold = (low + high)/2
+    print(f'Threshold for p1, p2, p3 = {p1}, {p2}, {p3}: {threshold} in [{ci_low}, {ci_high}] \n')
+    return {"threshold": threshold, "ci_low": ci_low, "ci_high": ci_high,
+            "fractions": np.array(fractions), "I_values": np.array(I_values),
+            "instrumentation": instrument.summary()}
+
+def main_threshold(n_step, outfile, n_workers, checkpoint_dir, triples, target_error=None, common=False, profile=False):
+    'Herd immunity threshold for each (p1, p2, p3) of triples'
+    # parameters
+    N = 50
+
+    # a resumed run rebuilds every row from its checkpoints, so the output is rewritten
+    output = ChunkedOutput(outfile, mode='w', attrs={"N": N, "iterations": n_step, "target_error": target_error,
+                                                     "common_random_numbers": common})
+    for key in ["p1", "p2", "p3", "threshold", "ci_low", "ci_high"]:
+        output.add_column(key, chunk_rows=len(triples))
+    for key in ["eval_triple", "eval_im_frac", "eval_I_average"]:
+        output.add_column(key)
+    progress_path = os.path.join(outfile, 'progress.jsonl')
+    instrument = instrumentation.Instrument('SIRS_immune_sim threshold', unit='points', path=progress_path)
+
+    def write_triple(i, result):
+        # each threshold and its evaluations go to disk as soon as they are available
+        for key, value in zip(["p1", "p2", "p3"], triples[i]):
+            output.write_rows(key, i, value)
+        for key in ["threshold", "ci_low", "ci_high"]:
+            output.write_rows(key, i, result[key])
+        output.append("eval_triple", np.full(len(result["fractions"]), i))
+        output.append("eval_im_frac", result["fractions"])
+        output.append("eval_I_average", result["I_values"])
+        output.flush()
+
+    print('Begininning simulation... \n')
+    runner.run_points(partial(find_threshold, N=N, n_step=n_step, target_error=target_error, progress_path=progress_path),
+                      triples, checkpoint_dir, n_workers, on_result=write_triple, common_random_numbers=common,
+                      instrument=instrument, profile_dir=os.path.join(checkpoint_dir, 'profiles') if profile else None)
+
+    output.close()
+    instrument.report()
+
+    print('Job Done! :)')
+    print(f'Check directory for {outfile}/ (manifest.json and .npy columns). Data analysis can be done by using ChunkedOutput.load_results. \n')
 
 def main():
+    # trailing flags: crn (common random numbers across the parameter points),
+    # profile (cProfile and tracemalloc capture of every point, in <checkpoint dir>/profiles)
+    flags = []
+    while len(sys.argv) > 1 and sys.argv[-1] in ('crn', 'profile'):
+        flags.append(sys.argv.pop())
+    common = 'crn' in flags
+
     # Read inputs from command lines
-    if len(sys.argv) != 4 :
+    if len(sys.argv) not in (4, 5, 6, 7) :
         print("You left out the name of the files when running.")
         print("In command line, run like this instead:")
-        print(f"% nohup python {sys.argv[0]} <iterations> <resolution> <output .npy file name> > output.txt &")
+        print(f"% nohup python {sys.argv[0]} <iterations> <resolution> <output directory> [<workers>] [<checkpoint dir>] [<target error>] [crn] [profile] > output.txt &")
         print("For example:")
-        print("% nohup python SIRS_immune_sim.py 1100 0.2 measurements > output.txt &")
+        print("% nohup python SIRS_immune_sim.py 1100 0.2 measurements 6 > output.txt &")
+        print("or, for the herd immunity threshold of a grid of (p1, p2, p3) (threshold alone: the default grid):")
+        print("% nohup python SIRS_immune_sim.py 1100 threshold:0.5,0.7,0.9:0.5:0.3,0.5,0.8 thresholds 6 > output.txt &")
         sys.exit(1)
     else:
         iterations = int(sys.argv[1]) 
-        resolution = float(sys.argv[2])
         outfile = str(sys.argv[3])
+        n_workers = int(sys.argv[4]) if len(sys.argv) >= 5 else 1
+        checkpoint_dir = str(sys.argv[5]) if len(sys.argv) >= 6 else f'{outfile}_checkpoints'
+        # with a target error, <iterations> is the maximum and each point stops on its own
+        target_error = float(sys.argv[6]) if len(sys.argv) == 7 else None
+
+    if sys.argv[2].startswith('threshold'):
+        main_threshold(iterations, outfile, n_workers, checkpoint_dir, threshold_triples(sys.argv[2]),
+                       target_error, common, 'profile' in flags)
+        return
+    resolution = float(sys.argv[2])
 
     # parameters
     N = 50
@@ -30,50 +195,33 @@ def main():
     p1 ,p2, p3 = [.5]*3
     frac_im_step = np.arange(0., 1. + resolution, resolution) # immunisation
 
-    I_array = []
+    # a resumed run rebuilds every row from its checkpoints, so the output is rewritten
+    output = ChunkedOutput(outfile, mode='w', attrs={"N": N, "iterations": n_step, "p1": p1, "p2": p2, "p3": p3, "target_error": target_error,
+                                           "common_random_numbers": common})
+    output.add_column("im_frac", chunk_rows=len(frac_im_step))
+    output.write_rows("im_frac", 0, frac_im_step)
+    for key in ["I_average", "n_sweeps"]:
+        output.add_column(key, chunk_rows=len(frac_im_step))
+    progress_path = os.path.join(outfile, 'progress.jsonl')
+    instrument = instrumentation.Instrument('SIRS_immune_sim', unit='points', path=progress_path)
+
+    def write_point(i, result):
+        # each point goes to disk as soon as it is available
+        for key in ["I_average", "n_sweeps"]:
+            output.write_rows(key, i, result[key])
+        output.flush()
 
     print('Begininning simulation... \n')
-    for frac_im in frac_im_step:
-        print(f'Simulating with immune fraction: {frac_im}')
-        # initialisation step
-        lattice = random.randint(low=-1, high=2, size=(N,N)) # randomly initialise lattice
-        system = SIRS_Lattice(lattice)
-
-        # promote some sites to be immune
-        lattice = system.get_lattice_immune(frac_im)
-        system = SIRS_Lattice(lattice)
-
-        I_fraction_array = []
-
-        for _ in range(n_step):
-            for _ in range(N**2):
-                site = random.choice(N,2)
-                bool_test, updated_site, updated_state = system.update_step(site, p1,p2,p3)
-
-                i, j = updated_site
-
-                if bool_test:
-                    lattice[i][j] = updated_state
-                    system = SIRS_Lattice(lattice)
-
-            I_frac = system.get_I_fraction()
-            I_fraction_array.append(I_frac) 
-
-        I_average = system.get_I_average(np.array(I_fraction_array))
-
-        print(f'Average Infection (Fraction): {I_average} \n')
-        
-        I_array.append(I_average)
-
-    data = {"I_average": np.array(I_array),
-            "im_frac": frac_im_step
-            }
+    runner.run_points(partial(simulate_point, N=N, n_step=n_step, p1=p1, p2=p2, p3=p3, target_error=target_error,
+                              progress_path=progress_path),
+                      frac_im_step, checkpoint_dir, n_workers, on_result=write_point, common_random_numbers=common,
+                      instrument=instrument, profile_dir=os.path.join(checkpoint_dir, 'profiles') if 'profile' in flags else None)
 
-    # to-do
-    np.save(outfile, data)
+    output.close()
+    instrument.report()
 
     print('Job Done! :)')
-    print(f'Check directory for {outfile}.npy file. Data analysis can be done by using np.load. \n')
+    print(f'Check directory for {outfile}/ (manifest.json and .npy columns). Data analysis can be done by using ChunkedOutput.load_results. \n')
 
 if __name__ == '__main__':
-    main()  
\ No newline at end of file
+    main()
\ No newline at end of file
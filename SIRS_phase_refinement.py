@@ -0,0 +1,179 @@
+"""
+Adaptive mesh refinement of the (p1, p3) phase diagram with fixed p2=0.5.
+The scan starts on a coarse grid of cells; a cell whose corners differ by more than a
+tolerance in <I> or var(I)/N^2 (i.e. it contains a phase boundary or a steep region) is
+split into four, down to the target resolution. Only the new corner points of each level
+are simulated, as one stacked simulation per chunk of points (see SIRS_simulation), so deep
+absorbing or saturated regions cost a handful of points.
+
+Output (ChunkedOutput directory): the scattered records (p1, p3, observables, level) and
+the observables bilinearly interpolated from the leaf cells onto the finest uniform grid
+(p1_grid, p3_grid, *_grid), ready for imshow/contourf in the analysis notebook.
+
+author: s2229553
+"""
+
+import os
+import sys
+import math
+from functools import partial
+import numpy as np
+import RandomStreams as streams
+import Instrumentation as instrumentation
+import SIRS_runner as runner
+from SIRS_simulation import simulate_stack
+from ChunkedOutput import ChunkedOutput
+
+OBSERVABLES = ["I_average", "I_squared_average", "I_variance", "n_sweeps"]
+
+def simulate_points(points, seed, N, n_step, p2, target_error=None, common=False, progress_path=None):
+    'Simulate a chunk of (p1, p3) points as one stack; returns arrays of observables'
+    generator = streams.generator(seed) # own stream for this chunk
+    points = np.asarray(points)
+    instrument = instrumentation.Instrument(f'{len(points)} points from {points[0]}', total=n_step, unit='sweeps',
+                                            path=progress_path)
+    return simulate_stack(points[:, 0], points[:, 1], N, n_step, p2, target_error, generator, common, instrument)
+
+def cell_corners(cell):
+    i, j, size = cell
+    return [(i, j), (i + size, j), (i, j + size), (i + size, j + size)]
+
+def split_cell(cell):
+    i, j, size = cell
+    half = size//2
+    return [(i, j, half), (i + half, j, half), (i, j + half, half), (i + half, j + half, half)]
+
+def needs_refinement(cell, values, tolerances):
+    'True if any observable varies across the corners of the cell by more than its tolerance'
+    corners = np.array([values[corner] for corner in cell_corners(cell)])
+    return bool(np.any(np.ptp(corners, axis=0) > tolerances))
+
+def interpolate_grid(leaves, values, n_fine):
+    'Bilinear interpolation of every leaf cell onto the (n_fine+1)^2 grid; values are arrays'
+    n_observables = len(next(iter(values.values())))
+    grid = np.zeros((n_observables, n_fine + 1, n_fine + 1))
+    for cell in leaves:
+        i, j, size = cell
+        v00, v10, v01, v11 = [np.asarray(values[corner])[:, None, None] for corner in cell_corners(cell)]
+        s = np.linspace(0, 1, size + 1)[:, None]
+        t = np.linspace(0, 1, size + 1)[None, :]
+        grid[:, i:i+size+1, j:j+size+1] = (v00*(1-s)*(1-t) + v10*s*(1-t) + v01*(1-s)*t + v11*s*t)
+    return grid
+
+def refine(measure, n_coarse, levels, tolerances):
+    '''
+    Refinement loop on integer coordinates (finest spacing 1): measure(new_points, level)
+    returns {point: array of observables}. Returns (values, leaves).
+    '''
+    size = 2**levels
+    cells = [(i*size, j*size, size) for i in range(n_coarse) for j in range(n_coarse)]
+    values = {}
+    leaves = []
+    for level in range(levels + 1):
+        new_points = sorted({corner for cell in cells for corner in cell_corners(cell)} - set(values))
+        values.update(measure(new_points, level))
+
+        if level == levels:
+            leaves.extend(cells)
+            break
+        refined = []
+        for cell in cells:
+            if needs_refinement(cell, values, tolerances):
+                refined.extend(split_cell(cell))
+            else:
+                leaves.append(cell)
+        cells = refined
+    return values, leaves
+
+def main():
+    # trailing flags: crn (common random numbers across the parameter points),
+    # profile (cProfile and tracemalloc capture of every point, in <checkpoint dir>/profiles)
+    flags = []
+    while len(sys.argv) > 1 and sys.argv[-1] in ('crn', 'profile'):
+        flags.append(sys.argv.pop())
+    common = 'crn' in flags
+
+    # Read inputs from command lines
+    if len(sys.argv) not in (4, 5, 6, 7) :
+        print("You left out the name of the files when running.")
+        print("In command line, run like this instead:")
+        print(f"% nohup python {sys.argv[0]} <iterations> <resolution> <output directory> [<workers>] [<checkpoint dir>] [<target error>] [crn] [profile] > output.txt &")
+        print("For example:")
+        print("% nohup python SIRS_phase_refinement.py 1100 0.02 refined_measurements 32 > output.txt &")
+        sys.exit(1)
+    else:
+        iterations = int(sys.argv[1])
+        resolution = float(sys.argv[2])
+        outfile = str(sys.argv[3])
+        n_workers = int(sys.argv[4]) if len(sys.argv) >= 5 else 1
+        checkpoint_dir = str(sys.argv[5]) if len(sys.argv) >= 6 else f'{outfile}_checkpoints'
+        # with a target error, <iterations> is the maximum and each point stops on its own
+        target_error = float(sys.argv[6]) if len(sys.argv) == 7 else None
+
+    # parameters
+    N = 50
+    n_step = iterations
+    p2 = 0.5
+    n_coarse = 4 # coarse cells per axis (spacing 0.25)
+    levels = max(0, math.ceil(math.log2(1/(n_coarse*resolution))))
+    n_fine = n_coarse * 2**levels
+    tolerances = np.array([0.05, np.inf, 0.1, np.inf]) # on I_average, -, I_variance, - (order of OBSERVABLES)
+    chunk_size = 21 # points simulated together in one stack
+
+    # a resumed run rebuilds every row from its checkpoints, so the output is rewritten
+    output = ChunkedOutput(outfile, mode='w', attrs={"N": N, "iterations": n_step, "p2": p2, "target_error": target_error,
+                                           "n_coarse": n_coarse, "levels": levels, "tolerances": [0.05, 0.1],
+                                           "common_random_numbers": common})
+    for key in ["p1", "p3", "level"] + OBSERVABLES:
+        output.add_column(key)
+    progress_path = os.path.join(outfile, 'progress.jsonl')
+    instrument = instrumentation.Instrument('SIRS_phase_refinement', unit='points', path=progress_path)
+
+    def measure(new_points, level):
+        'Simulate the new integer points of a level, chunked over the workers'
+        coords = np.array(new_points)/n_fine
+        chunks = [coords[start:start+chunk_size] for start in range(0, len(coords), chunk_size)]
+        level_values = {}
+
+        def write_chunk(k, result):
+            # each chunk of records goes to disk as soon as it is available
+            output.append("p1", chunks[k][:, 0])
+            output.append("p3", chunks[k][:, 1])
+            output.append("level", np.full(len(chunks[k]), level))
+            for key in OBSERVABLES:
+                output.append(key, result[key])
+            output.flush()
+
+            for row, point in enumerate(new_points[k*chunk_size:(k+1)*chunk_size]):
+                level_values[point] = np.array([result[key][row] for key in OBSERVABLES], dtype=float)
+
+        print(f'Level {level}: {len(new_points)} new points \n')
+        runner.run_points(partial(simulate_points, N=N, n_step=n_step, p2=p2, target_error=target_error, common=common,
+                                  progress_path=progress_path),
+                          chunks, os.path.join(checkpoint_dir, f'level_{level}'), n_workers, on_result=write_chunk,
+                          common_random_numbers=common, instrument=instrument,
+                          profile_dir=os.path.join(checkpoint_dir, 'profiles', f'level_{level}') if 'profile' in flags else None)
+        return level_values
+
+    print('Begininning simulation... \n')
+    values, leaves = refine(measure, n_coarse, levels, tolerances)
+
+    # gridded interpolation on the finest grid
+    grid = interpolate_grid(leaves, values, n_fine)
+    axis = np.arange(n_fine + 1)/n_fine
+    output.add_column("p1_grid", chunk_rows=n_fine + 1)
+    output.add_column("p3_grid", chunk_rows=n_fine + 1)
+    output.write_rows("p1_grid", 0, axis)
+    output.write_rows("p3_grid", 0, axis)
+    for index, key in enumerate(OBSERVABLES):
+        output.add_column(f'{key}_grid', row_shape=(n_fine + 1,), chunk_rows=n_fine + 1)
+        output.write_rows(f'{key}_grid', 0, grid[index])
+    output.close()
+    instrument.report()
+
+    print(f'Simulated {len(values)} points instead of {(n_fine + 1)**2} on the uniform grid.')
+    print('Job Done! :)')
+    print(f'Check directory for {outfile}/ (manifest.json and .npy columns). Data analysis can be done by using ChunkedOutput.load_results. \n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Resampling error bars for SIRS time series (mean and variance of the infected number).
+Every estimate is a function of the first two moments of the series, so leave-one-out
+(or leave-one-block-out) estimates follow from prefix sums of x and x^2 in O(n), instead
+of recomputing the means for each deleted point.
+
+Consecutive sweeps are correlated, so for error bars that account for autocorrelation use
+a block length longer than the autocorrelation time: the blocked jackknife leaves out one
+block at a time, the block bootstrap resamples whole blocks with replacement. A trailing
+partial block is dropped.
+
+author: s2229553
+"""
+
+import numpy as np
+from numpy import random
+
+# random number generator for the bootstrap (SIRS_Lattice passes its own)
+rng = random.default_rng()
+
+def mean_estimator(mean, mean_squared):
+    return mean
+
+def variance_estimator(mean, mean_squared):
+    return mean_squared - mean**2
+
+ESTIMATORS = {'mean': mean_estimator, 'variance': variance_estimator}
+
+def block_sums(data, block_length=1):
+    'Sums of x and x^2 over consecutive blocks, from prefix sums; returns (sums, sums_squared)'
+    data = np.asarray(data, dtype=np.float64)
+    n_blocks = len(data)//block_length
+    if n_blocks < 2:
+        raise ValueError(f'Need at least 2 blocks, got {n_blocks} (n = {len(data)}, block length = {block_length})')
+
+    edges = np.arange(n_blocks + 1) * block_length
+    prefix = np.concatenate(([0.], np.cumsum(data)))
+    prefix_squared = np.concatenate(([0.], np.cumsum(data**2)))
+    return np.diff(prefix[edges]), np.diff(prefix_squared[edges])
+
+def jackknife(data, estimator='variance', block_length=1):
+    '''
+    Jackknife error of estimator ('mean', 'variance' or a function of (mean, mean squared))
+    leaving out one block of block_length points at a time
+    '''
+    sums, sums_squared = block_sums(data, block_length)
+    return jackknife_from_sums(sums, sums_squared, block_length, estimator)
+
+def jackknife_from_sums(sums, sums_squared, block_length, estimator='variance'):
+    '''
+    Blocked jackknife from per-block sums of x and x^2 (first axis is the block; further
+    axes are independent series, e.g. replicas)
+    '''
+    estimator = ESTIMATORS.get(estimator, estimator)
+    n_blocks = len(sums)
+    n_left = (n_blocks - 1) * block_length # points left after removing one block
+
+    # leave-one-block-out moments, all blocks at once
+    means = (np.sum(sums, axis=0) - sums)/n_left
+    means_squared = (np.sum(sums_squared, axis=0) - sums_squared)/n_left
+    estimates = estimator(means, means_squared)
+
+    return np.sqrt((n_blocks - 1)/n_blocks * np.sum((estimates - np.mean(estimates, axis=0))**2, axis=0))
+
+def bootstrap(data, estimator='variance', block_length=1, n_resamples=1000, generator=None):
+    '''
+    Block bootstrap error of estimator: n_resamples series of whole blocks drawn with
+    replacement
+    '''
+    estimator = ESTIMATORS.get(estimator, estimator)
+    generator = rng if generator is None else generator
+    sums, sums_squared = block_sums(data, block_length)
+    n_blocks = len(sums)
+    n_used = n_blocks * block_length
+
+    estimates = np.empty(n_resamples)
+    for i in range(n_resamples):
+        blocks = generator.integers(n_blocks, size=n_blocks)
+        estimates[i] = estimator(np.sum(sums[blocks])/n_used, np.sum(sums_squared[blocks])/n_used)
+
+    return np.std(estimates, ddof=1)
+
+def errorbar(data, estimator='variance', method='jackknife', block_length=1, **kwargs):
+    'Error of estimator with the jackknife or the bootstrap'
+    if method == 'jackknife':
+        return jackknife(data, estimator, block_length)
+    if method == 'bootstrap':
+        return bootstrap(data, estimator, block_length, **kwargs)
+    raise ValueError(f"Unknown method {method}, choose 'jackknife' or 'bootstrap'")
+
+if __name__ == '__main__':
+    # check against the direct O(n^2) jackknife
+    data = rng.random(500)
+    n = len(data)
+    estimates = np.array([np.var(np.delete(data, i)) for i in range(n)])
+    direct = np.sqrt((n - 1)/n * np.sum((estimates - np.mean(estimates))**2))
+    print(f'jackknife (direct): {direct}, jackknife (prefix sums): {jackknife(data)}')
+    print(f'bootstrap: {bootstrap(data)}')
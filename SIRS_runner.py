@@ -0,0 +1,152 @@
+"""
+Parameter sweep runner shared by the SIRS drivers.
+Parameter points are spread over a process pool and every finished point is written to
+its own checkpoint file as soon as it completes, so a crashed or killed job loses at
+most the points in flight. Running again with the same checkpoint directory skips the
+points already done. The configuration of the run (simulate function, its fixed keyword
+arguments such as N and the number of sweeps, the points) is hashed into config.json in
+the checkpoint directory, and a run with another configuration refuses to resume there.
+
+Each point gets its own random seed, spawned from a SeedSequence whose entropy is stored
+in the checkpoint directory, so forked workers never share a random stream and a resumed
+job uses the same seeds as the original one. With common_random_numbers=True every point
+gets the same seed instead (see RandomStreams).
+
+With an instrument (see Instrumentation), every finished point is counted, its worker's
+timers and counters (the "instrumentation" entry of its result, if any) are merged in
+and a progress record with points/s and ETA is written. With a profile directory every
+point runs under cProfile and tracemalloc in its worker.
+
+author: s2229553
+"""
+
+import os
+import json
+import hashlib
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from numpy import random
+import RandomStreams as streams
+import Instrumentation as instrumentation
+
+def checkpoint_path(checkpoint_dir, index):
+    return os.path.join(checkpoint_dir, f'point_{index:05d}.npy')
+
+def save_atomic(path, data):
+    'np.save through a temporary file, so a crash never leaves a half written checkpoint'
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, data, allow_pickle=True)
+    os.replace(tmp_path, path)
+
+def load_entropy(checkpoint_dir):
+    'Entropy of the run, created on the first run and reused on resume'
+    path = os.path.join(checkpoint_dir, 'entropy.npy')
+    if os.path.exists(path):
+        return int(np.load(path, allow_pickle=True).item())
+    entropy = random.SeedSequence().entropy
+    save_atomic(path, entropy)
+    return entropy
+
+# keyword arguments that say where output goes, not what is computed
+IGNORED_KEYWORDS = ('progress_path',)
+
+def run_config(simulate, points, common_random_numbers=False):
+    'JSON description of what a run computes: simulate, its fixed arguments and the points'
+    function, args, keywords = simulate, (), {}
+    if isinstance(simulate, partial):
+        function, args, keywords = simulate.func, simulate.args, simulate.keywords
+    config = {"function": f'{function.__module__}.{function.__qualname__}',
+              "args": list(args),
+              "keywords": {key: value for key, value in sorted(keywords.items()) if key not in IGNORED_KEYWORDS},
+              "points": list(points),
+              "common_random_numbers": bool(common_random_numbers)}
+    # arrays and numpy scalars as plain lists and numbers
+    return json.loads(json.dumps(config, default=lambda value: np.asarray(value).tolist()))
+
+def check_config(checkpoint_dir, config):
+    '''
+    Store the config (and its hash) on the first run; on resume, raise a ValueError if the
+    checkpoints were made with another config
+    '''
+    digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+    path = os.path.join(checkpoint_dir, 'config.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            stored = json.load(f)
+        if stored["hash"] != digest:
+            changed = sorted(key for key in set(config) | set(stored["config"]) if config.get(key) != stored["config"].get(key))
+            changed += sorted(f'keywords.{key}' for key in set(config["keywords"]) | set(stored["config"].get("keywords", {}))
+                              if config["keywords"].get(key) != stored["config"].get("keywords", {}).get(key))
+            raise ValueError(f'Checkpoints in {checkpoint_dir} are from a run with another configuration '
+                             f'({", ".join(key for key in changed if key != "keywords")}); '
+                             f'use another checkpoint directory or delete it')
+        return digest
+
+    if any(name.startswith('point_') for name in os.listdir(checkpoint_dir)):
+        print(f'Warning: checkpoints in {checkpoint_dir} have no config.json, assuming they match this run')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({"hash": digest, "config": config}, f, indent=1)
+    os.replace(tmp_path, path)
+    return digest
+
+def run_points(simulate, points, checkpoint_dir, n_workers=1, on_result=None, common_random_numbers=False,
+               instrument=None, profile_dir=None):
+    '''
+    Run simulate(point, seed) for every point on n_workers processes and return the
+    results in the order of points. simulate must be a module level function (or a
+    functools.partial of one) so it can be sent to the workers.
+    If given, on_result(i, result) is called in this process as each point becomes
+    available (checkpointed points first, then in order of completion).
+    instrument (an Instrumentation.Instrument) and profile_dir are optional.
+    '''
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    check_config(checkpoint_dir, run_config(simulate, points, common_random_numbers))
+    seeds = streams.spawn_seeds(load_entropy(checkpoint_dir), len(points), common_random_numbers)
+
+    results = {}
+    pending = []
+    for i, point in enumerate(points):
+        path = checkpoint_path(checkpoint_dir, i)
+        if not os.path.exists(path):
+            pending.append(i)
+            continue
+
+        data = np.load(path, allow_pickle=True).item()
+        if not np.allclose(data['point'], point):
+            raise ValueError(f'Checkpoint {path} is for point {data["point"]}, not {point}')
+        print(f'Point {point} already done, skipping')
+        results[i] = data['result']
+        if on_result is not None:
+            on_result(i, results[i])
+
+    if instrument is not None:
+        instrument.total = instrument.counters.get('points', 0) + len(pending) # ETA over the points left
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        if profile_dir is None:
+            futures = {executor.submit(simulate, points[i], seeds[i]): i for i in pending}
+        else:
+            futures = {executor.submit(instrumentation.profile_call, simulate, profile_dir, f'point_{i:05d}',
+                                       points[i], seeds[i]): i for i in pending}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            with instrumentation.phase(instrument, 'io'):
+                save_atomic(checkpoint_path(checkpoint_dir, i), {'point': points[i], 'result': results[i]})
+                print(f'Point {points[i]} done ({len(results)}/{len(points)})')
+                if on_result is not None:
+                    on_result(i, results[i])
+
+            if instrument is not None:
+                if isinstance(results[i], dict) and "instrumentation" in results[i]:
+                    instrument.merge(results[i]["instrumentation"])
+                instrument.count('points')
+                instrument.record()
+
+    return [results[i] for i in range(len(points))]
+
+if __name__ == '__main__':
+    print(__name__)
@@ -1,27 +1,130 @@
 """
-Running multiple random simulations to measure infection (fraction) average with fixed p2=0.5. 
+Running multiple random simulations to measure infection (fraction) average with fixed p2=0.5.
+The (p1, p3) grid runs in chunks of STACK_ROWS p1 rows, each chunk one stacked
+simulation (the per attempt loop of sweep_batch is shared by its points: 168 points take
+~0.65 ms per point and sweep at N = 50, against ~3.4 ms for a single row of 21). The
+chunks are the points of SIRS_runner: spread over worker processes, checkpointed as they
+finish and seeded from their index, so the results do not depend on the worker count.
+Progress records of the chunks and of the whole run go to progress.jsonl in the output
+directory (see Instrumentation); a trailing 'profile' argument profiles every chunk.
 
 author: s2229553
 """
 
+import os
 import sys
+from functools import partial
 import numpy as np
-from numpy import random
-from SIRS_class import SIRS_Lattice
+import RandomStreams as streams
+import Instrumentation as instrumentation
+from SIRS_statistics import RunningStats
+import SIRS_functions as func
+import SIRS_ensemble as ensemble
+import SIRS_runner as runner
+import SIRS_adaptive as adaptive
+from ChunkedOutput import ChunkedOutput
+
+STACK_ROWS = 8 # p1 rows per stacked simulation (and per checkpoint)
+
+def simulate_rows(first_row, seed, N, n_step, p2, p1_step, p3_step, n_rows=STACK_ROWS, target_error=None,
+                  common=False, progress_path=None):
+    '''
+    Simulate the p1 rows first_row..first_row+n_rows-1 (all p3 points) as one stack;
+    returns arrays of observables of shape (rows, len(p3_step)).
+    With a target error on <I>, n_step is the maximum and each point stops on its own
+    (see SIRS_adaptive). With common=True all points use the same random numbers.
+    Progress records go to progress_path (stdout if None).
+    '''
+    generator = streams.generator(seed) # own stream for this chunk
+    first_row = int(first_row)
+    p1_rows = p1_step[first_row:first_row + n_rows]
+    instrument = instrumentation.Instrument(f'p1={p1_rows[0]}..{p1_rows[-1]}', total=n_step, unit='sweeps', path=progress_path)
+    p1, p3 = np.meshgrid(p1_rows, p3_step, indexing='ij')
+    rows = simulate_stack(p1.ravel(), p3.ravel(), N, n_step, p2, target_error, generator, common, instrument)
+    for key in ["I_average", "I_squared_average", "I_variance", "n_sweeps"]:
+        rows[key] = rows[key].reshape(p1.shape)
+    return rows
+
+def simulate_stack(p1, p3, N, n_step, p2, target_error=None, generator=None, common=False, instrument=None):
+    '''
+    Simulate the (p1, p3) points (arrays or scalars) as one stack; returns arrays of
+    observables (plus the summary of the instrument, if given, as "instrumentation")
+    '''
+    p1, p3 = np.broadcast_arrays(np.asarray(p1, dtype=float), np.asarray(p3, dtype=float))
+    n_points = len(p1)
+
+    # all points as one stack of replicas, advanced in lockstep
+    if common: # same initial lattice and random numbers for every point
+        lattices = np.repeat(func.random_lattice(N, generator)[None], n_points, axis=0)
+    else:
+        lattices = func.random_lattice(N, generator, replicas=n_points)
+
+    if target_error is not None:
+        results = adaptive.run_adaptive_batch(lattices, p1, p2, p3, n_step, target_error, 'mean',
+                                              generator=generator, common=common, instrument=instrument)
+        for point, result in enumerate(results):
+            print(f'Simulated p1: {p1[point]}, p3: {p3[point]} in {result["n_sweeps"]} sweeps (burn-in {result["burn_in"]}, tau {result["tau"]:.1f})')
+            print(f'Average Infection (Fraction): {result["I_average"]} +- {result["sigma"]} \n')
+
+        row = {key: np.array([result[key] for result in results])
+               for key in ["I_average", "I_squared_average", "I_variance", "n_sweeps"]}
+        if instrument is not None:
+            row["instrumentation"] = instrument.summary()
+        return row
+
+    # infected counts of every replica accumulated online after every sweep
+    stats = RunningStats(shape=(n_points,))
+    for sweep_i in range(n_step):
+        with instrumentation.phase(instrument, 'sweep'):
+            I_counts = ensemble.sweep_batch(lattices, 1, p1, p2, p3, generator=generator, common=common)[:, 0]
+        with instrumentation.phase(instrument, 'measure'):
+            stats.update(I_counts)
+        instrumentation.count(instrument, 'attempts', n_points*N**2)
+        instrumentation.count(instrument, 'sweeps')
+
+    I_array = stats.get_mean()/(N**2)
+    I_squared_array = stats.get_second_moment()/(N**4)
+    var_array = stats.get_variance()/(N**2)
+
+    for point in range(n_points):
+        print(f'Simulated p1: {p1[point]}, p3: {p3[point]}')
+        print(f'Average Infection (Fraction): {I_array[point]}')
+        print(f'Average Infection (Fraction) Squared: {I_squared_array[point]}')
+        print(f'Variance Infection : {var_array[point]} \n')
+
+    row = {"I_average": I_array,
+           "I_squared_average": I_squared_array,
+           "I_variance": var_array,
+           "n_sweeps": np.full(n_points, n_step)
+           }
+    if instrument is not None:
+        row["instrumentation"] = instrument.summary()
+    return row
 
 def main():
+    # trailing flags: crn (common random numbers across the parameter points),
+    # profile (cProfile and tracemalloc capture of every point, in <checkpoint dir>/profiles)
+    flags = []
+    while len(sys.argv) > 1 and sys.argv[-1] in ('crn', 'profile'):
+        flags.append(sys.argv.pop())
+    common = 'crn' in flags
+
     # Read inputs from command lines
-    if len(sys.argv) != 4 :
+    if len(sys.argv) not in (4, 5, 6, 7) :
         print("You left out the name of the files when running.")
         print("In command line, run like this instead:")
-        print(f"% nohup python {sys.argv[0]} <iterations> <resolution> <output .npy file name> > output.txt &")
+        print(f"% nohup python {sys.argv[0]} <iterations> <resolution> <output directory> [<workers>] [<checkpoint dir>] [<target error>] [crn] [profile] > output.txt &")
         print("For example:")
-        print("% nohup python SIRS_simulation.py 1100 0.05 measurements > output.txt &")
+        print("% nohup python SIRS_simulation.py 1100 0.05 measurements 32 > output.txt &")
         sys.exit(1)
     else:
-        iterations = int(sys.argv[1]) 
+        iterations = int(sys.argv[1])
         resolution = float(sys.argv[2])
         outfile = str(sys.argv[3])
+        n_workers = int(sys.argv[4]) if len(sys.argv) >= 5 else 1
+        checkpoint_dir = str(sys.argv[5]) if len(sys.argv) >= 6 else f'{outfile}_checkpoints'
+        # with a target error, <iterations> is the maximum and each point stops on its own
+        target_error = float(sys.argv[6]) if len(sys.argv) == 7 else None
 
     # parameters
     N = 50
@@ -30,68 +133,38 @@ def main():
     p2 = 0.5
     p3_step = np.arange(0, 1. + resolution, resolution)
 
-    I_array = []
-    I_squared_array = []
-    var_array = []
+    # a resumed run rebuilds every row from its checkpoints, so the output is rewritten
+    output = ChunkedOutput(outfile, mode='w', attrs={"N": N, "iterations": n_step, "p2": p2, "target_error": target_error, "common_random_numbers": common,
+                                                     "stack_rows": STACK_ROWS})
+    output.add_column("p1_values", chunk_rows=len(p1_step))
+    output.add_column("p3_values", chunk_rows=len(p3_step))
+    output.write_rows("p1_values", 0, p1_step)
+    output.write_rows("p3_values", 0, p3_step)
+    for key in ["I_average", "I_squared_average", "I_variance", "n_sweeps"]:
+        output.add_column(key, row_shape=(len(p3_step),), chunk_rows=len(p1_step))
+    progress_path = os.path.join(outfile, 'progress.jsonl')
+    instrument = instrumentation.Instrument('SIRS_simulation', unit='points', path=progress_path)
+
+    # the runner's points are the first rows of the chunks, whatever the number of workers
+    first_rows = np.arange(0, len(p1_step), STACK_ROWS)
+
+    def write_rows(i, rows):
+        # each chunk of p1 rows goes to disk as soon as it is available
+        for key in ["I_average", "I_squared_average", "I_variance", "n_sweeps"]:
+            output.write_rows(key, int(first_rows[i]), rows[key])
+        output.flush()
 
     print('Begininning simulation... \n')
-    for p1 in p1_step:
-        I_array_row = []
-        I_squared_array_row =[]
-        var_array_row = []
-
-        for p3 in p3_step:
-            print(f'Simulating p1: {p1}, p3: {p3}')
-            # random initialisation of system
-            lattice = random.randint(low=-1,high=2,size=(N,N))
-            system = SIRS_Lattice(lattice)
-
-            I_fraction_array = []
-            I_count_array = []
-
-            for _ in range(n_step):
-                for _ in range(N**2):
-                    site = random.choice(N,2)
-                    bool_test, updated_site, updated_state = system.update_step(site, p1,p2,p3)
-
-                    i, j = updated_site
-
-                    if bool_test:
-                        lattice[i][j] = updated_state
-                        system = SIRS_Lattice(lattice)
-    
-                # count infected number and fraction
-                I_frac = system.get_I_fraction()
-                I_fraction_array.append(I_frac) 
-                _, I_count, _ = system.count_states()
-                I_count_array.append(I_count)
-
-            I_average = system.get_I_average(np.array(I_fraction_array))
-            I_squared_average = system.get_I_squared_average(np.array(I_fraction_array))
-            I_var = system.get_I_variance(np.array(I_count_array))
-
-            print(f'Average Infection (Fraction): {I_average}')
-            print(f'Average Infection (Fraction) Squared: {I_squared_average}')
-            print(f'Variance Infection : {I_var} \n')
-
-            I_array_row.append(I_average)
-            I_squared_array_row.append(I_squared_average)
-            var_array_row.append(I_var)
-        
-        I_array.append(I_array_row)
-        I_squared_array.append(I_squared_array_row)
-        var_array.append(var_array_row)
-
-    data = {"I_average": np.array(I_array),
-            "I_squared_average": np.array(I_squared_array),
-            "I_variance": np.array(var_array)
-            }
-
-    # to-do
-    np.save(outfile, data)
+    runner.run_points(partial(simulate_rows, N=N, n_step=n_step, p2=p2, p1_step=p1_step, p3_step=p3_step, n_rows=STACK_ROWS,
+                              target_error=target_error, common=common, progress_path=progress_path),
+                      first_rows, checkpoint_dir, n_workers, on_result=write_rows, common_random_numbers=common,
+                      instrument=instrument, profile_dir=os.path.join(checkpoint_dir, 'profiles') if 'profile' in flags else None)
+
+    output.close()
+    instrument.report()
 
     print('Job Done! :)')
-    print(f'Check directory for {outfile}.npy file. Data analysis can be done by using np.load. \n')
+    print(f'Check directory for {outfile}/ (manifest.json and .npy columns). Data analysis can be done by using ChunkedOutput.load_results. \n')
 
 if __name__ == '__main__':
-    main()  
+    main()
@@ -0,0 +1,103 @@
+"""
+Online statistics for SIRS observables, updated once per sweep with O(1) memory.
+The mean and variance use Welford's update (numerically stable for long runs); a block
+summary (sums of x and x^2 per block) is kept for blocked jackknife error bars. When the
+number of blocks reaches max_blocks, neighbouring blocks are merged and the block length
+doubles, so memory stays bounded however long the run is and the blocks grow past the
+autocorrelation time. Values may be scalars or arrays (one entry per replica).
+
+author: s2229553
+"""
+
+import numpy as np
+import SIRS_resampling as resampling
+
+class RunningStats():
+    '''
+    Welford accumulator with a burn-in and a bounded block summary
+    '''
+
+    def __init__(self, burn_in=100, block_length=1, max_blocks=1024, shape=()):
+        if max_blocks < 2 or max_blocks % 2:
+            raise ValueError(f'max_blocks must be even and at least 2, got {max_blocks}')
+        self.burn_in = burn_in
+        self.block_length = block_length
+        self.max_blocks = max_blocks
+
+        self.n_seen = 0 # values seen, including the burn-in
+        self.n = 0 # values accumulated
+        self.average = np.zeros(shape)
+        self.m2 = np.zeros(shape) # sum of squared deviations from the average
+
+        self.block_sums = []
+        self.block_sums_squared = []
+        self.partial_sum = np.zeros(shape)
+        self.partial_sum_squared = np.zeros(shape)
+        self.partial_count = 0
+
+    def update(self, x):
+        'Add one value (one sweep)'
+        self.n_seen += 1
+        if self.n_seen <= self.burn_in:
+            return
+
+        x = np.asarray(x, dtype=np.float64)
+        self.n += 1
+        delta = x - self.average
+        self.average = self.average + delta/self.n
+        self.m2 = self.m2 + delta*(x - self.average)
+
+        self.partial_sum = self.partial_sum + x
+        self.partial_sum_squared = self.partial_sum_squared + x**2
+        self.partial_count += 1
+        if self.partial_count == self.block_length:
+            self.close_block()
+
+    def update_series(self, series):
+        'Add values one after the other (first axis is time)'
+        for x in series:
+            self.update(x)
+
+    def close_block(self):
+        self.block_sums.append(self.partial_sum)
+        self.block_sums_squared.append(self.partial_sum_squared)
+        self.partial_sum = np.zeros_like(self.partial_sum)
+        self.partial_sum_squared = np.zeros_like(self.partial_sum_squared)
+        self.partial_count = 0
+
+        if len(self.block_sums) == self.max_blocks:
+            # merge neighbouring blocks, the partial block is shorter than the new length
+            self.block_sums = [a + b for a, b in zip(self.block_sums[::2], self.block_sums[1::2])]
+            self.block_sums_squared = [a + b for a, b in zip(self.block_sums_squared[::2], self.block_sums_squared[1::2])]
+            self.block_length *= 2
+
+    def get_mean(self):
+        return self.average
+
+    def get_second_moment(self):
+        return self.m2/self.n + self.average**2
+
+    def get_variance(self):
+        'Variance of the values, <x^2> - <x>^2'
+        return self.m2/self.n
+
+    def get_block_summary(self):
+        'Per-block sums of x and x^2 (complete blocks only) and the block length'
+        return np.array(self.block_sums), np.array(self.block_sums_squared), self.block_length
+
+    def get_errorbar(self, estimator='variance'):
+        'Blocked jackknife error of the mean or variance from the block summary'
+        sums, sums_squared, block_length = self.get_block_summary()
+        return resampling.jackknife_from_sums(sums, sums_squared, block_length, estimator)
+
+if __name__ == '__main__':
+    # check against the stored series
+    rng = np.random.default_rng()
+    series = rng.random(5000)
+    stats = RunningStats(burn_in=100, max_blocks=64)
+    stats.update_series(series)
+
+    print(f'mean: {stats.get_mean()} vs {np.mean(series[100:])}')
+    print(f'variance: {stats.get_variance()} vs {np.var(series[100:])}')
+    print(f'errorbar (block length {stats.block_length}): {stats.get_errorbar()} vs '
+          f'{resampling.jackknife(series[100:], block_length=stats.block_length)}')
@@ -2,27 +2,91 @@
 Running a set of simulations to calculate variance and error bars, searching for waves in the original phase diagram.
 Search already reduced to the p2 = p3 = 0.5 cut, ranging from p1 = 0.2 to  p1 = 0.5. 
 
+Sigma_var is the blocked jackknife error of I_variance (after the 100 sweep burn-in), not
+the delete-one jackknife of the original script: the online statistics keep at most 1024
+blocks, so the block length doubles as the run grows (adaptive runs use blocks of about
+2 tau instead). The error therefore accounts for autocorrelation and depends on the run
+length; the block length of every point is stored in the block_length column.
+
 author: s2229553
 """
 
+import os
 import sys
+from functools import partial
 import numpy as np
-from numpy import random
+import RandomStreams as streams
+import Instrumentation as instrumentation
 from SIRS_class import SIRS_Lattice
+import SIRS_functions as func
+import SIRS_runner as runner
+import SIRS_adaptive as adaptive
+from ChunkedOutput import ChunkedOutput
+
+def simulate_point(p1, seed, N, n_step, p2, p3, target_error=None, progress_path=None):
+    '''
+    Simulate one p1 point; returns its observables. With a target error on var(I)/N^2,
+    n_step is the maximum and the run stops on its own (see SIRS_adaptive).
+    Progress records go to progress_path (stdout if None).
+    '''
+    generator = streams.generator(seed) # own stream for this point
+    instrument = instrumentation.Instrument(f'p1={p1}', total=n_step, unit='sweeps', path=progress_path)
+
+    print(f'Simulating p1: {p1}')
+    # random initialisation of system
+    lattice = func.random_lattice(N, generator)
+    system = SIRS_Lattice(lattice, generator=generator, instrument=instrument)
+
+    if target_error is not None:
+        result = adaptive.run_adaptive(system, p1, p2, p3, n_step, target_error, 'variance')
+        I_average = result["I_average"]*(N**2)
+        I_var = result["I_variance"]
+        sigma_var = result["sigma"]
+        block_length = result["block_length"]
+        n_sweeps = result["n_sweeps"]
+        print(f'Stopped after {n_sweeps} sweeps (burn-in {result["burn_in"]}, tau {result["tau"]:.1f})')
+    else:
+        # infected number accumulated online after every sweep
+        system.reset_statistics()
+        system.run(n_step, p1, p2, p3)
+
+        I_average = system.stats.get_mean()
+        I_var = system.stats.get_variance()/(N**2)
+        sigma_var = system.stats.get_errorbar('variance')/(N**2) # blocked jackknife
+        block_length = system.stats.block_length
+        n_sweeps = n_step
+
+    print(f'Average Infection (Fraction): {I_average}') 
+    print(f'Variance Infection (Fraction): {I_var}')
+    print(f'Sigma Variance Infection (Fraction): {sigma_var} (blocked jackknife, blocks of {block_length} sweeps) \n')
+
+    return {"I_average": I_average, "I_variance": I_var, "Sigma_var": sigma_var, "block_length": block_length, "n_sweeps": n_sweeps,
+            "instrumentation": instrument.summary()}
 
 def main():
+    # trailing flags: crn (common random numbers across the parameter points),
+    # profile (cProfile and tracemalloc capture of every point, in <checkpoint dir>/profiles)
+    flags = []
+    while len(sys.argv) > 1 and sys.argv[-1] in ('crn', 'profile'):
+        flags.append(sys.argv.pop())
+    common = 'crn' in flags
+
     # Read inputs from command lines
-    if len(sys.argv) != 4 :
+    if len(sys.argv) not in (4, 5, 6, 7) :
         print("You left out the name of the files when running.")
         print("In command line, run like this instead:")
-        print(f"% nohup python {sys.argv[0]} <iterations> <resolution> <output .npy file name> > output.txt &")
+        print(f"% nohup python {sys.argv[0]} <iterations> <resolution> <output directory> [<workers>] [<checkpoint dir>] [<target error>] [crn] [profile] > output.txt &")
         print("For example:")
-        print("% nohup python SIRS_waves_search.py 10100 0.05 measurements > output.txt &")
+        print("% nohup python SIRS_waves_search.py 10100 0.05 measurements 7 > output.txt &")
         sys.exit(1)
     else:
         iterations = int(sys.argv[1]) 
         resolution = float(sys.argv[2])
         outfile = str(sys.argv[3])
+        n_workers = int(sys.argv[4]) if len(sys.argv) >= 5 else 1
+        checkpoint_dir = str(sys.argv[5]) if len(sys.argv) >= 6 else f'{outfile}_checkpoints'
+        # with a target error, <iterations> is the maximum and each point stops on its own
+        target_error = float(sys.argv[6]) if len(sys.argv) == 7 else None
 
     # parameters
     N = 50
@@ -31,59 +95,33 @@ def main():
     p2 = 0.5
     p3 = 0.5
 
-    I_array = []
-    var_array = []
-    sigma_array = []
+    # a resumed run rebuilds every row from its checkpoints, so the output is rewritten
+    output = ChunkedOutput(outfile, mode='w', attrs={"N": N, "iterations": n_step, "p2": p2, "p3": p3, "target_error": target_error,
+                                           "common_random_numbers": common,
+                                           "Sigma_var": "blocked jackknife error of I_variance, blocks of block_length sweeps"})
+    output.add_column("p1_values", chunk_rows=len(p1_step))
+    output.write_rows("p1_values", 0, p1_step)
+    for key in ["I_average", "I_variance", "Sigma_var", "block_length", "n_sweeps"]:
+        output.add_column(key, chunk_rows=len(p1_step))
+    progress_path = os.path.join(outfile, 'progress.jsonl')
+    instrument = instrumentation.Instrument('SIRS_waves_search', unit='points', path=progress_path)
+
+    def write_point(i, result):
+        # each point goes to disk as soon as it is available
+        for key in ["I_average", "I_variance", "Sigma_var", "block_length", "n_sweeps"]:
+            output.write_rows(key, i, result[key])
+        output.flush()
 
     print('Begininning simulation... \n')
-    for p1 in p1_step:
-        print(f'Simulating p1: {p1}')
-        # random initialisation of system
-        lattice = random.randint(low=-1,high=2,size=(N,N))
-        system = SIRS_Lattice(lattice)
-
-        I_fraction_array = []
-        I_count_array = []
-
-        for _ in range(n_step):
-            for _ in range(N**2):
-                site = random.choice(N,2)
-                bool_test, updated_site, updated_state = system.update_step(site, p1,p2,p3)
-
-                i, j = updated_site
-
-                if bool_test:
-                    lattice[i][j] = updated_state
-                    system = SIRS_Lattice(lattice)
-
-            _, I_count, _ = system.count_states()
-            #I_frac = system.get_I_fraction()
-            I_count_array.append(I_count)
-            #I_fraction_array.append(I_frac) 
-
-        I_average = system.get_I_average(np.array(I_count_array))
-        I_var = system.get_I_variance(np.array(I_count_array))
-        sigma_var = system.get_errorbar(np.array(I_count_array))
-
-        print(f'Average Infection (Fraction): {I_average}') 
-        print(f'Variance Infection (Fraction): {I_var}')
-        print(f'Sigma Variance Infection (Fraction): {sigma_var} \n')
-        
-        sigma_array.append(sigma_var)
-        I_array.append(I_average)
-        var_array.append(I_var)
-
-    data = {"I_average": np.array(I_array),
-            "I_variance": np.array(var_array),
-            "Sigma_var": np.array(sigma_array),
-            "p1_values": p1_step
-            }
-
-    # to-do
-    np.save(outfile, data)
+    runner.run_points(partial(simulate_point, N=N, n_step=n_step, p2=p2, p3=p3, target_error=target_error, progress_path=progress_path),
+                      p1_step, checkpoint_dir, n_workers, on_result=write_point, common_random_numbers=common,
+                      instrument=instrument, profile_dir=os.path.join(checkpoint_dir, 'profiles') if 'profile' in flags else None)
+
+    output.close()
+    instrument.report()
 
     print('Job Done! :)')
-    print(f'Check directory for {outfile}.npy file. Data analysis can be done by using np.load. \n')
+    print(f'Check directory for {outfile}/ (manifest.json and .npy columns). Data analysis can be done by using ChunkedOutput.load_results. \n')
 
 if __name__ == '__main__':
-    main()  
\ No newline at end of file
+    main()  
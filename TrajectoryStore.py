@@ -0,0 +1,316 @@
+"""
+Compact on-disk trajectories of GoL and SIRS lattices, so plots and animations can be
+rebuilt without re-simulating.
+
+Frames are recorded at a chosen stride and packed: GoL one bit per site, SIRS two bits
+per site (state + 1, so immune sites fit). A packed frame is stored either whole (a
+keyframe) or as the XOR with the previous frame, keeping only the bytes that changed
+(positions and XOR values); keyframes are forced every keyframe_interval frames, and used
+whenever the delta would not be smaller. A store is a directory with
+
+    frames.bin   the records, appended one after the other, read through a memory map
+    index.npy    offset, length, kind (0 keyframe, 1 delta) and step of every frame
+    meta.json    model, N, stride, keyframe interval and attrs
+
+index.npy and meta.json are rewritten atomically on flush, every flush_frames frames or
+flush_seconds seconds (whichever comes first) and on close, so a killed run can be read
+up to its last flush. A directory that already holds a trajectory is refused (mode='x'),
+or explicitly overwritten (mode='w'), as in ChunkedOutput. Frame t is rebuilt from the nearest keyframe before it (at most
+keyframe_interval - 1 deltas); iterating over a range applies one delta per frame.
+Population curves are read straight from the packed frames (byte lookup tables):
+
+    import TrajectoryStore
+    writer = TrajectoryStore.TrajectoryWriter('run', N, 'sirs', stride=10, initial=system.lattice)
+    system.run(10000, p1, p2, p3, callback=writer.callback)
+    writer.close()
+
+Steps count the generations (sweeps) done: the initial lattice, if given, is frame 0 at
+step 0, and writer.callback records the lattice after the call of step i as step i + 1.
+
+    trajectory = TrajectoryStore.TrajectoryReader('run')
+    lattice = trajectory.get_frame(500)              # dense lattice of frame 500
+    for step, lattice in trajectory.iter_frames(100, 200):
+        ...
+    S, I, R, immune = trajectory.populations().T
+
+author: s2229553
+"""
+
+import os
+import json
+import time
+import numpy as np
+
+MODELS = ('gol', 'sirs')
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'), ('kind', 'u1'), ('step', '<i8')])
+KEYFRAME, DELTA = 0, 1
+
+############### PACKING ################
+
+def pack_frame(lattice, model):
+    'Packed bytes of a lattice: 1 bit per site (gol) or 2 bits per site, state + 1 (sirs)'
+    lattice = np.asarray(lattice)
+    if model == 'gol':
+        if lattice.size and lattice.max() > 1:
+            raise ValueError('gol frames are 0/1 lattices, Generations rules with dying states cannot be packed')
+        return np.packbits(lattice.ravel())
+
+    codes = (lattice.ravel() + 1).astype(np.uint8)
+    codes = np.concatenate([codes, np.zeros(-len(codes) % 4, dtype=np.uint8)])
+    return codes[0::4] | (codes[1::4] << 2) | (codes[2::4] << 4) | (codes[3::4] << 6)
+
+def unpack_frame(packed, N, model):
+    'Dense lattice (N, N) from packed bytes: uint8 for gol, int8 states -1..2 for sirs'
+    if model == 'gol':
+        return np.unpackbits(packed, count=N*N).reshape(N, N)
+
+    codes = np.stack([(packed >> shift) & 3 for shift in (0, 2, 4, 6)], axis=1).ravel()[:N*N]
+    return (codes.astype(np.int8) - 1).reshape(N, N)
+
+def population_tables(model):
+    'Per byte value: live sites (gol, (256,)) or sites in each code S, I, R, immune order (sirs, (256, 4))'
+    values = np.arange(256, dtype=np.uint8)
+    if model == 'gol':
+        return np.unpackbits(values[:, None], axis=1).sum(axis=1)
+
+    codes = np.stack([(values >> shift) & 3 for shift in (0, 2, 4, 6)], axis=1)
+    # columns in the order of the states 0 (S), -1 (I), 1 (R), 2 (immune), i.e. codes 1, 0, 2, 3
+    return np.stack([np.sum(codes == code, axis=1) for code in (1, 0, 2, 3)], axis=1)
+
+############### WRITING ################
+
+class TrajectoryWriter():
+    '''
+    Writer of a trajectory directory; frames are recorded when step % stride == 0.
+    The initial lattice, if given, is recorded as step 0 when recording starts.
+    mode='x' refuses a directory holding a trajectory, mode='w' overwrites it.
+    '''
+
+    def __init__(self, path, N, model='gol', stride=1, keyframe_interval=64, attrs=None, mode='x',
+                 flush_frames=256, flush_seconds=60., initial=None):
+        if model not in MODELS:
+            raise ValueError(f'Unknown model {model}, choose from {MODELS}')
+        if mode not in ('x', 'w'):
+            raise ValueError(f"Unknown mode {mode}, choose 'x' (new directory) or 'w' (overwrite)")
+
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        if mode == 'x' and any(os.path.exists(os.path.join(path, name)) for name in ('meta.json', 'index.npy', 'frames.bin')):
+            raise FileExistsError(f"{path} already holds a trajectory, choose another directory (or mode='w' to overwrite it)")
+        self.N = int(N)
+        self.model = model
+        self.stride = int(stride)
+        self.keyframe_interval = int(keyframe_interval)
+        self.attrs = {} if attrs is None else dict(attrs)
+
+        self.file = open(os.path.join(path, 'frames.bin'), 'wb')
+        self.index = []
+        self.offset = 0
+        self.previous = None # packed previous frame
+        self.flush_frames = int(flush_frames)
+        self.flush_seconds = float(flush_seconds)
+        self.write_meta()
+        self.flush() # empty index, never an old one next to the new frames
+        if initial is not None:
+            self.record(0, initial)
+
+    def record(self, step, lattice):
+        'Store the lattice as the frame of step if step is on the stride; returns whether it was stored'
+        if step % self.stride != 0:
+            return False
+
+        packed = pack_frame(lattice, self.model)
+        kind = KEYFRAME
+        data = packed
+        if self.previous is not None and len(self.index) % self.keyframe_interval != 0:
+            changed = np.flatnonzero(self.previous ^ packed)
+            if 5*len(changed) < len(packed): # uint32 position + byte per change
+                kind = DELTA
+                data = np.concatenate([changed.astype('<u4').view(np.uint8), (self.previous ^ packed)[changed]])
+
+        self.file.write(data.tobytes())
+        self.index.append((self.offset, len(data), kind, step))
+        self.offset += len(data)
+        self.previous = packed
+        if (len(self.index) - self.flushed >= self.flush_frames or
+                time.monotonic() - self.flush_time >= self.flush_seconds):
+            self.flush()
+        return True
+
+    def callback(self, step, system):
+        '''
+        callback(step, system) for GoL_Lattice.run and SIRS_Lattice.run, called after the
+        generation (sweep) step, so the lattice is recorded as step + 1 (generations done)
+        '''
+        self.record(step + 1, system.lattice)
+
+    def write_meta(self):
+        meta = {"format": "trajectory", "version": 1, "model": self.model, "N": self.N, "stride": self.stride,
+                "keyframe_interval": self.keyframe_interval, "attrs": self.attrs}
+        tmp_path = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(tmp_path, os.path.join(self.path, 'meta.json'))
+
+    def flush(self):
+        'Make the frames recorded so far readable'
+        self.file.flush()
+        tmp_path = os.path.join(self.path, 'index.tmp.npy')
+        np.save(tmp_path, np.array(self.index, dtype=INDEX_DTYPE))
+        os.replace(tmp_path, os.path.join(self.path, 'index.npy'))
+        self.flushed = len(self.index)
+        self.flush_time = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+############### READING ################
+
+class TrajectoryReader():
+    '''
+    Random access and iteration over the frames of a trajectory directory
+    '''
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.model = self.meta["model"]
+        self.N = self.meta["N"]
+        self.attrs = self.meta["attrs"]
+
+        self.index = np.load(os.path.join(path, 'index.npy'))
+        self.steps = self.index['step']
+        self.keyframes = np.flatnonzero(self.index['kind'] == KEYFRAME)
+        size = int(self.index['offset'][-1] + self.index['length'][-1]) if len(self.index) else 0
+        self.data = np.memmap(os.path.join(path, 'frames.bin'), dtype=np.uint8, mode='r', shape=(size,)) if size else None
+
+    def __len__(self):
+        return len(self.index)
+
+    def record(self, t):
+        offset, length = int(self.index['offset'][t]), int(self.index['length'][t])
+        return self.data[offset:offset + length]
+
+    def apply(self, packed, t):
+        'Apply record t (keyframe or delta) to the packed frame t-1; returns packed frame t'
+        record = self.record(t)
+        if self.index['kind'][t] == KEYFRAME:
+            return np.array(record)
+        n_changed = len(record)//5
+        positions = record[:4*n_changed].view('<u4')
+        packed[positions] ^= record[4*n_changed:]
+        return packed
+
+    def get_packed(self, t):
+        'Packed frame t, from the nearest keyframe before it'
+        if not -len(self) <= t < len(self):
+            raise IndexError(f'Frame {t} out of range for {len(self)} frames')
+        t = t % len(self)
+        key = self.keyframes[np.searchsorted(self.keyframes, t, side='right') - 1]
+        packed = None
+        for k in range(key, t + 1):
+            packed = self.apply(packed, k)
+        return packed
+
+    def get_frame(self, t):
+        'Dense lattice of frame t (the t-th recorded frame, see steps for its step)'
+        return unpack_frame(self.get_packed(t), self.N, self.model)
+
+    def frame_at_step(self, step):
+        'Index of the last frame recorded at or before step'
+        return int(np.searchsorted(self.steps, step, side='right')) - 1
+
+    def iter_packed(self, start=0, stop=None, copy=True):
+        '''
+        Yield (t, packed frame) for the frames start..stop-1. With copy=False the frame is
+        the buffer the next delta is applied to: valid until the next iteration only.
+        '''
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return
+        packed = self.get_packed(start)
+        yield start, packed.copy() if copy else packed
+        for t in range(start + 1, stop):
+            packed = self.apply(packed, t)
+            yield t, packed.copy() if copy else packed
+
+    def iter_frames(self, start=0, stop=None, every=1):
+        'Yield (step, dense lattice) for the frames start..stop-1, keeping one in every'
+        for t, packed in self.iter_packed(start, stop, copy=False): # unpacking copies
+            if (t - start) % every == 0:
+                yield int(self.steps[t]), unpack_frame(packed, self.N, self.model)
+
+    def populations(self, start=0, stop=None):
+        '''
+        Live count per frame (gol, (n,)) or S, I, R, immune counts per frame (sirs, (n, 4)),
+        read from the packed frames without unpacking
+        '''
+        table = population_tables(self.model)
+        n_sites = self.N*self.N
+        counts = []
+        for _, packed in self.iter_packed(start, stop, copy=False):
+            count = table[packed].sum(axis=0)
+            if self.model == 'sirs':
+                count[1] -= 4*len(packed) - n_sites # padding codes are 0, i.e. counted as infected
+            counts.append(count)
+        return np.array(counts)
+
+if __name__ == '__main__':
+    import tempfile
+    import GameOfLife_functions as gol
+    import SIRS_functions as sirs
+    from GameOfLife_class import GoL_Lattice
+    from SIRS_class import SIRS_Lattice
+
+    with tempfile.TemporaryDirectory() as directory:
+        # GoL: every generation from the initial one, compared with a dense history
+        N = 50
+        system = GoL_Lattice(gol.state_random(N))
+        history = [system.lattice.copy()]
+        writer = TrajectoryWriter(os.path.join(directory, 'gol'), N, 'gol', keyframe_interval=16, initial=system.lattice)
+        system.run(300, callback=lambda step, system: (writer.callback(step, system), history.append(system.lattice.copy())))
+        writer.close()
+
+        trajectory = TrajectoryReader(os.path.join(directory, 'gol'))
+        assert len(trajectory) == 301 and np.array_equal(trajectory.steps, np.arange(301))
+        for t in [0, 15, 16, 17, 150, 300, -1]:
+            assert np.array_equal(trajectory.get_frame(t), history[t])
+        assert all(np.array_equal(lattice, history[step]) for step, lattice in trajectory.iter_frames(40, 90))
+        assert np.array_equal(trajectory.populations(), [np.sum(lattice) for lattice in history])
+
+        # packed frames kept from an iteration are independent copies
+        kept = list(trajectory.iter_packed(0, 40))
+        assert all(np.array_equal(packed, trajectory.get_packed(t)) for t, packed in kept)
+        size = os.path.getsize(os.path.join(directory, 'gol', 'frames.bin'))
+        print(f'GoL: {len(trajectory)} frames in {size} bytes ({len(trajectory)*N*N/size:.0f}x smaller than uint8 frames)')
+
+        # an existing trajectory is only overwritten when asked for
+        try:
+            TrajectoryWriter(os.path.join(directory, 'gol'), N, 'gol')
+            raise AssertionError('existing trajectory overwritten')
+        except FileExistsError:
+            pass
+        TrajectoryWriter(os.path.join(directory, 'gol'), N, 'gol', mode='w').close()
+        assert len(TrajectoryReader(os.path.join(directory, 'gol'))) == 0
+
+        # SIRS with immune sites, every 5th sweep
+        lattice = sirs.random_init_immune_generator(sirs.random_lattice(N), 0.1)
+        system = SIRS_Lattice(lattice)
+        history = {0: system.lattice.copy()}
+        writer = TrajectoryWriter(os.path.join(directory, 'sirs'), N, 'sirs', stride=5, flush_frames=16, initial=system.lattice)
+        system.run(500, 0.8, 0.1, 0.01, callback=lambda step, system: (writer.callback(step, system), history.update({step + 1: system.lattice.copy()})))
+        assert len(TrajectoryReader(os.path.join(directory, 'sirs'))) == 96 # readable up to the last periodic flush
+        writer.close()
+
+        trajectory = TrajectoryReader(os.path.join(directory, 'sirs'))
+        assert len(trajectory) == 101 and trajectory.steps[0] == 0 and trajectory.steps[-1] == 500
+        for step, lattice in trajectory.iter_frames():
+            assert np.array_equal(lattice, history[step])
+        assert np.array_equal(trajectory.get_frame(trajectory.frame_at_step(252)), history[250])
+        S, I, R, immune = trajectory.populations().T
+        assert np.array_equal(I, [np.sum(history[step] == -1) for step in trajectory.steps])
+        assert np.all(immune == np.sum(lattice == 2))
+        size = os.path.getsize(os.path.join(directory, 'sirs', 'frames.bin'))
+        print(f'SIRS: {len(trajectory)} frames in {size} bytes ({len(trajectory)*N*N/size:.1f}x smaller than int8 frames)')
+    print('trajectories identical to the simulated frames')